@@ -1,16 +1,28 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import Response
 from pydantic import BaseModel
 from typing import Optional, List
 import logging
 from datetime import datetime
+import asyncio
+import base64
+import binascii
+import concurrent.futures
+import json
+import uuid
 from video_processor import VideoProcessor
 from database.supabase_manager import SupabaseManager
+from database.video_cache import VideoCache
+from job_queue import JobQueue, QueueFullError
+from url_utils import media_key
+from config import (JOB_WORKERS, JOB_QUEUE_SIZE, JOB_STORE_PATH, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE,
+                    VIDEO_CACHE_SIZE, VIDEO_CACHE_PATH, VIDEO_CACHE_NEGATIVE_TTL)
 import os
 from dotenv import load_dotenv
 
@@ -67,7 +79,69 @@ app.add_middleware(
 
 # Initialize processors
 processor = VideoProcessor(output_dir='downloads')
-db = SupabaseManager()
+db = SupabaseManager(cache=VideoCache(VIDEO_CACHE_SIZE, VIDEO_CACHE_PATH or None,
+                                        negative_ttl=VIDEO_CACHE_NEGATIVE_TTL))
+
+# Event loop of the server, on which the database calls of the job workers run too, so that
+# they share the pooled connections of db
+server_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# Seconds a job worker waits for a database call on the server's event loop
+DB_CALL_TIMEOUT_SECONDS = 60
+
+def run_on_server_loop(coroutine):
+    """Run a coroutine on the server's event loop from a worker thread and return its result"""
+    if server_loop is None or server_loop.is_closed():
+        coroutine.close()
+        raise RuntimeError("The server's event loop is not running")
+    future = asyncio.run_coroutine_threadsafe(coroutine, server_loop)
+    try:
+        return future.result(DB_CALL_TIMEOUT_SECONDS)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise RuntimeError(f"Database call did not finish within {DB_CALL_TIMEOUT_SECONDS} seconds")
+
+def run_pipeline(url: str, progress):
+    """Download, transcribe and summarize a video, then store the results"""
+    # Another job for the same video may have finished since the request was accepted
+    existing_data = run_on_server_loop(db.get_video_data(url))
+    if existing_data:
+        return existing_data
+    
+    results = processor.process_video(url, progress=progress)
+    
+    if not results['transcript']:
+        raise Exception("Failed to process video. Please try again.")
+    
+    # Store in database
+    video_id = run_on_server_loop(db.store_video_data(
+        url=url,
+        source_type=results['source_type'],
+        transcript=results['transcript'],
+        summary=results['summary']
+    ))
+    
+    if not video_id:
+        logger.warning("Failed to store video data in database")
+    
+    return results
+
+SSE_KEEPALIVE_SECONDS = 15
+
+jobs = JobQueue(run_pipeline, num_workers=JOB_WORKERS, max_queue_size=JOB_QUEUE_SIZE,
+               path=JOB_STORE_PATH or None)
+
+@app.on_event("startup")
+async def start_jobs():
+    global server_loop
+    server_loop = asyncio.get_running_loop()
+    await db.connect()
+    jobs.start()
+
+@app.on_event("shutdown")
+async def stop_jobs():
+    jobs.shutdown(wait=False)
+    await db.close()
 
 class VideoRequest(BaseModel):
     url: str
@@ -77,12 +151,39 @@ class SearchRequest(BaseModel):
     source_type: Optional[str] = None
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+
+def encode_cursor(video):
+    """Opaque cursor pointing after the given search result"""
+    key = json.dumps([video['processed_at'], video['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(key.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(processed_at, id) encoded by encode_cursor
+    
+    Both end up in the PostgREST filter of the next page, so anything but an ISO timestamp and an
+    integer or UUID id is rejected rather than passed on.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(key, list) or len(key) != 2 or not isinstance(key[0], str):
+            raise ValueError("Cursor is not [processed_at, id]")
+        processed_at, video_id = key
+        datetime.fromisoformat(processed_at)
+        if isinstance(video_id, str):
+            uuid.UUID(video_id)
+        elif not isinstance(video_id, int) or isinstance(video_id, bool):
+            raise ValueError("Cursor id is neither an integer nor a UUID")
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return processed_at, video_id
 
 @app.get("/healthz")
 async def health_check():
     return {"status": "healthy"}
 
-@app.post("/api/process")
+@app.post("/api/process", status_code=202)
 async def process_video(request: VideoRequest):
     try:
         logger.info(f"Processing video from URL: {request.url}")
@@ -91,30 +192,24 @@ async def process_video(request: VideoRequest):
         existing_data = await db.get_video_data(request.url)
         if existing_data:
             logger.info(f"Retrieved video data from database for URL: {request.url}")
-            return existing_data
-        
-        # Process video
-        results = processor.process_video(request.url)
+            return JSONResponse({
+                'job_id': None,
+                'url': request.url,
+                'status': 'completed',
+                'result': existing_data
+            })
         
-        if not results['transcript']:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to process video. Please try again."
-            )
+        # Hand the video over to the worker pool, joining any job already running for it
+        job = await run_in_threadpool(jobs.submit, request.url, key="{}:{}".format(*media_key(request.url)))
+        return job.to_dict()
         
-        # Store in database
-        video_id = await db.store_video_data(
-            url=request.url,
-            source_type=results['source_type'],
-            transcript=results['transcript'],
-            summary=results['summary']
+    except QueueFullError as e:
+        logger.warning(str(e))
+        raise HTTPException(
+            status_code=429,
+            detail="Too many videos are being processed. Please try again later.",
+            headers={"Retry-After": "30"}
         )
-        
-        if not video_id:
-            logger.warning("Failed to store video data in database")
-        
-        return results
-        
     except Exception as e:
         logger.error(f"Error processing video: {str(e)}")
         raise HTTPException(
@@ -122,22 +217,114 @@ async def process_video(request: VideoRequest):
             detail=str(e)
         )
 
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await run_in_threadpool(jobs.get, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail="Job not found"
+        )
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Server-sent events with the progress of a job, ending with its result"""
+    job = await run_in_threadpool(jobs.get, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=404,
+            detail="Job not found"
+        )
+    
+    # EventSource sends the id of the last event it saw when it reconnects
+    last_event_id = request.headers.get("last-event-id")
+    since = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+    
+    async def event_stream():
+        nonlocal since
+        while True:
+            events = await run_in_threadpool(jobs.wait_for_events, job.id, since, SSE_KEEPALIVE_SECONDS)
+            if not events:
+                current = await run_in_threadpool(jobs.get, job.id)
+                if current is None:
+                    return
+                if current.done:
+                    # Finished while waiting, its final event was stored along with its status
+                    events = await run_in_threadpool(jobs.wait_for_events, job.id, since, 0)
+                    if not events:
+                        # The client has seen the final event already
+                        return
+                else:
+                    yield ": keep-alive\n\n"
+                    continue
+            for event in events:
+                yield f"id: {event['id']}\nevent: {event['stage']}\ndata: {json.dumps(event)}\n\n"
+            since = events[-1]['id'] + 1
+            if events[-1]['stage'] in ('completed', 'failed'):
+                return
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/stats")
+async def get_stats():
+    return {
+        "transcript_cache": processor.cache.stats() if processor.cache else None,
+        "supabase": db.stats(),
+        "video_cache": db.cache.stats() if db.cache else None
+    }
+
 @app.post("/api/search")
-async def search_videos(request: SearchRequest):
+async def search_videos(search: SearchRequest, request: Request):
+    """One page of matching videos, newest first, and the cursor of the next page
+    
+    With "Accept: application/x-ndjson", all matching videos from the cursor on are streamed instead,
+    one JSON object per line.
+    """
+    filters = {
+        'keyword': search.keyword,
+        'source_type': search.source_type,
+        'start_date': search.start_date,
+        'end_date': search.end_date
+    }
+    after = decode_cursor(search.cursor) if search.cursor else None
+    
+    if 'application/x-ndjson' in request.headers.get('accept', ''):
+        async def export():
+            nonlocal after
+            while True:
+                try:
+                    videos = await db.search_videos(**filters, limit=SEARCH_MAX_PAGE_SIZE, after=after)
+                except Exception as e:
+                    # The status line has been sent already, so the error ends the stream instead
+                    logger.error(f"Error exporting videos: {str(e)}")
+                    yield json.dumps({"error": str(e)}) + '\n'
+                    return
+                for video in videos:
+                    yield json.dumps(video) + '\n'
+                if len(videos) < SEARCH_MAX_PAGE_SIZE:
+                    return
+                after = (videos[-1]['processed_at'], videos[-1]['id'])
+        
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+    
+    limit = max(1, min(search.limit or SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE))
     try:
-        results = await db.search_videos(
-            keyword=request.keyword,
-            source_type=request.source_type,
-            start_date=request.start_date,
-            end_date=request.end_date
-        )
-        return {"videos": results}
+        # One extra row tells whether there is a next page
+        videos = await db.search_videos(**filters, limit=limit + 1, after=after)
     except Exception as e:
         logger.error(f"Error searching videos: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
+    
+    next_cursor = encode_cursor(videos[limit - 1]) if len(videos) > limit else None
+    return {"videos": videos[:limit], "next_cursor": next_cursor}
 
 @app.get("/api/video/{video_url:path}")
 async def get_video(video_url: str):
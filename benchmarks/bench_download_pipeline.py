@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Benchmark instaloader's post download pipeline offline, from recorded HTTP traffic.
+
+Usage: python benchmarks/bench_download_pipeline.py record PROFILE --cassette DIR [--count 50]
+       python benchmarks/bench_download_pipeline.py replay PROFILE --cassette DIR [--count 50]
+              [--concurrency 1 4 8] [--latency 0.05] [--bandwidth 5e6] [--too-many-requests-rate 0.01]
+
+record downloads the newest posts of a public profile once, with network access, and stores
+every response (JSON and media) in the cassette directory. replay runs the same download
+against the cassette with no network access, for each --concurrency value, and reports posts
+per second, requests, simulated 429 responses and the time the RateController would have
+slept. Latency, bandwidth and 429s are simulated by instaloader.cassette.ReplayAdapter; the
+RateController only accounts its sleeps, so the results measure the pipeline itself.
+
+Replay with the same --count that was recorded, otherwise the missing requests fail.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instaloader import Instaloader, Profile, RateController
+from instaloader.cassette import RecordingAdapter, ReplayAdapter
+
+
+class AccountingRateController(RateController):
+    """RateController that adds up its waits instead of sleeping"""
+
+    def __init__(self, context):
+        super().__init__(context)
+        self.slept = 0.0
+
+    def sleep(self, secs):
+        self.slept += secs
+
+
+def download(loader, profile_name, count):
+    profile = Profile.from_username(loader.context, profile_name)
+    loader.posts_download_loop(profile.get_posts(), profile.username, max_count=count)
+
+
+def record(args):
+    with tempfile.TemporaryDirectory() as target:
+        loader = Instaloader(quiet=True, dirname_pattern=target, transport=RecordingAdapter(args.cassette))
+        download(loader, args.profile, args.count)
+        loader.close()
+    print(f"Recorded {len(os.listdir(args.cassette)) // 2} responses to {args.cassette}")
+
+
+def replay(args):
+    print(f"{'concurrency':>12}{'posts/s':>10}{'wall (s)':>10}{'requests':>10}{'429s':>6}{'missing':>9}"
+          f"{'rate wait (s)':>15}")
+    for concurrency in args.concurrency:
+        transport = ReplayAdapter(args.cassette, latency=args.latency, bandwidth=args.bandwidth,
+                                  too_many_requests_rate=args.too_many_requests_rate)
+        target = tempfile.mkdtemp()
+        try:
+            loader = Instaloader(sleep=False, quiet=True, dirname_pattern=target, transport=transport,
+                                 max_concurrent_downloads=concurrency, rate_controller=AccountingRateController)
+            start = time.perf_counter()
+            download(loader, args.profile, args.count)
+            seconds = time.perf_counter() - start
+            # pylint:disable=protected-access
+            slept = loader.context._rate_controller.slept
+            loader.context.error_log = []
+            loader.close()
+        finally:
+            shutil.rmtree(target)
+        stats = transport.stats
+        print(f"{concurrency:>12}{args.count / seconds:>10.1f}{seconds:>10.2f}{stats['requests']:>10}"
+              f"{stats['injected_429']:>6}{stats['missing']:>9}{slept:>15.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('profile', help="Public profile whose posts are downloaded")
+    parser.add_argument('--cassette', required=True, help="Directory of the recorded responses")
+    parser.add_argument('--count', type=int, default=50, help="Number of posts")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8],
+                        help="Values of max_concurrent_downloads to compare")
+    parser.add_argument('--latency', type=float, default=0.05, help="Simulated seconds per request")
+    parser.add_argument('--bandwidth', type=float, default=None, help="Simulated bytes per second per request")
+    parser.add_argument('--too-many-requests-rate', type=float, default=0.0,
+                        help="Probability of a simulated 429 response per Instagram request")
+    args = parser.parse_args()
+    if args.mode == 'record':
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Benchmark instaloader's RateController bookkeeping on simulated hours of queries.
+
+Usage: python benchmarks/bench_rate_controller.py [--hours 1 4 12] [--types 20] [--rate 2.0]
+
+Replays a seeded stream of queries spread over --types GraphQL query types plus 'iphone' and
+'other', on a virtual clock advanced by the simulated wait times, so no time is actually slept.
+Reports the cost per RateController.wait_before_query call and the total simulated wait. With
+amortized constant-time bookkeeping, the cost per query stays flat as the simulated duration
+grows.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instaloader.instaloadercontext import InstaloaderContext, RateController
+
+
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class SimulatedRateController(RateController):
+    """RateController whose sleep() advances the virtual clock instead of waiting"""
+
+    def __init__(self, context, clock):
+        super().__init__(context)
+        self.clock = clock
+        self.slept = 0.0
+
+    def sleep(self, secs):
+        self.clock.now += secs
+        self.slept += secs
+
+
+def simulate(hours, num_types, rate, seed=0):
+    """Replay queries for the given number of simulated hours, return (queries, seconds, slept)"""
+    rng = random.Random(seed)
+    query_types = [f"graphql_{i}" for i in range(num_types)] + ['iphone', 'other']
+    weights = [1.0 / (rank + 1) for rank in range(len(query_types))]
+    clock = VirtualClock()
+    controller = SimulatedRateController(InstaloaderContext(quiet=True), clock)
+    end = hours * 3600
+    queries = 0
+    with mock.patch('instaloader.instaloadercontext.time.monotonic', clock.monotonic):
+        start = time.perf_counter()
+        while clock.now < end:
+            clock.now += rng.expovariate(rate)
+            controller.wait_before_query(rng.choices(query_types, weights)[0])
+            queries += 1
+        seconds = time.perf_counter() - start
+    return queries, seconds, controller.slept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hours', type=float, nargs='+', default=[1, 4, 12],
+                        help="Simulated durations in hours")
+    parser.add_argument('--types', type=int, default=20, help="Number of GraphQL query types")
+    parser.add_argument('--rate', type=float, default=2.0, help="Queries per simulated second")
+    args = parser.parse_args()
+
+    print(f"{'hours':>6}{'queries':>10}{'total (ms)':>12}{'per query (us)':>16}{'simulated wait (s)':>20}")
+    for hours in args.hours:
+        queries, seconds, slept = simulate(hours, args.types, args.rate)
+        print(f"{hours:>6g}{queries:>10}{seconds * 1000:>12.1f}{seconds / queries * 1e6:>16.2f}{slept:>20.0f}")
+
+
+if __name__ == '__main__':
+    main()
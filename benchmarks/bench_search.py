@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Compare DatabaseManager.search_videos with the FTS5 index and with the ILIKE scan.
+
+Usage: python benchmarks/bench_search.py [--videos 100000] [--queries 20] [--limit 20]
+       [--unpaginated] [--database FILE]
+
+Fills an SQLite database with synthetic transcripts and summaries (Zipf-distributed vocabulary,
+fixed seed), then runs the same keyword searches through the full-text index and through the
+Transcript.content ILIKE scan that is used without it. Reports the median and worst time per
+search and the number of results. With --unpaginated, both also run without a limit, which is how
+/api/search called the ILIKE scan before. The database is kept with --database, so later runs skip
+filling it.
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+
+from database import DatabaseManager, Video, Transcript, Summary
+from database.models import Base
+
+
+def vocabulary(rng, size=20000):
+    return [''.join(rng.choice('etaoinshrdlucmfwypvbgk') for _ in range(rng.randint(3, 10)))
+            for _ in range(size)]
+
+
+def fill(db_url, count, seed=0, batch=5000):
+    """Insert count videos with a transcript of 200 to 1200 words and a one-sentence summary each
+
+    The rows go in before DatabaseManager creates the search index, which then indexes them all at once.
+    """
+    rng = random.Random(seed)
+    words = vocabulary(rng)
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(words))))
+    start = datetime(2024, 1, 1)
+    engine = create_engine(db_url)
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for first in range(1, count + 1, batch):
+            ids = range(first, min(first + batch, count + 1))
+            conn.execute(Video.__table__.insert(), [
+                {'id': i, 'url': f'https://youtu.be/{i:011d}', 'source_type': 'youtube', 'media_id': f'{i:011d}',
+                 'processed_at': start + timedelta(minutes=i)} for i in ids])
+            conn.execute(Transcript.__table__.insert(), [
+                {'video_id': i, 'content': ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(200, 1200))) + '.'}
+                for i in ids])
+            conn.execute(Summary.__table__.insert(), [
+                {'video_id': i, 'brief': ' '.join(rng.choices(words, cum_weights=cum_weights, k=20)) + '.', 'key_points': []}
+                for i in ids])
+    engine.dispose()
+    return words
+
+
+def keywords(words, count, seed=1):
+    """Words of frequent, medium and rare rank"""
+    rng = random.Random(seed)
+    ranks = [rng.choice(pool) for pool in (range(10, 100), range(100, 2000), range(2000, len(words)))
+             for _ in range((count + 2) // 3)]
+    return [words[rank] for rank in ranks[:count]]
+
+
+def measure(db, terms, limit):
+    seconds = []
+    results = 0
+    for term in terms:
+        start = time.perf_counter()
+        results += len(db.search_videos(keyword=term, limit=limit))
+        seconds.append(time.perf_counter() - start)
+    return seconds, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--videos', type=int, default=100000, help="Number of synthetic transcripts")
+    parser.add_argument('--queries', type=int, default=20, help="Number of keyword searches")
+    parser.add_argument('--limit', type=int, default=20, help="Results per search")
+    parser.add_argument('--unpaginated', action='store_true', help="Also search without a limit")
+    parser.add_argument('--database', help="SQLite file to fill or reuse, default is a temporary file")
+    args = parser.parse_args()
+
+    path = args.database or os.path.join(tempfile.mkdtemp(), 'search.db')
+    db_url = f"sqlite:///{path}"
+    if not os.path.exists(path):
+        start = time.perf_counter()
+        words = fill(db_url, args.videos)
+        filled = time.perf_counter()
+        db = DatabaseManager(db_url)
+        print(f"Filled {args.videos} videos in {filled - start:.1f}s, indexed them in "
+              f"{time.perf_counter() - filled:.1f}s")
+    else:
+        words = vocabulary(random.Random(0))
+        db = DatabaseManager(db_url)
+    terms = keywords(words, args.queries)
+
+    print(f"{'backend':<8}{'limit':>7}{'median (ms)':>13}{'max (ms)':>11}{'results':>9}")
+    for limit in [args.limit, None] if args.unpaginated else [args.limit]:
+        for backend, indexed in (('fts5', True), ('ilike', False)):
+            db.has_search_index = indexed
+            seconds, results = measure(db, terms, limit)
+            print(f"{backend:<8}{limit or '-':>7}{statistics.median(seconds) * 1000:>13.1f}"
+                  f"{max(seconds) * 1000:>11.1f}{results:>9}")
+    if not args.database:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
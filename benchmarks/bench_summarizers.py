@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Benchmark the transcript summarizers on synthetic transcripts.
+
+Usage: python benchmarks/bench_summarizers.py [--sizes 10 100 1000 10000]
+       [--save-baseline | --check [--threshold 0.25]] [--baseline FILE]
+
+Reports wall time, peak Python memory and sentences per second of
+VideoProcessor.summarize_text (TextRankSummarizer) and
+instaloader.text_processor.TextProcessor.summarize_text. It runs offline: transcripts are
+generated from a fixed seed and the TextRank summarizer gets a regex sentence splitter and a
+built-in stop word list instead of NLTK data.
+
+Save a baseline on the reference revision with --save-baseline, then run --check on a change:
+it exits with status 1 if any summarizer got slower than the baseline by more than the
+threshold (default 25%). Baselines are only comparable on the same machine.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instaloader.text_processor import TextProcessor
+from summarizer import TextRankSummarizer
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'summarizer_baseline.json')
+
+STOP_WORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has', 'have',
+              'he', 'i', 'in', 'is', 'it', 'its', 'of', 'on', 'or', 'our', 'she', 'so', 'that',
+              'the', 'their', 'they', 'this', 'to', 'was', 'we', 'were', 'what', 'with', 'you'}
+
+
+def split_sentences(text):
+    return [s for s in re.split(r'(?<=[.!?])\s+', text) if s]
+
+
+def synthetic_transcript(num_sentences, seed=0):
+    """Transcript-like text with a Zipf-distributed vocabulary and 6 to 24 words per sentence"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('etaoinshrdlucmfwypvbgk') for _ in range(rng.randint(3, 10)))
+                  for _ in range(3000)] + sorted(STOP_WORDS)
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    sentences = []
+    for _ in range(num_sentences):
+        words = rng.choices(vocabulary, weights, k=rng.randint(6, 24))
+        sentences.append(' '.join(words).capitalize() + rng.choice('..?!'))
+    return ' '.join(sentences)
+
+
+SUMMARIZERS = {
+    'textrank': lambda: TextRankSummarizer(stop_words=STOP_WORDS,
+                                           sentence_splitter=split_sentences).summarize,
+    'text_processor': lambda: TextProcessor().summarize_text,
+}
+
+
+def measure(summarize, text, repeat):
+    """Best wall time over repeat runs, and peak traced memory of one more run"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        summarize(text)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    summarize(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes, repeat):
+    results = {}
+    print(f"{'summarizer':<16}{'sentences':>10}{'wall (ms)':>12}{'peak (KiB)':>12}{'sentences/s':>14}")
+    for name, factory in SUMMARIZERS.items():
+        summarize = factory()
+        for size in sizes:
+            text = synthetic_transcript(size)
+            seconds, peak = measure(summarize, text, repeat)
+            results[f"{name}/{size}"] = {'seconds': seconds, 'peak_bytes': peak}
+            print(f"{name:<16}{size:>10}{seconds * 1000:>12.2f}{peak / 1024:>12.0f}{size / seconds:>14.0f}")
+    return results
+
+
+def check(results, baseline, threshold):
+    regressions = []
+    for key, result in results.items():
+        reference = baseline.get(key)
+        if reference and result['seconds'] > reference['seconds'] * (1 + threshold):
+            regressions.append(f"{key}: {result['seconds'] * 1000:.2f} ms, baseline "
+                               f"{reference['seconds'] * 1000:.2f} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="Transcript lengths in sentences")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per measurement, best is kept")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results file")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--save-baseline', action='store_true', help="Store the results as the baseline")
+    mode.add_argument('--check', action='store_true', help="Fail if slower than the baseline")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="Allowed slowdown relative to the baseline for --check")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.check:
+        if not os.path.exists(args.baseline):
+            sys.exit(f"No baseline at {args.baseline}, create one with --save-baseline")
+        with open(args.baseline) as f:
+            regressions = check(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"Slower than baseline by more than {args.threshold:.0%}:")
+            print('\n'.join(f"  {regression}" for regression in regressions))
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == '__main__':
+    main()
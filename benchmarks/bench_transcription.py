@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Compare wall-clock time of single-pass and parallel chunked Whisper transcription.
+
+Usage: python benchmarks/bench_transcription.py AUDIO_FILE [--model base] [--workers 4]
+       [--chunk-seconds 30]
+
+Both runs use the same total number of CPU threads: the single pass runs one inference
+process with all of them, the chunked run splits them over --workers processes.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from transcription_service import TranscriptionExecutor
+from video_processor import SAMPLE_RATE, load_audio, split_on_silence
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    text = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:8.2f}s  {len(text.split()):6d} words")
+    return elapsed
+
+
+def single_pass(path, model, threads):
+    executor = TranscriptionExecutor(model, num_workers=1, threads_per_worker=threads)
+    executor.transcribe(load_audio(path)[:SAMPLE_RATE])  # load the model outside the timing
+    try:
+        return timed('single', lambda: executor.transcribe(path)['text'])
+    finally:
+        executor.shutdown()
+
+
+def chunked(path, model, threads, workers, chunk_seconds):
+    executor = TranscriptionExecutor(model, num_workers=workers,
+                                     threads_per_worker=max(1, threads // workers))
+    warmup = load_audio(path)[:SAMPLE_RATE]
+    list(ThreadPoolExecutor(workers).map(executor.transcribe, [warmup] * workers))
+
+    def run():
+        audio = load_audio(path)
+        chunks = split_on_silence(audio, int(chunk_seconds * SAMPLE_RATE))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(lambda chunk: executor.transcribe(audio[chunk[0]:chunk[1]]), chunks)
+            return " ".join(result['text'].strip() for result in results)
+
+    try:
+        return timed('chunked', run)
+    finally:
+        executor.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('audio', help="Audio or video file to transcribe")
+    parser.add_argument('--model', default='base', help="Whisper model name")
+    parser.add_argument('--workers', type=int, default=4, help="Inference processes for the chunked run")
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help="Total CPU threads")
+    parser.add_argument('--chunk-seconds', type=float, default=30, help="Maximum chunk length")
+    args = parser.parse_args()
+
+    duration = len(load_audio(args.audio)) / SAMPLE_RATE
+    print(f"{args.audio}: {duration:.0f}s of audio, model {args.model}, {args.threads} threads")
+    single = single_pass(args.audio, args.model, args.threads)
+    parallel = chunked(args.audio, args.model, args.threads, args.workers, args.chunk_seconds)
+    print(f"speedup    {single / parallel:8.2f}x  ({args.workers} workers, {args.chunk_seconds:.0f}s chunks)")
+
+
+if __name__ == '__main__':
+    main()
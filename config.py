@@ -13,6 +13,47 @@ DOWNLOAD_DIR = 'downloads'
 TEMP_DIR = 'temp'
 COOKIE_FILE = 'session-cookies.txt'
 
+# SQLite ledger shared by all workers on the host to stay within Instagram's rate limits, empty to disable
+INSTAGRAM_RATE_LEDGER = os.getenv('INSTAGRAM_RATE_LEDGER', 'cache/instagram-ratelimit.sqlite3')
+# Instagram responses reused for repeated lookups of the same post, empty to disable
+INSTAGRAM_RESPONSE_CACHE = os.getenv('INSTAGRAM_RESPONSE_CACHE', 'cache/instagram-responses.sqlite3')
+INSTAGRAM_RESPONSE_CACHE_TTL = float(os.getenv('INSTAGRAM_RESPONSE_CACHE_TTL', str(24 * 60 * 60)))
+
+# Transcripts cached by audio fingerprint, set the directory to empty to disable
+TRANSCRIPT_CACHE_DIR = os.getenv('TRANSCRIPT_CACHE_DIR', 'cache/transcripts')
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv('TRANSCRIPT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Results of video lookups kept in process, and in an SQLite file shared by the workers (empty to disable)
+VIDEO_CACHE_SIZE = int(os.getenv('VIDEO_CACHE_SIZE', '1024'))
+VIDEO_CACHE_PATH = os.getenv('VIDEO_CACHE_PATH', 'cache/videos.sqlite3')
+# Seconds a lookup of a video that is not stored yet is remembered
+VIDEO_CACHE_NEGATIVE_TTL = float(os.getenv('VIDEO_CACHE_NEGATIVE_TTL', '30'))
+
+# /api/search page size when the request does not set a limit, and the largest one it may set
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '50'))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', '200'))
+
+# Background job settings
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+JOB_QUEUE_SIZE = int(os.getenv('JOB_QUEUE_SIZE', '16'))
+# SQLite file through which every worker sees all jobs and their progress, empty to keep them in process
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'cache/jobs.sqlite3')
+
+# Transcription settings
+# Download only the audio track where the source allows it
+AUDIO_ONLY = os.getenv('AUDIO_ONLY', 'true').lower() in ('1', 'true', 'yes')
+WHISPER_MODEL = os.getenv('WHISPER_MODEL', 'base')
+TRANSCRIBE_WORKERS = int(os.getenv('TRANSCRIBE_WORKERS', '1'))
+TRANSCRIBE_THREADS = int(os.getenv('TRANSCRIBE_THREADS', '0'))  # 0 splits the CPU cores evenly
+# Audio is cut at silences into chunks of at most this many seconds, 0 for a single pass
+TRANSCRIBE_CHUNK_SECONDS = float(os.getenv('TRANSCRIBE_CHUNK_SECONDS', '30'))
+# Chunks of one video transcribed at the same time
+TRANSCRIBE_PARALLEL_CHUNKS = int(os.getenv('TRANSCRIBE_PARALLEL_CHUNKS', str(TRANSCRIBE_WORKERS)))
+# host:port or Unix socket path of a shared transcription service, empty for a local pool
+TRANSCRIBE_SERVICE_ADDRESS = os.getenv('TRANSCRIBE_SERVICE_ADDRESS', '')
+# Secret the service and its clients authenticate each other with, required with a service address
+TRANSCRIBE_SERVICE_AUTHKEY = os.getenv('TRANSCRIBE_SERVICE_AUTHKEY', '')
+
 # Create necessary directories
 for directory in [DOWNLOAD_DIR, TEMP_DIR]:
     os.makedirs(directory, exist_ok=True)
@@ -1,4 +1,5 @@
 from .db_manager import DatabaseManager
-from .models import Video, Transcript, Summary, VideoMeta
+from .models import Video, VideoAlias, Transcript, Summary, VideoMeta
+from .video_cache import VideoCache
 
-__all__ = ['DatabaseManager', 'Video', 'Transcript', 'Summary', 'VideoMeta']
+__all__ = ['DatabaseManager', 'Video', 'VideoAlias', 'Transcript', 'Summary', 'VideoMeta', 'VideoCache']
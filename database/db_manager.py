@@ -1,12 +1,41 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import create_engine, func, text, tuple_, bindparam, DateTime, Float, Integer, String, Text
+from sqlalchemy.orm import sessionmaker, scoped_session, joinedload
+from sqlalchemy.exc import IntegrityError, OperationalError
 from contextlib import contextmanager
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple, Union
 from datetime import datetime
 
-from .models import Base, Video, Transcript, Summary, VideoMeta
+from .models import Base, Video, VideoAlias, Transcript, Summary, VideoMeta
+from url_utils import media_key
+
+# Full-text index over transcripts and summaries on SQLite, one row per video with rowid = videos.id.
+# The triggers rebuild a video's row whenever its transcript or summary changes.
+_SEARCH_INDEX_ROW = """
+    DELETE FROM video_search WHERE rowid = {video_id};
+    INSERT INTO video_search (rowid, transcript, summary)
+    SELECT v.id, t.content, s.brief || ' ' || COALESCE(s.key_points, '')
+    FROM videos v LEFT JOIN transcripts t ON t.video_id = v.id LEFT JOIN summaries s ON s.video_id = v.id
+    WHERE v.id = {video_id};
+"""
+
+_SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE video_search USING fts5(transcript, summary, tokenize = 'unicode61 remove_diacritics 2')",
+    *[f"CREATE TRIGGER IF NOT EXISTS {table}_search_{event} AFTER {event.upper()} ON {table} BEGIN"
+      f"{_SEARCH_INDEX_ROW.format(video_id=row + '.video_id')}END"
+      for table in ('transcripts', 'summaries')
+      for event, row in (('insert', 'new'), ('update', 'new'), ('delete', 'old'))],
+    """
+    INSERT INTO video_search (rowid, transcript, summary)
+    SELECT v.id, t.content, s.brief || ' ' || COALESCE(s.key_points, '')
+    FROM videos v LEFT JOIN transcripts t ON t.video_id = v.id LEFT JOIN summaries s ON s.video_id = v.id
+    WHERE t.id IS NOT NULL OR s.id IS NOT NULL
+    """,
+]
+
+def _fts_query(keyword: str) -> str:
+    """FTS5 query matching documents that contain words starting with each term of the keyword"""
+    return ' '.join('"' + term.replace('"', '""') + '"*' for term in keyword.split())
 
 class DatabaseManager:
     def __init__(self, db_url: str = "sqlite:///videos.db"):
@@ -15,6 +44,35 @@ class DatabaseManager:
         
         # Create all tables
         Base.metadata.create_all(self.engine)
+        
+        self.has_search_index = self.engine.dialect.name == 'sqlite'
+        if self.has_search_index:
+            self._create_search_index()
+    
+    def _create_search_index(self):
+        """Create the FTS5 index and its triggers, and index the rows stored so far
+        
+        Without FTS5 in the SQLite build, search_videos falls back to the ILIKE scan.
+        """
+        try:
+            with self.engine.begin() as conn:
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'video_search'"
+                )).first()
+                if exists:
+                    return
+                for statement in _SEARCH_INDEX_DDL:
+                    conn.exec_driver_sql(statement)
+        except OperationalError as e:
+            logging.warning(f"Full-text search index unavailable, searching with ILIKE: {str(e)}")
+            self.has_search_index = False
+    
+    def rebuild_search_index(self):
+        """Re-index all transcripts and summaries, e.g. after they were changed with the triggers missing"""
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS video_search")
+            for statement in _SEARCH_INDEX_DDL:
+                conn.exec_driver_sql(statement)
     
     @contextmanager
     def session_scope(self):
@@ -29,6 +87,24 @@ class DatabaseManager:
         finally:
             session.close()
     
+    def _find_video(self, session, url: str, *options) -> Optional[Video]:
+        """Look a video up by any URL it is known under, using indexed lookups only
+        
+        options are loader options for the returned video, e.g. joinedload(Video.transcript).
+        """
+        query = session.query(Video).options(*options)
+        video = query.join(VideoAlias).filter(VideoAlias.url == url).first()
+        if video:
+            return video
+        
+        source_type, media_id = media_key(url)
+        video = query.filter_by(source_type=source_type, media_id=media_id).first()
+        if video:
+            return video
+        
+        # Videos stored before media ids were recorded
+        return query.filter_by(url=url).first()
+    
     def store_video_data(self, 
                         url: str,
                         source_type: str,
@@ -38,20 +114,24 @@ class DatabaseManager:
         """Store video data in the database"""
         try:
             with self.session_scope() as session:
-                # Check if video already exists
-                existing_video = session.query(Video).filter_by(url=url).first()
+                # Check if video already exists, possibly under another URL
+                existing_video = self._find_video(session, url)
                 if existing_video:
                     logging.info(f"Video {url} already exists in database")
+                    if not session.get(VideoAlias, url):
+                        session.add(VideoAlias(url=url, video_id=existing_video.id))
                     return existing_video.id
                 
                 # Create new video entry
                 video = Video(
                     url=url,
                     source_type=source_type,
+                    media_id=media_key(url).media_id,
                     processed_at=datetime.utcnow()
                 )
                 session.add(video)
                 session.flush()  # Get the video ID
+                session.add(VideoAlias(url=url, video_id=video.id))
                 
                 # Add transcript
                 if transcript:
@@ -95,13 +175,17 @@ class DatabaseManager:
             return None
     
     def get_video_data(self, url: str) -> Optional[Dict[str, Any]]:
-        """Retrieve video data from database"""
+        """Retrieve video data from database, loading the video with its transcript, summary and metadata in one query"""
         try:
             with self.session_scope() as session:
-                video = session.query(Video).filter_by(url=url).first()
+                video = self._find_video(session, url,
+                                         joinedload(Video.transcript),
+                                         joinedload(Video.summary),
+                                         joinedload(Video.video_meta))
                 if not video:
                     return None
                 
+                meta = video.video_meta
                 return {
                     'id': video.id,
                     'url': video.url,
@@ -113,15 +197,15 @@ class DatabaseManager:
                         'key_points': video.summary.key_points
                     } if video.summary else None,
                     'metadata': {
-                        'author': video.metadata.author,
-                        'publish_date': video.metadata.publish_date.isoformat() if video.metadata.publish_date else None,
-                        'likes': video.metadata.likes,
-                        'views': video.metadata.views,
-                        'comments': video.metadata.comments,
-                        'hashtags': video.metadata.hashtags,
-                        'mentions': video.metadata.mentions,
-                        'additional_data': video.metadata.additional_data
-                    } if video.metadata else None
+                        'author': meta.author,
+                        'publish_date': meta.publish_date.isoformat() if meta.publish_date else None,
+                        'likes': meta.likes,
+                        'views': meta.views,
+                        'comments': meta.comments,
+                        'hashtags': meta.hashtags,
+                        'mentions': meta.mentions,
+                        'additional_data': meta.additional_data
+                    } if meta else None
                 }
                 
         except Exception as e:
@@ -132,16 +216,42 @@ class DatabaseManager:
                      keyword: Optional[str] = None, 
                      source_type: Optional[str] = None,
                      start_date: Optional[datetime] = None,
-                     end_date: Optional[datetime] = None) -> list:
-        """Search videos in the database"""
+                     end_date: Optional[datetime] = None,
+                     limit: Optional[int] = None,
+                     offset: int = 0,
+                     after: Optional[Tuple[Union[datetime, str], int]] = None,
+                     newest_first: bool = False) -> list:
+        """Search videos in the database, newest first
+        
+        On SQLite, keyword searches go through the full-text index: every word of the keyword has to
+        start a word of the transcript or summary, results are ordered by relevance unless newest_first
+        is set and carry a 'snippet' of the transcript with the matches wrapped in <mark> tags.
+        
+        To page through the results, pass the (processed_at, id) of the last result of the previous
+        page as after. This implies newest_first.
+        """
+        if after is not None:
+            processed_at, video_id = after
+            if isinstance(processed_at, str):
+                processed_at = datetime.fromisoformat(processed_at)
+            after = (processed_at, video_id)
         try:
+            if keyword and keyword.split() and self.has_search_index:
+                return self._search_index(keyword, source_type, start_date, end_date, limit, offset, after,
+                                          newest_first or after is not None)
+            
             with self.session_scope() as session:
-                query = session.query(Video)
+                # Only the first 200 characters of each transcript leave the database
+                preview = func.substr(Transcript.content, 1, 200)
+                query = session.query(Video.id, Video.url, Video.source_type, Video.processed_at,
+                                      preview.label('preview'))
                 
                 if keyword:
                     query = query.join(Transcript).filter(
                         Transcript.content.ilike(f'%{keyword}%')
                     )
+                else:
+                    query = query.outerjoin(Transcript)
                 
                 if source_type:
                     query = query.filter(Video.source_type == source_type)
@@ -152,16 +262,77 @@ class DatabaseManager:
                 if end_date:
                     query = query.filter(Video.processed_at <= end_date)
                 
-                videos = query.all()
+                if after is not None:
+                    query = query.filter(tuple_(Video.processed_at, Video.id) < after)
+                
+                query = query.order_by(Video.processed_at.desc(), Video.id.desc()).offset(offset)
+                if limit is not None:
+                    query = query.limit(limit)
                 
                 return [{
-                    'id': video.id,
-                    'url': video.url,
-                    'source_type': video.source_type,
-                    'processed_at': video.processed_at.isoformat(),
-                    'transcript_preview': video.transcript.content[:200] + '...' if video.transcript else None
-                } for video in videos]
+                    'id': row.id,
+                    'url': row.url,
+                    'source_type': row.source_type,
+                    'processed_at': row.processed_at.isoformat(),
+                    'transcript_preview': row.preview + '...' if row.preview is not None else None
+                } for row in query.all()]
                 
         except Exception as e:
             logging.error(f"Error searching videos: {str(e)}")
             return []
+    
+    def _search_index(self,
+                      keyword: str,
+                      source_type: Optional[str],
+                      start_date: Optional[datetime],
+                      end_date: Optional[datetime],
+                      limit: Optional[int],
+                      offset: int,
+                      after: Optional[Tuple[datetime, int]],
+                      newest_first: bool) -> List[Dict[str, Any]]:
+        """Ranked full-text search, in a single query"""
+        conditions = ["video_search MATCH :query"]
+        params: Dict[str, Any] = {'query': _fts_query(keyword), 'limit': -1 if limit is None else limit,
+                                  'offset': offset}
+        if source_type:
+            conditions.append("v.source_type = :source_type")
+            params['source_type'] = source_type
+        if start_date:
+            conditions.append("v.processed_at >= :start_date")
+            params['start_date'] = start_date
+        if end_date:
+            conditions.append("v.processed_at <= :end_date")
+            params['end_date'] = end_date
+        if after is not None:
+            conditions.append("(v.processed_at, v.id) < (:after_processed_at, :after_id)")
+            params['after_processed_at'], params['after_id'] = after
+        
+        # Matches in the transcript weigh more than in the summary
+        query = text(f"""
+            SELECT v.id, v.url, v.source_type, v.processed_at, substr(t.content, 1, 200) AS preview,
+                   snippet(video_search, 0, '<mark>', '</mark>', '...', 16) AS snippet,
+                   bm25(video_search, 1.0, 0.5) AS rank
+            FROM video_search
+            JOIN videos v ON v.id = video_search.rowid
+            LEFT JOIN transcripts t ON t.video_id = v.id
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {'v.processed_at DESC, v.id DESC' if newest_first else 'rank'}
+            LIMIT :limit OFFSET :offset
+        """).bindparams(
+            *[bindparam(name, type_=DateTime()) for name in ('start_date', 'end_date', 'after_processed_at')
+              if name in params]
+        ).columns(id=Integer, url=String, source_type=String, processed_at=DateTime,
+                  preview=Text, snippet=Text, rank=Float)
+        
+        with self.session_scope() as session:
+            rows = session.execute(query, params).all()
+        
+        return [{
+            'id': row.id,
+            'url': row.url,
+            'source_type': row.source_type,
+            'processed_at': row.processed_at.isoformat() if row.processed_at else None,
+            'transcript_preview': row.preview + '...' if row.preview is not None else None,
+            'snippet': row.snippet,
+            'rank': row.rank
+        } for row in rows]
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, JSON, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -7,10 +7,17 @@ Base = declarative_base()
 
 class Video(Base):
     __tablename__ = 'videos'
+    __table_args__ = (
+        UniqueConstraint('source_type', 'media_id', name='uq_videos_source_media'),
+        # Keyset pagination of search results, newest first
+        Index('idx_videos_processed_at_id', 'processed_at', 'id'),
+        Index('idx_videos_source_type_processed_at', 'source_type', 'processed_at'),
+    )
     
     id = Column(Integer, primary_key=True)
     url = Column(String(500), unique=True, nullable=False)
     source_type = Column(String(50), nullable=False)
+    media_id = Column(String(500))  # platform video id, see url_utils.media_key
     processed_at = Column(DateTime, default=datetime.utcnow)
     title = Column(String(500))
     duration = Column(Integer)  # in seconds
@@ -19,6 +26,17 @@ class Video(Base):
     transcript = relationship("Transcript", back_populates="video", uselist=False)
     summary = relationship("Summary", back_populates="video", uselist=False)
     video_meta = relationship("VideoMeta", back_populates="video", uselist=False)
+    aliases = relationship("VideoAlias", back_populates="video")
+
+class VideoAlias(Base):
+    """Every URL a video has been requested under"""
+    __tablename__ = 'video_aliases'
+    
+    url = Column(String(500), primary_key=True)
+    video_id = Column(Integer, ForeignKey('videos.id'), nullable=False, index=True)
+    
+    # Relationships
+    video = relationship("Video", back_populates="aliases")
 
 class Transcript(Base):
     __tablename__ = 'transcripts'
@@ -6,9 +6,20 @@ CREATE TABLE IF NOT EXISTS videos (
     id uuid DEFAULT uuid_generate_v4() PRIMARY KEY,
     url text UNIQUE NOT NULL,
     source_type text NOT NULL,
+    media_id text,
     processed_at timestamp with time zone DEFAULT timezone('utc'::text, now())
 );
 
+-- Platform video id (see url_utils.media_key), added after the initial schema
+ALTER TABLE videos ADD COLUMN IF NOT EXISTS media_id text;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_videos_source_media ON videos(source_type, media_id);
+
+-- Every URL a video has been requested under
+CREATE TABLE IF NOT EXISTS video_aliases (
+    url text PRIMARY KEY,
+    video_id uuid REFERENCES videos(id) ON DELETE CASCADE
+);
+
 -- Transcripts table
 CREATE TABLE IF NOT EXISTS transcripts (
     id uuid DEFAULT uuid_generate_v4() PRIMARY KEY,
@@ -51,5 +62,103 @@ CREATE INDEX IF NOT EXISTS transcripts_fts_idx ON transcripts USING gin(fts);
 CREATE INDEX IF NOT EXISTS idx_transcripts_video_id ON transcripts(video_id);
 CREATE INDEX IF NOT EXISTS idx_summaries_video_id ON summaries(video_id);
 CREATE INDEX IF NOT EXISTS idx_video_metadata_video_id ON video_metadata(video_id);
-CREATE INDEX IF NOT EXISTS idx_videos_processed_at ON videos(processed_at);
-CREATE INDEX IF NOT EXISTS idx_videos_source_type ON videos(source_type);
+CREATE INDEX IF NOT EXISTS idx_video_aliases_video_id ON video_aliases(video_id);
+
+-- Keyset pagination of search results on (processed_at, id), newest first,
+-- superseding the single-column indexes on processed_at and source_type
+CREATE INDEX IF NOT EXISTS idx_videos_processed_at_id ON videos(processed_at, id);
+CREATE INDEX IF NOT EXISTS idx_videos_source_type_processed_at ON videos(source_type, processed_at);
+DROP INDEX IF EXISTS idx_videos_processed_at;
+DROP INDEX IF EXISTS idx_videos_source_type;
+
+-- Store a video with its transcript, summary and metadata in one call and transaction,
+-- or only record the URL as an alias if the video is already stored under another URL.
+-- Called by SupabaseManager.store_video_data as POST /rest/v1/rpc/store_video.
+CREATE OR REPLACE FUNCTION store_video(
+    p_url text,
+    p_source_type text,
+    p_media_id text,
+    p_transcript text DEFAULT NULL,
+    p_summary jsonb DEFAULT NULL,
+    p_metadata jsonb DEFAULT NULL
+) RETURNS uuid
+LANGUAGE plpgsql AS $$
+DECLARE
+    v_id uuid;
+BEGIN
+    SELECT id INTO v_id FROM videos WHERE source_type = p_source_type AND media_id = p_media_id;
+    IF v_id IS NULL THEN
+        -- Videos stored before media ids were recorded
+        SELECT id INTO v_id FROM videos WHERE url = p_url;
+    END IF;
+
+    IF v_id IS NULL THEN
+        INSERT INTO videos (url, source_type, media_id)
+        VALUES (p_url, p_source_type, p_media_id)
+        ON CONFLICT DO NOTHING
+        RETURNING id INTO v_id;
+
+        IF v_id IS NULL THEN
+            -- Stored by a concurrent call in the meantime, under the same media key or the same URL
+            SELECT id INTO v_id FROM videos WHERE source_type = p_source_type AND media_id = p_media_id;
+            IF v_id IS NULL THEN
+                SELECT id INTO v_id FROM videos WHERE url = p_url;
+            END IF;
+            IF v_id IS NULL THEN
+                RAISE EXCEPTION 'store_video: no video found for % after a conflicting insert', p_url;
+            END IF;
+        ELSE
+            IF p_transcript IS NOT NULL THEN
+                INSERT INTO transcripts (video_id, content) VALUES (v_id, p_transcript);
+            END IF;
+
+            IF p_summary IS NOT NULL THEN
+                INSERT INTO summaries (video_id, brief, key_points)
+                VALUES (v_id, COALESCE(p_summary->>'brief', ''), COALESCE(p_summary->'keyPoints', '[]'::jsonb));
+            END IF;
+
+            IF p_metadata IS NOT NULL THEN
+                INSERT INTO video_metadata (video_id, author, publish_date, likes, views, comments,
+                                            hashtags, mentions, additional_data)
+                VALUES (v_id,
+                        p_metadata->>'author',
+                        (p_metadata->>'publish_date')::timestamp with time zone,
+                        (p_metadata->>'likes')::integer,
+                        (p_metadata->>'views')::integer,
+                        (p_metadata->>'comments')::integer,
+                        COALESCE(p_metadata->'hashtags', '[]'::jsonb),
+                        COALESCE(p_metadata->'mentions', '[]'::jsonb),
+                        COALESCE(p_metadata->'additional_data', '{}'::jsonb));
+            END IF;
+        END IF;
+    END IF;
+
+    INSERT INTO video_aliases (url, video_id) VALUES (p_url, v_id) ON CONFLICT (url) DO NOTHING;
+    RETURN v_id;
+END;
+$$;
+
+-- Look a video up by any URL it is known under, by its media key, or by the URL of a video
+-- stored before media ids were recorded, in one call. Returns the videos table type, so that
+-- SupabaseManager.get_video_data can embed the transcript, summary and metadata with select
+-- in GET /rest/v1/rpc/find_video.
+CREATE OR REPLACE FUNCTION find_video(
+    p_url text,
+    p_source_type text,
+    p_media_id text
+) RETURNS SETOF videos
+LANGUAGE sql STABLE AS $$
+    (SELECT v.* FROM video_aliases a JOIN videos v ON v.id = a.video_id WHERE a.url = p_url
+     UNION ALL
+     SELECT * FROM videos WHERE source_type = p_source_type AND media_id = p_media_id
+     UNION ALL
+     SELECT * FROM videos WHERE url = p_url)
+    LIMIT 1;
+$$;
+
+-- Computed column of videos: the first 200 characters of the transcript. SupabaseManager.search_videos
+-- selects it as transcript_preview, so that listings do not carry whole transcripts.
+CREATE OR REPLACE FUNCTION transcript_preview(videos) RETURNS text
+LANGUAGE sql STABLE AS $$
+    SELECT left(content, 200) || '...' FROM transcripts WHERE video_id = $1.id ORDER BY processed_at LIMIT 1;
+$$;
@@ -1,9 +1,14 @@
-from supabase import create_client
+import asyncio
+import httpx
 import os
-from typing import Optional, Dict, Any
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime
 import logging
 from dotenv import load_dotenv
+from url_utils import media_key
+from .video_cache import VideoCache
 
 # Try to load environment variables from both possible locations
 env_paths = [
@@ -23,88 +28,111 @@ for env_path in env_paths:
             break
 
 class SupabaseManager:
-    def __init__(self):
-        self.supabase_url = 'https://ncxikoazwraguwudeovx.supabase.co'
-        self.supabase_key = os.getenv('SUPABASE_API_KEY')
+    """Async access to the Supabase tables through their PostgREST API
+    
+    Requests share one pooled HTTP/2 connection per manager, so they must all run on the same
+    event loop. Pass a transport, e.g. httpx.MockTransport, to talk to a local stand-in instead.
+    With a VideoCache, get_video_data reads through it. Its file is accessed from a worker thread,
+    so that it does not block the event loop.
+    """
+    
+    def __init__(self,
+                 supabase_url: Optional[str] = None,
+                 supabase_key: Optional[str] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 max_connections: int = 20,
+                 cache: Optional[VideoCache] = None):
+        self.supabase_url = supabase_url or os.getenv('SUPABASE_URL', 'https://ncxikoazwraguwudeovx.supabase.co')
+        self.supabase_key = supabase_key or os.getenv('SUPABASE_API_KEY')
         if not self.supabase_key:
             self.supabase_key = os.getenv('SUPABASE_ANON_KEY')
         if not self.supabase_key:
             raise ValueError("Neither SUPABASE_API_KEY nor SUPABASE_ANON_KEY found in environment variables")
         
-        self.client = create_client(self.supabase_url, self.supabase_key)
-        self._init_database()
+        self.cache = cache
+        self._transport = transport
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._latency: Dict[str, List[float]] = {}  # call name -> [calls, total seconds, max seconds]
+        self._latency_lock = threading.Lock()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """HTTP client for the REST API, created on first use within the running event loop"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.supabase_url}/rest/v1",
+                headers={'apikey': self.supabase_key, 'Authorization': f"Bearer {self.supabase_key}"},
+                http2=self._transport is None,  # a custom transport brings its own protocol
+                limits=self._limits,
+                timeout=30.0,
+                transport=self._transport
+            )
+        return self._client
     
-    def _init_database(self):
-        """Initialize database tables if they don't exist"""
+    async def connect(self):
+        """Verify the connection, the tables should be created through the Supabase dashboard"""
         try:
-            # We'll use Supabase's SQL editor to create tables
-            # The tables should be created through the Supabase dashboard
-            # This function will only verify the connection
-            self.client.table('videos').select('id').limit(1).execute()
+            await self._request('connect', 'GET', '/videos', params={'select': 'id', 'limit': 1})
             logging.info("Successfully connected to Supabase")
         except Exception as e:
             logging.error(f"Failed to connect to Supabase: {str(e)}")
             raise
     
+    async def close(self):
+        """Close the pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _request(self, name: str, method: str, path: str, **kwargs) -> Any:
+        """Send a request, record its latency under name and return the decoded response"""
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+            response.raise_for_status()
+            return response.json() if response.content else None
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._latency_lock:
+                stats = self._latency.setdefault(name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+            logging.debug(f"Supabase {name}: {elapsed * 1000:.1f} ms")
+    
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Number of calls and their mean and maximum latency, per call"""
+        with self._latency_lock:
+            return {name: {'calls': calls,
+                           'mean_ms': round(total / calls * 1000, 1),
+                           'max_ms': round(slowest * 1000, 1)}
+                    for name, (calls, total, slowest) in self._latency.items()}
+    
     async def store_video_data(self,
                              url: str,
                              source_type: str,
                              transcript: str,
                              summary: Dict[str, Any],
                              metadata: Optional[Dict[str, Any]] = None) -> Optional[str]:
-        """Store video data in Supabase"""
+        """Store video data in Supabase
+        
+        The store_video function (see schema.sql) writes the video, its transcript, summary,
+        metadata and URL alias in one call and transaction, or only the alias if the video is
+        already stored under another URL.
+        """
         try:
-            # Check if video exists
-            response = self.client.table('videos').select('id').eq('url', url).execute()
-            if response.data:
-                logging.info(f"Video {url} already exists in database")
-                return response.data[0]['id']
-            
-            # Store video data
-            video_data = {
-                'url': url,
-                'source_type': source_type,
-                'processed_at': datetime.utcnow().isoformat()
-            }
-            
-            video_response = self.client.table('videos').insert(video_data).execute()
-            video_id = video_response.data[0]['id']
-            
-            # Store transcript
-            if transcript:
-                transcript_data = {
-                    'video_id': video_id,
-                    'content': transcript,
-                    'language': 'en',
-                    'processed_at': datetime.utcnow().isoformat()
-                }
-                self.client.table('transcripts').insert(transcript_data).execute()
-            
-            # Store summary
-            if summary:
-                summary_data = {
-                    'video_id': video_id,
-                    'brief': summary.get('brief', ''),
-                    'key_points': summary.get('keyPoints', []),
-                    'processed_at': datetime.utcnow().isoformat()
-                }
-                self.client.table('summaries').insert(summary_data).execute()
-            
-            # Store metadata if available
-            if metadata:
-                metadata_data = {
-                    'video_id': video_id,
-                    'author': metadata.get('author'),
-                    'publish_date': metadata.get('publish_date'),
-                    'likes': metadata.get('likes'),
-                    'views': metadata.get('views'),
-                    'comments': metadata.get('comments'),
-                    'hashtags': metadata.get('hashtags', []),
-                    'mentions': metadata.get('mentions', []),
-                    'additional_data': metadata.get('additional_data', {})
-                }
-                self.client.table('metadata').insert(metadata_data).execute()
-            
+            key = media_key(url)
+            video_id = await self._request('store_video', 'POST', '/rpc/store_video', json={
+                'p_url': url,
+                'p_source_type': source_type,
+                'p_media_id': key.media_id,
+                'p_transcript': transcript or None,
+                'p_summary': summary or None,
+                'p_metadata': metadata or None
+            })
+            if self.cache:
+                await asyncio.to_thread(self.cache.invalidate, VideoCache.key(*key))
             return video_id
             
         except Exception as e:
@@ -112,85 +140,111 @@ class SupabaseManager:
             return None
     
     async def get_video_data(self, url: str) -> Optional[Dict[str, Any]]:
-        """Retrieve video data from Supabase"""
+        """Retrieve video data from the cache or Supabase"""
         try:
-            # Get video and related data
-            response = self.client.table('videos')\
-                .select('''
-                    *,
-                    transcripts (*),
-                    summaries (*),
-                    metadata (*)
-                ''')\
-                .eq('url', url)\
-                .execute()
-            
-            if not response.data:
-                return None
-            
-            video = response.data[0]
-            
-            return {
-                'id': video['id'],
-                'url': video['url'],
-                'source_type': video['source_type'],
-                'processed_at': video['processed_at'],
-                'transcript': video['transcripts'][0]['content'] if video.get('transcripts') else None,
-                'summary': {
-                    'brief': video['summaries'][0]['brief'] if video.get('summaries') else '',
-                    'key_points': video['summaries'][0]['key_points'] if video.get('summaries') else []
-                } if video.get('summaries') else None,
-                'metadata': {
-                    'author': video['metadata'][0]['author'],
-                    'publish_date': video['metadata'][0]['publish_date'],
-                    'likes': video['metadata'][0]['likes'],
-                    'views': video['metadata'][0]['views'],
-                    'comments': video['metadata'][0]['comments'],
-                    'hashtags': video['metadata'][0]['hashtags'],
-                    'mentions': video['metadata'][0]['mentions'],
-                    'additional_data': video['metadata'][0]['additional_data']
-                } if video.get('metadata') else None
-            }
+            source_type, media_id = media_key(url)
+            if self.cache:
+                cached, data = await asyncio.to_thread(self.cache.get, VideoCache.key(source_type, media_id))
+                if cached:
+                    return data
+            
+            data = await self._fetch_video_data(url, source_type, media_id)
+            if self.cache:
+                await asyncio.to_thread(self.cache.put, VideoCache.key(source_type, media_id), data)
+            return data
                 
         except Exception as e:
             logging.error(f"Error retrieving video data: {str(e)}")
             return None
     
+    async def _fetch_video_data(self, url: str, source_type: str, media_id: str) -> Optional[Dict[str, Any]]:
+        """Video data from Supabase, None if the video is not stored
+        
+        The find_video function (see schema.sql) tries the URL aliases, the (source_type, media_id)
+        index and the URL of videos stored before media ids were recorded, all in one request.
+        """
+        rows = await self._request('get_video', 'GET', '/rpc/find_video', params={
+            'p_url': url,
+            'p_source_type': source_type,
+            'p_media_id': media_id,
+            'select': '*,transcripts(*),summaries(*),metadata:video_metadata(*)'
+        })
+        
+        if not rows:
+            return None
+        
+        video = rows[0]
+        
+        return {
+            'id': video['id'],
+            'url': video['url'],
+            'source_type': video['source_type'],
+            'processed_at': video['processed_at'],
+            'transcript': video['transcripts'][0]['content'] if video.get('transcripts') else None,
+            'summary': {
+                'brief': video['summaries'][0]['brief'] if video.get('summaries') else '',
+                'key_points': video['summaries'][0]['key_points'] if video.get('summaries') else []
+            } if video.get('summaries') else None,
+            'metadata': {
+                'author': video['metadata'][0]['author'],
+                'publish_date': video['metadata'][0]['publish_date'],
+                'likes': video['metadata'][0]['likes'],
+                'views': video['metadata'][0]['views'],
+                'comments': video['metadata'][0]['comments'],
+                'hashtags': video['metadata'][0]['hashtags'],
+                'mentions': video['metadata'][0]['mentions'],
+                'additional_data': video['metadata'][0]['additional_data']
+            } if video.get('metadata') else None
+        }
+    
     async def search_videos(self,
                           keyword: Optional[str] = None,
                           source_type: Optional[str] = None,
                           start_date: Optional[datetime] = None,
-                          end_date: Optional[datetime] = None) -> list:
-        """Search videos in Supabase"""
-        try:
-            query = self.client.table('videos')\
-                .select('''
-                    *,
-                    transcripts (content)
-                ''')
-            
-            if keyword:
-                query = query.textSearch('transcripts.content', keyword)
-            
-            if source_type:
-                query = query.eq('source_type', source_type)
-            
-            if start_date:
-                query = query.gte('processed_at', start_date.isoformat())
-            
-            if end_date:
-                query = query.lte('processed_at', end_date.isoformat())
-            
-            response = query.execute()
-            
-            return [{
-                'id': video['id'],
-                'url': video['url'],
-                'source_type': video['source_type'],
-                'processed_at': video['processed_at'],
-                'transcript_preview': video['transcripts'][0]['content'][:200] + '...' if video.get('transcripts') else None
-            } for video in response.data]
-            
-        except Exception as e:
-            logging.error(f"Error searching videos: {str(e)}")
-            return []
+                          end_date: Optional[datetime] = None,
+                          limit: Optional[int] = None,
+                          after: Optional[Tuple[str, str]] = None) -> list:
+        """Search videos in Supabase, newest first
+        
+        To page through the results, pass the (processed_at, id) of the last result of the previous
+        page as after. A failed request raises httpx.HTTPError rather than returning no videos, so
+        that callers can tell it from an empty page.
+        """
+        # The preview is cut in the database, see transcript_preview in schema.sql. An empty inner
+        # join lets the full-text filter on transcripts drop the videos that do not match.
+        columns = 'id,url,source_type,processed_at,transcript_preview'
+        params: List[Tuple[str, Any]] = [
+            ('select', columns + ',transcripts!inner()' if keyword else columns)
+        ]
+        
+        if keyword:
+            params.append(('transcripts.content', f'fts.{keyword}'))
+        
+        if source_type:
+            params.append(('source_type', f'eq.{source_type}'))
+        
+        if start_date:
+            params.append(('processed_at', f'gte.{start_date.isoformat()}'))
+        
+        if end_date:
+            params.append(('processed_at', f'lte.{end_date.isoformat()}'))
+        
+        if after is not None:
+            processed_at, video_id = after
+            params.append(('or', f'(processed_at.lt."{processed_at}",'
+                                  f'and(processed_at.eq."{processed_at}",id.lt.{video_id}))'))
+        
+        params.append(('order', 'processed_at.desc,id.desc'))
+        if limit is not None:
+            params.append(('limit', limit))
+        
+        rows = await self._request('search_videos', 'GET', '/videos', params=params)
+        
+        return [{
+            'id': video['id'],
+            'url': video['url'],
+            'source_type': video['source_type'],
+            'processed_at': video['processed_at'],
+            'transcript_preview': video['transcript_preview']
+        } for video in rows]
+        
@@ -0,0 +1,153 @@
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# Stored in place of the data of a video that is not in the database
+_MISSING = None
+
+
+class VideoCache:
+    """Read-through cache of get_video_data results, keyed by media key
+
+    A bounded in-process LRU answers repeated lookups without leaving the process. With a path,
+    an SQLite file shared by all workers on the host backs it, so a video fetched by one worker
+    is not fetched again by the others. The file holds at most max_rows entries, expired and
+    then the oldest ones are deleted every cleanup_interval puts. Stored videos do not change,
+    so their entries only expire with ttl if one is set. Lookups of videos that are not stored
+    yet are remembered for negative_ttl seconds, and store_video_data invalidates the key right
+    away, in the file too, so other workers check the file before trusting such an entry.
+    
+    The methods block on the file, call them from a worker thread rather than an event loop.
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 path: Optional[str] = None,
+                 ttl: Optional[float] = None,
+                 negative_ttl: float = 30.0,
+                 max_rows: int = 100000,
+                 cleanup_interval: int = 100):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_rows = max_rows
+        self.cleanup_interval = cleanup_interval
+        self._puts = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._db:
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("CREATE TABLE IF NOT EXISTS videos "
+                                 "(key TEXT PRIMARY KEY, expires REAL NOT NULL, value TEXT)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS videos_expires ON videos (expires)")
+
+    @staticmethod
+    def key(source_type: str, media_id: str) -> str:
+        return f"{source_type}:{media_id}"
+
+    def get(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """Return (True, data) for a cached lookup, data being None for a video that is not stored,
+        or (False, None) if the database has to be asked
+        
+        The data is a copy, changing it does not change the cache.
+        """
+        cached, value = self._get(key)
+        return cached, copy.deepcopy(value)
+
+    def _get(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            # Another worker may have stored the video since, which removed the entry from the file
+            if entry is not None and entry[0] > now and (entry[1] is not _MISSING or self._db is None):
+                self._entries.move_to_end(key)
+                self._count_hit(entry[1])
+                return True, entry[1]
+            self._entries.pop(key, None)
+            if self._db is not None:
+                row = self._db.execute("SELECT expires, value FROM videos WHERE key = ? AND expires > ?",
+                                       (key, now)).fetchone()
+                if row is not None:
+                    value = json.loads(row[1]) if row[1] is not None else _MISSING
+                    self._remember(key, row[0], value)
+                    self.disk_hits += 1
+                    self._count_hit(value)
+                    return True, value
+            self.misses += 1
+            return False, None
+
+    def _count_hit(self, value: Optional[Dict[str, Any]]):
+        if value is _MISSING:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+
+    def _remember(self, key: str, expires: float, value: Optional[Dict[str, Any]]):
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, value: Optional[Dict[str, Any]]):
+        """Remember a copy of the data of a video, or None if it is not stored"""
+        now = time.time()
+        if value is _MISSING:
+            expires = now + self.negative_ttl
+        else:
+            expires = now + self.ttl if self.ttl is not None else float('inf')
+        with self._lock:
+            self._remember(key, expires, copy.deepcopy(value))
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("INSERT OR REPLACE INTO videos (key, expires, value) VALUES (?, ?, ?)",
+                                     (key, expires, json.dumps(value) if value is not _MISSING else None))
+                    self._puts += 1
+                    if self._puts % self.cleanup_interval == 0:
+                        self._cleanup(now)
+
+    def _cleanup(self, now: float):
+        """Delete the expired rows of the file, then the oldest ones beyond max_rows"""
+        self._db.execute("DELETE FROM videos WHERE expires <= ?", (now,))
+        rows, = self._db.execute("SELECT COUNT(*) FROM videos").fetchone()
+        if rows > self.max_rows:
+            # INSERT OR REPLACE gives a replaced row a new rowid, so the lowest ones were written first
+            self._db.execute("DELETE FROM videos WHERE rowid IN "
+                             "(SELECT rowid FROM videos ORDER BY rowid LIMIT ?)", (rows - self.max_rows,))
+
+    def invalidate(self, key: str):
+        """Forget a video, after it has been stored
+        
+        Other workers sharing the file drop their entry if it said that the video is not stored.
+        Their entries of stored videos are kept, as those do not change.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute("DELETE FROM videos WHERE key = ?", (key,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.negative_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'negative_hits': self.negative_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0
+            }
@@ -9,10 +9,13 @@ import {
   VideoCameraIcon,
 } from '@heroicons/react/24/outline';
 
+const JOB_POLL_INTERVAL_MS = 2000;
+
 function App() {
   const [url, setUrl] = useState('');
   const [processing, setProcessing] = useState(false);
   const [result, setResult] = useState(null);
+  const [partialTranscript, setPartialTranscript] = useState('');
   const [activeTab, setActiveTab] = useState('transcript');
 
   const getSourceIcon = (sourceType) => {
@@ -30,6 +33,58 @@ function App() {
     }
   };
 
+  const pollJob = async (job) => {
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+      const response = await axios.get(`/api/jobs/${job.job_id}`);
+      job = response.data;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'An error occurred while processing the video');
+    }
+    return job.result;
+  };
+
+  const waitForJob = (job, toastId) => {
+    if (job.status === 'completed') {
+      return Promise.resolve(job.result);
+    }
+    return new Promise((resolve, reject) => {
+      const events = new EventSource(`/api/jobs/${job.job_id}/events`);
+      events.addEventListener('download', (e) => {
+        const { downloaded_bytes, total_bytes } = JSON.parse(e.data);
+        const render = total_bytes
+          ? `Downloading video... ${Math.round((100 * downloaded_bytes) / total_bytes)}%`
+          : 'Downloading video...';
+        toast.update(toastId, { render });
+      });
+      events.addEventListener('transcribe', () => {
+        toast.update(toastId, { render: 'Transcribing video...' });
+      });
+      events.addEventListener('segment', (e) => {
+        const { text } = JSON.parse(e.data);
+        setPartialTranscript((previous) => previous + text);
+      });
+      events.addEventListener('summarize', () => {
+        toast.update(toastId, { render: 'Summarizing transcript...' });
+      });
+      events.addEventListener('completed', (e) => {
+        events.close();
+        resolve(JSON.parse(e.data).result);
+      });
+      events.addEventListener('failed', (e) => {
+        events.close();
+        reject(new Error(JSON.parse(e.data).error || 'An error occurred while processing the video'));
+      });
+      events.onerror = () => {
+        // Fall back to polling if the stream cannot be (re)established
+        if (events.readyState === EventSource.CLOSED) {
+          pollJob(job).then(resolve, reject);
+        }
+      };
+    });
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
     
@@ -40,16 +95,18 @@ function App() {
 
     setProcessing(true);
     setResult(null);
+    setPartialTranscript('');
+
+    const toastId = toast.loading('Processing video...');
 
     try {
-      const toastId = toast.loading('Processing video...');
-      
       const response = await axios.post('/api/process', { url });
+      const data = await waitForJob(response.data, toastId);
       
-      if (response.data) {
-        setResult(response.data);
+      if (data) {
+        setResult(data);
         toast.update(toastId, {
-          render: `Successfully processed ${getSourceIcon(response.data.source_type)} video!`,
+          render: `Successfully processed ${getSourceIcon(data.source_type)} video!`,
           type: 'success',
           isLoading: false,
           autoClose: 3000
@@ -57,11 +114,14 @@ function App() {
       }
     } catch (error) {
       console.error('Processing error:', error);
-      toast.error(
-        error.response?.data?.detail || 
-        error.message || 
-        'An error occurred while processing the video'
-      );
+      toast.update(toastId, {
+        render: error.response?.data?.detail || 
+          error.message || 
+          'An error occurred while processing the video',
+        type: 'error',
+        isLoading: false,
+        autoClose: 5000
+      });
     } finally {
       setProcessing(false);
     }
@@ -150,6 +210,20 @@ function App() {
           </form>
         </div>
 
+        {/* Partial transcript while the video is being processed */}
+        {processing && partialTranscript && (
+          <div className="mt-12">
+            <div className="bg-white shadow rounded-lg p-6">
+              <h3 className="text-lg font-medium text-gray-900 mb-4">
+                Transcript so far
+              </h3>
+              <p className="whitespace-pre-wrap text-gray-700">
+                {partialTranscript}
+              </p>
+            </div>
+          </div>
+        )}
+
         {/* Results Section */}
         {result && (
           <div className="mt-12">
@@ -0,0 +1,37 @@
+"""Gunicorn settings starting one shared transcription service next to the web workers"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+workers = int(os.getenv('WEB_CONCURRENCY', '4'))
+worker_class = 'uvicorn.workers.UvicornWorker'
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+
+def on_starting(server):
+    # Web workers submit audio to this service instead of loading a Whisper model each. They are
+    # forked after this hook, so they inherit the address and key set here.
+    if not os.getenv('TRANSCRIBE_SERVICE_ADDRESS'):
+        # mkdtemp creates the directory with mode 0700, other users cannot reach the socket
+        server.transcription_socket_dir = tempfile.mkdtemp(prefix='videogenx-')
+        os.environ['TRANSCRIBE_SERVICE_ADDRESS'] = os.path.join(server.transcription_socket_dir,
+                                                                'transcribe.sock')
+    if not os.getenv('TRANSCRIBE_SERVICE_AUTHKEY'):
+        os.environ['TRANSCRIBE_SERVICE_AUTHKEY'] = os.urandom(32).hex()
+    server.transcription_service = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                      'transcription_service.py')])
+    server.log.info("Started transcription service (pid %s)", server.transcription_service.pid)
+
+
+def on_exit(server):
+    service = getattr(server, 'transcription_service', None)
+    if service is not None:
+        service.terminate()
+        service.wait()
+    socket_dir = getattr(server, 'transcription_socket_dir', None)
+    if socket_dir is not None:
+        shutil.rmtree(socket_dir, ignore_errors=True)
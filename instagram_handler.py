@@ -2,18 +2,32 @@ import instaloader
 import logging
 import os
 from pathlib import Path
-from config import INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD, COOKIE_FILE, TEMP_DIR
+from url_utils import media_key
+from config import (INSTAGRAM_USERNAME, INSTAGRAM_PASSWORD, COOKIE_FILE, TEMP_DIR, INSTAGRAM_RATE_LEDGER,
+                    INSTAGRAM_RESPONSE_CACHE, INSTAGRAM_RESPONSE_CACHE_TTL)
 
 class InstagramHandler:
     def __init__(self):
+        rate_controller = None
+        if INSTAGRAM_RATE_LEDGER:
+            # Workers share one query budget instead of each assuming the whole rate limit
+            os.makedirs(os.path.dirname(INSTAGRAM_RATE_LEDGER) or '.', exist_ok=True)
+            rate_controller = lambda context: instaloader.SharedRateController(context, INSTAGRAM_RATE_LEDGER)
+        response_cache = None
+        if INSTAGRAM_RESPONSE_CACHE:
+            response_cache = instaloader.ResponseCache(INSTAGRAM_RESPONSE_CACHE, INSTAGRAM_RESPONSE_CACHE_TTL)
         self.L = instaloader.Instaloader(
+            download_pictures=False,
             download_videos=True,
             download_video_thumbnails=False,
             download_geotags=False,
             download_comments=False,
             save_metadata=False,
             compress_json=False,
-            dirname_pattern=TEMP_DIR
+            post_metadata_txt_pattern='',
+            dirname_pattern=TEMP_DIR,
+            rate_controller=rate_controller,
+            response_cache=response_cache
         )
         self._ensure_login()
 
@@ -41,8 +55,10 @@ class InstagramHandler:
     def download_post(self, url):
         """Download video from Instagram post"""
         try:
-            # Extract post shortcode from URL
-            shortcode = url.split("/p/")[1].split("/")[0]
+            # Extract post shortcode from URL (/p/, /reel/ and /tv/ links alike)
+            source_type, shortcode = media_key(url)
+            if source_type != 'instagram' or '/' in shortcode:
+                raise ValueError(f"Not an Instagram post URL: {url}")
             logging.info(f"Downloading post with shortcode: {shortcode}")
 
             # Get post
@@ -15,8 +15,12 @@ else:
 from .exceptions import *
 from .instaloader import Instaloader as Instaloader
 from .instaloadercontext import (InstaloaderContext as InstaloaderContext,
-                                 RateController as RateController)
-from .lateststamps import LatestStamps as LatestStamps
+                                 RateController as RateController,
+                                 SharedRateController as SharedRateController)
+from .lateststamps import (LatestStamps as LatestStamps,
+                          SQLiteLatestStamps as SQLiteLatestStamps)
+from .manifest import DownloadManifest as DownloadManifest
+from .responsecache import ResponseCache as ResponseCache
 from .nodeiterator import (NodeIterator as NodeIterator,
                            FrozenNodeIterator as FrozenNodeIterator,
                            resumable_iteration as resumable_iteration)
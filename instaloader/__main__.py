@@ -4,6 +4,7 @@ import ast
 import datetime
 import os
 import re
+import signal
 import sys
 from argparse import ArgumentParser, ArgumentTypeError, SUPPRESS
 from enum import IntEnum
@@ -12,9 +13,11 @@ from typing import List, Optional
 from . import (AbortDownloadException, BadCredentialsException, Instaloader, InstaloaderException,
                InvalidArgumentException, LoginException, Post, Profile, ProfileNotExistsException, StoryItem,
                TwoFactorAuthRequiredException, __version__, load_structure_from_file)
-from .instaloader import (get_default_session_filename, get_default_stamps_filename)
+from .instaloader import (get_default_response_cache_filename, get_default_session_filename,
+                          get_default_stamps_filename)
 from .instaloadercontext import default_user_agent
-from .lateststamps import LatestStamps
+from .lateststamps import LatestStamps, SQLiteLatestStamps
+from .responsecache import ResponseCache
 try:
     import browser_cookie3
     bc3_library = True
@@ -159,7 +162,9 @@ def _main(instaloader: Instaloader, targetlist: List[str],
         instaloader.context.log('Only download storyitems with property "{}".'.format(storyitem_filter_str))
     latest_stamps = None
     if latest_stamps_file is not None:
-        latest_stamps = LatestStamps(latest_stamps_file)
+        stamps_class = (SQLiteLatestStamps if latest_stamps_file.endswith(('.db', '.sqlite', '.sqlite3'))
+                        else LatestStamps)
+        latest_stamps = stamps_class(latest_stamps_file, flush_interval=10.0)
         instaloader.context.log(f"Using latest stamps from {latest_stamps_file}.")
     # load cookies if browser is not None
     if browser and bc3_library:
@@ -334,6 +339,9 @@ def _main(instaloader: Instaloader, targetlist: List[str],
     except AbortDownloadException as exc:
         print("\nDownload aborted: {}.".format(exc), file=sys.stderr)
         exit_code = ExitCode.DOWNLOAD_ABORTED
+    finally:
+        if latest_stamps is not None:
+            latest_stamps.close()
     # Save session if it is useful
     if instaloader.context.is_logged_in:
         instaloader.save_session_to_file(sessionfile)
@@ -349,6 +357,11 @@ def _main(instaloader: Instaloader, targetlist: List[str],
     return exit_code
 
 
+def _terminate(signum, frame):
+    """Handles SIGTERM like ^C, so that buffered latest stamps are written and the session is saved"""
+    raise KeyboardInterrupt
+
+
 def main():
     parser = ArgumentParser(description=__doc__, add_help=False, usage=usage_string(),
                             epilog="The complete documentation can be found at "
@@ -442,6 +455,9 @@ def main():
                         help='Store the timestamps of latest media scraped for each profile. This allows updating '
                              'your personal Instagram archive even if you delete the destination directories. '
                              'If STAMPSFILE is not provided, defaults to ' + get_default_stamps_filename())
+    g_cond.add_argument('--manifest', action='store_true',
+                        help='Keep a list of the downloaded pictures and videos in each target directory and look up '
+                             'whether a file exists there rather than in the file system.')
     g_cond.add_argument('--post-filter', '--only-if', metavar='filter',
                         help='Expression that, if given, must evaluate to True for each post to be downloaded. Must be '
                              'a syntactically valid python expression. Variables are evaluated to '
@@ -515,6 +531,19 @@ def main():
                             'retry logic.')
     g_how.add_argument('--no-iphone', action='store_true',
                         help='Do not attempt to download iPhone version of images and videos.')
+    g_how.add_argument('--max-concurrent-downloads', metavar='N', type=int, default=1,
+                       help='Number of pictures and videos downloaded at the same time. Defaults to 1. Metadata is '
+                            'still queried one request after the other.')
+    g_how.add_argument('--response-cache', nargs='?', metavar='CACHEFILE',
+                       const=get_default_response_cache_filename(),
+                       help='Store responses from Instagram and reuse them for repeated queries, without using up the '
+                            'rate limit. If CACHEFILE is not provided, defaults to ' +
+                            get_default_response_cache_filename())
+    g_how.add_argument('--response-cache-ttl', metavar='SECONDS', type=float, default=86400.0,
+                       help='Seconds a stored response about a single post is reused. Defaults to 86400, i.e. one '
+                            'day. Listings such as the posts of a profile are reused for ten minutes.')
+    g_how.add_argument('--refresh-response-cache', action='store_true',
+                       help='Do not reuse stored responses, but store the fresh ones in the response cache.')
 
     g_misc = parser.add_argument_group('Miscellaneous Options')
     g_misc.add_argument('-q', '--quiet', action='store_true',
@@ -526,6 +555,7 @@ def main():
                         version=__version__)
 
     args = parser.parse_args()
+    signal.signal(signal.SIGTERM, _terminate)
     try:
         if (args.login is None and args.load_cookies is None) and (args.stories or args.stories_only):
             print("Login is required to download stories.", file=sys.stderr)
@@ -580,7 +610,12 @@ def main():
                              fatal_status_codes=args.abort_on,
                              iphone_support=not args.no_iphone,
                              title_pattern=args.title_pattern,
-                             sanitize_paths=args.sanitize_paths)
+                             sanitize_paths=args.sanitize_paths,
+                             max_concurrent_downloads=args.max_concurrent_downloads,
+                             response_cache=(ResponseCache(args.response_cache, args.response_cache_ttl)
+                                             if args.response_cache is not None else None),
+                             manifest=args.manifest)
+        loader.context.bypass_response_cache = args.refresh_response_cache
         exit_code = _main(loader,
                           args.profile,
                           username=args.login.lower() if args.login is not None else None,
@@ -0,0 +1,165 @@
+"""Record HTTP traffic of an :class:`InstaloaderContext` once, and replay it later without network access.
+
+Pass a :class:`RecordingAdapter` as `transport` to record every response, JSON and media alike, into a cassette
+directory::
+
+   L = instaloader.Instaloader(transport=RecordingAdapter("cassettes/natgeo"))
+   L.download_profile("natgeo")
+
+and a :class:`ReplayAdapter` to serve them from there, optionally with simulated latency and injected
+``429 Too Many Requests`` responses::
+
+   L = instaloader.Instaloader(transport=ReplayAdapter("cassettes/natgeo", latency=0.05))
+
+This makes the download pipeline testable and measurable offline and reproducibly.
+
+.. versionadded:: 4.15
+"""
+
+import hashlib
+import http
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from io import BytesIO
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+# Headers that describe the encoding on the wire, which does not apply to the stored decoded body
+_TRANSPORT_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+
+def request_key(request: requests.PreparedRequest) -> str:
+    """Identifies a request by method, URL and body."""
+    body = request.body if request.body is not None else b''
+    if isinstance(body, str):
+        body = body.encode()
+    key = hashlib.sha256('{} {}\n'.format(request.method, request.url).encode())
+    key.update(body)
+    return key.hexdigest()
+
+
+def _build_response(request: requests.PreparedRequest, status_code: int, headers: Dict[str, str],
+                    body: bytes) -> requests.Response:
+    response = requests.Response()
+    response.request = request
+    response.url = request.url or ''
+    response.status_code = status_code
+    try:
+        response.reason = http.HTTPStatus(status_code).phrase
+    except ValueError:
+        response.reason = ''
+    response.headers = CaseInsensitiveDict(headers)
+    response.headers['Content-Length'] = str(len(body))
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.raw = BytesIO(body)
+    return response
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """Transport adapter that sends requests to the network and stores every response in a cassette directory.
+
+    A later response to the same request overwrites the earlier one.
+
+    :param directory: Cassette directory, created if it does not exist.
+    """
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint:disable=too-many-arguments
+        response = super().send(request, stream=False, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+        headers = {name: value for name, value in response.headers.items()
+                   if name.lower() not in _TRANSPORT_HEADERS}
+        key = request_key(request)
+        self._write(key + '.body', response.content)
+        self._write(key + '.json', json.dumps({'method': request.method, 'url': request.url,
+                                               'status_code': response.status_code,
+                                               'headers': headers}, indent=1).encode())
+        recorded = _build_response(request, response.status_code, headers, response.content)
+        recorded.cookies = response.cookies
+        # Lets the session pick up the cookies set by the response
+        # pylint:disable-next=protected-access
+        recorded.raw._original_response = response.raw._original_response  # type: ignore
+        return recorded
+
+    def _write(self, filename: str, data: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.replace(tmp_path, os.path.join(self.directory, filename))
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter that answers requests from a cassette directory written by :class:`RecordingAdapter`.
+
+    Requests that have not been recorded fail with a :class:`requests.exceptions.ConnectionError`, as if the network
+    was down. Cookies set by recorded responses are not applied, so replay a session that was loaded from a file
+    rather than a login.
+
+    :param directory: Cassette directory.
+    :param latency: Seconds each response is delayed, to simulate the round trip to the server.
+    :param bandwidth: Bytes per second at which bodies are delivered, or None for no limit.
+    :param too_many_requests_rate: Probability with which a request to an ``instagram.com`` host is answered with
+       ``429 Too Many Requests`` rather than its recorded response.
+    :param seed: Seed for the random injection of 429 responses.
+    """
+
+    def __init__(self, directory: str, latency: float = 0.0, bandwidth: Optional[float] = None,
+                 too_many_requests_rate: float = 0.0, seed: int = 0):
+        super().__init__()
+        self.directory = directory
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.too_many_requests_rate = too_many_requests_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {'requests': 0, 'replayed': 0, 'missing': 0, 'injected_429': 0,
+                                      'bytes': 0}
+
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            for name, increment in increments.items():
+                self.stats[name] += increment
+
+    def _inject_429(self, request: requests.PreparedRequest) -> bool:
+        if self.too_many_requests_rate <= 0 or not urlsplit(request.url).netloc.endswith('instagram.com'):
+            return False
+        with self._lock:
+            return self._random.random() < self.too_many_requests_rate
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        # pylint:disable=too-many-arguments
+        if self.latency > 0:
+            time.sleep(self.latency)
+        if self._inject_429(request):
+            self._count(requests=1, injected_429=1)
+            return _build_response(request, 429, {'Content-Type': 'application/json; charset=utf-8'},
+                                   b'{"message": "Please wait a few minutes before you try again.", "status": "fail"}')
+        key = request_key(request)
+        try:
+            with open(os.path.join(self.directory, key + '.json'), 'rb') as file:
+                entry = json.load(file)
+            with open(os.path.join(self.directory, key + '.body'), 'rb') as file:
+                body = file.read()
+        except FileNotFoundError as err:
+            self._count(requests=1, missing=1)
+            raise requests.exceptions.ConnectionError("No recorded response for {} {}"
+                                                      .format(request.method, request.url), request=request) from err
+        if self.bandwidth:
+            time.sleep(len(body) / self.bandwidth)
+        self._count(requests=1, replayed=1, bytes=len(body))
+        return _build_response(request, entry['status_code'], entry['headers'], body)
+
+    def close(self):
+        pass
@@ -7,12 +7,14 @@ import shutil
 import string
 import sys
 import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from contextlib import contextmanager, suppress
 from datetime import datetime, timezone
 from functools import wraps
 from io import BytesIO
 from pathlib import Path
-from typing import Any, Callable, IO, Iterator, List, Optional, Set, Union, cast
+from typing import Any, Callable, Deque, IO, Iterator, List, Optional, Set, Tuple, Union, cast
 from urllib.parse import urlparse
 
 import requests
@@ -21,6 +23,8 @@ import urllib3  # type: ignore
 from .exceptions import *
 from .instaloadercontext import InstaloaderContext, RateController
 from .lateststamps import LatestStamps
+from .manifest import DownloadManifest
+from .responsecache import ResponseCache
 from .nodeiterator import NodeIterator, resumable_iteration
 from .sectioniterator import SectionIterator
 from .structures import (Hashtag, Highlight, JsonExportable, Post, PostLocation, Profile, Story, StoryItem,
@@ -64,6 +68,17 @@ def get_default_stamps_filename() -> str:
     return os.path.join(configdir, "latest-stamps.ini")
 
 
+def get_default_response_cache_filename() -> str:
+    """
+    Returns default filename for the response cache database.
+
+    .. versionadded:: 4.15
+
+    """
+    configdir = _get_config_dir()
+    return os.path.join(configdir, "response-cache.sqlite3")
+
+
 def format_string_contains_key(format_string: str, key: str) -> bool:
     # pylint:disable=unused-variable
     for literal_text, field_name, format_spec, conversion in string.Formatter().parse(format_string):
@@ -202,6 +217,10 @@ class Instaloader:
     :param fatal_status_codes: :option:`--abort-on`
     :param iphone_support: not :option:`--no-iphone`
     :param sanitize_paths: :option:`--sanitize-paths`
+    :param max_concurrent_downloads: :option:`--max-concurrent-downloads`
+    :param response_cache: :class:`ResponseCache` answering repeated queries, see :option:`--response-cache`
+    :param transport: Requests transport adapter used instead of the network, see :mod:`instaloader.cassette`
+    :param manifest: :option:`--manifest`, look up already downloaded files in a :class:`DownloadManifest`
 
     .. attribute:: context
 
@@ -232,11 +251,16 @@ class Instaloader:
                  fatal_status_codes: Optional[List[int]] = None,
                  iphone_support: bool = True,
                  title_pattern: Optional[str] = None,
-                 sanitize_paths: bool = False):
+                 sanitize_paths: bool = False,
+                 max_concurrent_downloads: int = 1,
+                 response_cache: Optional[ResponseCache] = None,
+                 transport: Optional[requests.adapters.BaseAdapter] = None,
+                 manifest: bool = False):
 
         self.context = InstaloaderContext(sleep, quiet, user_agent, max_connection_attempts,
                                           request_timeout, rate_controller, fatal_status_codes,
-                                          iphone_support)
+                                          iphone_support, media_pool_maxsize=max(10, max_concurrent_downloads),
+                                          response_cache=response_cache, transport=transport)
 
         # configuration parameters
         self.dirname_pattern = dirname_pattern or "{target}"
@@ -250,6 +274,9 @@ class Instaloader:
             else:
                 self.title_pattern = '{target}_{date_utc}_UTC_{typename}'
         self.sanitize_paths = sanitize_paths
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self._media_executor: Optional[ThreadPoolExecutor] = None
+        self.manifest = DownloadManifest() if manifest else None
         self.download_pictures = download_pictures
         self.download_videos = download_videos
         self.download_video_thumbnails = download_video_thumbnails
@@ -314,7 +341,12 @@ class Instaloader:
             slide=self.slide,
             fatal_status_codes=self.context.fatal_status_codes,
             iphone_support=self.context.iphone_support,
-            sanitize_paths=self.sanitize_paths)
+            sanitize_paths=self.sanitize_paths,
+            max_concurrent_downloads=self.max_concurrent_downloads,
+            response_cache=self.context.response_cache,
+            transport=self.context.transport)
+        new_loader.manifest = self.manifest
+        new_loader.context.bypass_response_cache = self.context.bypass_response_cache
         yield new_loader
         self.context.error_log.extend(new_loader.context.error_log)
         new_loader.context.error_log = []  # avoid double-printing of errors
@@ -322,6 +354,9 @@ class Instaloader:
 
     def close(self):
         """Close associated session objects and repeat error log."""
+        if self._media_executor is not None:
+            self._media_executor.shutdown()
+            self._media_executor = None
         self.context.close()
 
     def __enter__(self):
@@ -330,6 +365,10 @@ class Instaloader:
     def __exit__(self, *args):
         self.close()
 
+    def _isfile(self, path: str) -> bool:
+        """Whether a picture or video exists, looked up in :attr:`manifest` if enabled."""
+        return self.manifest.isfile(path) if self.manifest is not None else os.path.isfile(path)
+
     @_retry_on_connection_error
     def download_pic(self, filename: str, url: str, mtime: datetime,
                      filename_suffix: Optional[str] = None, _attempt: int = 1) -> bool:
@@ -340,7 +379,7 @@ class Instaloader:
         urlmatch = re.search('\\.[a-z0-9]*\\?', url)
         file_extension = url[-3:] if urlmatch is None else urlmatch.group(0)[1:-1]
         nominal_filename = filename + '.' + file_extension
-        if os.path.isfile(nominal_filename):
+        if self._isfile(nominal_filename):
             self.context.log(nominal_filename + ' exists', end=' ', flush=True)
             return False
         resp = self.context.get_raw(url)
@@ -350,13 +389,31 @@ class Instaloader:
             filename += header_extension
         else:
             filename = nominal_filename
-        if filename != nominal_filename and os.path.isfile(filename):
+        if filename != nominal_filename and self._isfile(filename):
             self.context.log(filename + ' exists', end=' ', flush=True)
+            resp.close()
             return False
         self.context.write_raw(resp, filename)
         os.utime(filename, (datetime.now().timestamp(), mtime.timestamp()))
+        if self.manifest is not None:
+            self.manifest.add(filename)
         return True
 
+    def _submit_download_pic(self, filename: str, url: str, mtime: datetime,
+                             filename_suffix: Optional[str] = None) -> 'Future[bool]':
+        """Run :meth:`download_pic` in the media download pool, or right away if :attr:`max_concurrent_downloads`
+        is 1."""
+        if self.max_concurrent_downloads <= 1:
+            future: 'Future[bool]' = Future()
+            future.set_result(self.download_pic(filename=filename, url=url, mtime=mtime,
+                                                filename_suffix=filename_suffix))
+            return future
+        if self._media_executor is None:
+            self._media_executor = ThreadPoolExecutor(max_workers=self.max_concurrent_downloads,
+                                                      thread_name_prefix='instaloader-media')
+        return self._media_executor.submit(self.download_pic, filename=filename, url=url, mtime=mtime,
+                                           filename_suffix=filename_suffix)
+
     def save_metadata_json(self, filename: str, structure: JsonExportable) -> None:
         """Saves metadata JSON file of a structure."""
         if self.compress_json:
@@ -543,6 +600,7 @@ class Instaloader:
                                          (content_length is not None and
                                           os.path.getsize(filename) >= int(content_length))):
             self.context.log(filename + ' already exists')
+            http_response.close()
             return
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         self.context.write_raw(pic_bytes if pic_bytes else http_response, filename)
@@ -692,10 +750,24 @@ class Instaloader:
         :param post: Post to download.
         :param target: Target name, i.e. profile name, #hashtag, :feed; for filename.
         :return: True if something was downloaded, False otherwise, i.e. file was already there
+
+        .. versionchanged:: 4.15
+           Pictures and videos of the post are downloaded concurrently if :attr:`max_concurrent_downloads` is
+           greater than 1.
+        """
+        return self._download_post(post, target)()
+
+    def _download_post(self, post: Post, target: Union[str, Path]) -> Callable[[], bool]:
+        """Save the metadata of a post and queue the downloads of its pictures and videos.
+
+        Everything that queries Instagram happens before returning, so it stays serial and rate-controlled.
+
+        :return: Function waiting for the pictures and videos to be written and returning what
+           :meth:`download_post` returns.
         """
 
         def _already_downloaded(path: str) -> bool:
-            if not os.path.isfile(path):
+            if not self._isfile(path):
                 return False
             else:
                 self.context.log(path + ' exists', end=' ', flush=True)
@@ -721,6 +793,8 @@ class Instaloader:
 
         # Download the image(s) / video thumbnail and videos within sidecars if desired
         downloaded = True
+        # Queued picture and video downloads, with the description for error_catcher() if their errors are caught
+        media: List[Tuple[Optional[str], 'Future[bool]']] = []
         if post.typename == 'GraphSidecar':
             if (self.download_pictures or self.download_videos) and post.mediacount > 0:
                 if not _all_already_downloaded(
@@ -742,28 +816,39 @@ class Instaloader:
                             sidecar_filename = self.__prepare_filename(filename_template,
                                                                        lambda: sidecar_node.display_url)
                             # Download sidecar picture or video thumbnail (--no-pictures implies --no-video-thumbnails)
-                            downloaded &= self.download_pic(filename=sidecar_filename, url=sidecar_node.display_url,
-                                                            mtime=post.date_local, filename_suffix=suffix)
+                            media.append((None, self._submit_download_pic(filename=sidecar_filename,
+                                                                          url=sidecar_node.display_url,
+                                                                          mtime=post.date_local,
+                                                                          filename_suffix=suffix)))
                         if sidecar_node.is_video and self.download_videos:
                             # pylint:disable=cell-var-from-loop
                             sidecar_filename = self.__prepare_filename(filename_template,
                                                                        lambda: sidecar_node.video_url)
                             # Download sidecar video if desired
-                            downloaded &= self.download_pic(filename=sidecar_filename, url=sidecar_node.video_url,
-                                                            mtime=post.date_local, filename_suffix=suffix)
+                            media.append((None, self._submit_download_pic(filename=sidecar_filename,
+                                                                          url=sidecar_node.video_url,
+                                                                          mtime=post.date_local,
+                                                                          filename_suffix=suffix)))
                 else:
                     downloaded = False
         elif post.typename == 'GraphImage':
             # Download picture
             if self.download_pictures:
-                downloaded = (not _already_downloaded(filename + ".jpg") and
-                              self.download_pic(filename=filename, url=post.url, mtime=post.date_local))
+                if _already_downloaded(filename + ".jpg"):
+                    downloaded = False
+                else:
+                    media.append((None, self._submit_download_pic(filename=filename, url=post.url,
+                                                                  mtime=post.date_local)))
         elif post.typename == 'GraphVideo':
             # Download video thumbnail (--no-pictures implies --no-video-thumbnails)
             if self.download_pictures and self.download_video_thumbnails:
-                with self.context.error_catcher("Video thumbnail of {}".format(post)):
-                    downloaded = (not _already_downloaded(filename + ".jpg") and
-                                  self.download_pic(filename=filename, url=post.url, mtime=post.date_local))
+                description = "Video thumbnail of {}".format(post)
+                with self.context.error_catcher(description):
+                    if _already_downloaded(filename + ".jpg"):
+                        downloaded = False
+                    else:
+                        media.append((description, self._submit_download_pic(filename=filename, url=post.url,
+                                                                             mtime=post.date_local)))
         else:
             self.context.error("Warning: {0} has unknown typename: {1}".format(post, post.typename))
 
@@ -774,8 +859,12 @@ class Instaloader:
 
         # Download video if desired
         if post.is_video and self.download_videos:
-            downloaded &= (not _already_downloaded(filename + ".mp4") and
-                           self.download_pic(filename=filename, url=post.video_url, mtime=post.date_local))
+            video_url = post.video_url
+            if video_url is None or _already_downloaded(filename + ".mp4"):
+                downloaded = False
+            else:
+                media.append((None, self._submit_download_pic(filename=filename, url=video_url,
+                                                              mtime=post.date_local)))
 
         # Download geotags if desired
         if self.download_geotags and post.location:
@@ -789,8 +878,19 @@ class Instaloader:
         if self.save_metadata:
             self.save_metadata_json(filename, post)
 
-        self.context.log()
-        return downloaded
+        def finish() -> bool:
+            wait([future for _, future in media])
+            result = downloaded
+            for description, future in media:
+                if description is None:
+                    result &= future.result()
+                else:
+                    with self.context.error_catcher(description):
+                        result &= future.result()
+            self.context.log()
+            return result
+
+        return finish
 
     @_requires_login
     def get_stories(self, userids: Optional[List[int]] = None) -> Iterator[Story]:
@@ -890,7 +990,7 @@ class Instaloader:
         """
 
         def _already_downloaded(path: str) -> bool:
-            if not os.path.isfile(path):
+            if not self._isfile(path):
                 return False
             else:
                 self.context.log(path + ' exists', end=' ', flush=True)
@@ -1013,6 +1113,11 @@ class Instaloader:
         .. versionchanged:: 4.10.3
            Add `possibly_pinned` parameter.
 
+        .. versionchanged:: 4.15
+           The pictures and videos of up to :attr:`max_concurrent_downloads` posts are downloaded while the
+           following posts are being iterated, and a :class:`NodeIterator` prefetches its next page. Their output
+           lines may then interleave.
+
         :param posts: Post Iterator to loop through.
         :param target: Target name.
         :param fast_update: :option:`--fast-update`.
@@ -1031,6 +1136,22 @@ class Instaloader:
             sanitized_target = _PostPathFormatter.sanitize_path(target, self.sanitize_paths)
         if takewhile is None:
             takewhile = lambda _: True
+        if isinstance(posts, NodeIterator) and self.max_concurrent_downloads > 1:
+            posts.prefetch = True
+        # Posts whose pictures and videos are still being downloaded, oldest first
+        pending: Deque[Tuple[int, Post, Callable[[], bool], bool]] = deque()
+
+        def finish_oldest() -> bool:
+            """Wait for the oldest pending post and return whether fast_update stops the loop."""
+            number, post, finish, post_changed = pending.popleft()
+            with self.context.error_catcher("Download {} of {}".format(post, target)):
+                downloaded = finish()
+                if fast_update and not downloaded and not post_changed and number > possibly_pinned:
+                    # disengage fast_update for first post when resuming
+                    if not is_resuming or number > 0:
+                        return True
+            return False
+
         with resumable_iteration(
                 context=self.context,
                 iterator=posts,
@@ -1042,46 +1163,50 @@ class Instaloader:
                 check_bbd=self.check_resume_bbd,
                 enabled=self.resume_prefix is not None
         ) as (is_resuming, start_index):
-            for number, post in enumerate(posts, start=start_index + 1):
-                should_stop = not takewhile(post)
-                if should_stop and number <= possibly_pinned:
-                    continue
-                if (max_count is not None and number > max_count) or should_stop:
-                    break
-                if displayed_count is not None:
-                    self.context.log("[{0:{w}d}/{1:{w}d}] ".format(number, displayed_count,
-                                                                   w=len(str(displayed_count))),
-                                     end="", flush=True)
-                else:
-                    self.context.log("[{:3d}] ".format(number), end="", flush=True)
-                if post_filter is not None:
-                    try:
-                        if not post_filter(post):
-                            self.context.log("{} skipped".format(post))
-                            continue
-                    except (InstaloaderException, KeyError, TypeError) as err:
-                        self.context.error("{} skipped. Filter evaluation failed: {}".format(post, err))
+            try:
+                for number, post in enumerate(posts, start=start_index + 1):
+                    should_stop = not takewhile(post)
+                    if should_stop and number <= possibly_pinned:
                         continue
-                with self.context.error_catcher("Download {} of {}".format(post, target)):
-                    # The PostChangedException gets raised if the Post's id/shortcode changed while obtaining
-                    # additional metadata. This is most likely the case if a HTTP redirect takes place while
-                    # resolving the shortcode URL.
-                    # The `post_changed` variable keeps the fast-update functionality alive: A Post which is
-                    # obained after a redirect has probably already been downloaded as a previous Post of the
-                    # same Profile.
-                    # Observed in issue #225: https://github.com/instaloader/instaloader/issues/225
-                    post_changed = False
-                    while True:
+                    if (max_count is not None and number > max_count) or should_stop:
+                        break
+                    if displayed_count is not None:
+                        self.context.log("[{0:{w}d}/{1:{w}d}] ".format(number, displayed_count,
+                                                                       w=len(str(displayed_count))),
+                                         end="", flush=True)
+                    else:
+                        self.context.log("[{:3d}] ".format(number), end="", flush=True)
+                    if post_filter is not None:
                         try:
-                            downloaded = self.download_post(post, target=target)
-                            break
-                        except PostChangedException:
-                            post_changed = True
+                            if not post_filter(post):
+                                self.context.log("{} skipped".format(post))
+                                continue
+                        except (InstaloaderException, KeyError, TypeError) as err:
+                            self.context.error("{} skipped. Filter evaluation failed: {}".format(post, err))
                             continue
-                    if fast_update and not downloaded and not post_changed and number > possibly_pinned:
-                        # disengage fast_update for first post when resuming
-                        if not is_resuming or number > 0:
-                            break
+                    with self.context.error_catcher("Download {} of {}".format(post, target)):
+                        # The PostChangedException gets raised if the Post's id/shortcode changed while obtaining
+                        # additional metadata. This is most likely the case if a HTTP redirect takes place while
+                        # resolving the shortcode URL.
+                        # The `post_changed` variable keeps the fast-update functionality alive: A Post which is
+                        # obained after a redirect has probably already been downloaded as a previous Post of the
+                        # same Profile.
+                        # Observed in issue #225: https://github.com/instaloader/instaloader/issues/225
+                        post_changed = False
+                        while True:
+                            try:
+                                finish = self._download_post(post, target=target)
+                                break
+                            except PostChangedException:
+                                post_changed = True
+                                continue
+                        pending.append((number, post, finish, post_changed))
+                    if len(pending) >= self.max_concurrent_downloads and finish_oldest():
+                        break
+            finally:
+                # Resuming continues after the last iterated post, so all of them need to be complete
+                while pending:
+                    finish_oldest()
 
     @_requires_login
     def get_feed_posts(self) -> Iterator[Post]:
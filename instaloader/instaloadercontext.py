@@ -1,22 +1,28 @@
+import bisect
 import json
 import os
 import pickle
 import random
-import shutil
+import sqlite3
 import sys
 import textwrap
+import threading
 import time
 import urllib.parse
 import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager, suppress
 from datetime import datetime, timedelta
 from functools import partial
-from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from typing import Any, Callable, Deque, Dict, IO, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import requests
+import requests.adapters
 import requests.utils
 
 from .exceptions import *
+from .responsecache import ResponseCache
 
 
 def copy_session(session: requests.Session, request_timeout: Optional[float] = None) -> requests.Session:
@@ -63,6 +69,55 @@ def default_iphone_headers() -> Dict[str, Any]:
             'x-whatsapp': '0'}
 
 
+class DownloadStats(NamedTuple):
+    """Statistics of a file written by :meth:`InstaloaderContext.write_raw`.
+
+    .. versionadded:: 4.15"""
+    size: int
+    seconds: float
+    resumed_from: int
+    segments: int
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second transferred by this download, not counting resumed bytes."""
+        return (self.size - self.resumed_from) / self.seconds if self.seconds > 0 else 0.0
+
+
+class _CountingHTTPAdapter(requests.adapters.HTTPAdapter):
+    """HTTPAdapter that counts sent requests and newly opened connections."""
+
+    def __init__(self, *args, **kwargs):
+        self._stats_lock = threading.Lock()
+        self.requests_sent = 0
+        self.connections_opened = 0
+        super().__init__(*args, **kwargs)
+
+    def count_connection(self):
+        """Count a new connection opened by one of the pools"""
+        with self._stats_lock:
+            self.connections_opened += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        def counting(pool_class):
+            class CountingConnectionPool(pool_class):  # pylint:disable=too-few-public-methods
+                def _new_conn(self):
+                    adapter.count_connection()
+                    return super()._new_conn()
+            return CountingConnectionPool
+
+        self.poolmanager.pool_classes_by_scheme = {scheme: counting(pool_class) for scheme, pool_class
+                                                   in self.poolmanager.pool_classes_by_scheme.items()}
+
+    def send(self, request, *args, **kwargs):  # pylint:disable=signature-differs
+        with self._stats_lock:
+            self.requests_sent += 1
+        return super().send(request, *args, **kwargs)
+
+
 class InstaloaderContext:
     """Class providing methods for (error) logging and low-level communication with Instagram.
 
@@ -82,11 +137,25 @@ class InstaloaderContext:
                  max_connection_attempts: int = 3, request_timeout: float = 300.0,
                  rate_controller: Optional[Callable[["InstaloaderContext"], "RateController"]] = None,
                  fatal_status_codes: Optional[List[int]] = None,
-                 iphone_support: bool = True):
+                 iphone_support: bool = True,
+                 media_pool_connections: int = 10,
+                 media_pool_maxsize: int = 10,
+                 response_cache: Optional[ResponseCache] = None,
+                 transport: Optional[requests.adapters.BaseAdapter] = None):
 
         self.user_agent = user_agent if user_agent is not None else default_user_agent()
         self.request_timeout = request_timeout
+        # Adapter that all sessions send their requests through instead of the network, e.g. to record or replay
+        self.transport = transport
         self._session = self.get_anonymous_session()
+        self.media_pool_connections = media_pool_connections
+        self.media_pool_maxsize = media_pool_maxsize
+        self._media_session: Optional[requests.Session] = None
+        self._media_session_lock = threading.Lock()
+        # Media download tuning, see write_raw()
+        self.io_buffer_size = 1024 * 1024
+        self.download_segments = 1
+        self.segment_threshold = 16 * 1024 * 1024
         self.username = None
         self.user_id = None
         self.sleep = sleep
@@ -111,6 +180,10 @@ class InstaloaderContext:
         # Cache profile from id (mapping from id to Profile)
         self.profile_id_cache: Dict[int, Any] = dict()
 
+        # On-disk cache of JSON responses, and whether to ignore stored responses and refresh them
+        self.response_cache = response_cache
+        self.bypass_response_cache = False
+
     @contextmanager
     def anonymous_copy(self):
         session = self._session
@@ -163,6 +236,10 @@ class InstaloaderContext:
             for err in self.error_log:
                 print(err, file=sys.stderr)
         self._session.close()
+        if self._media_session is not None:
+            self._media_session.close()
+            self._media_session = None
+        self._rate_controller.close()
 
     @contextmanager
     def error_catcher(self, extra_info: Optional[str] = None):
@@ -209,8 +286,49 @@ class InstaloaderContext:
         # Override default timeout behavior.
         # Need to silence mypy bug for this. See: https://github.com/python/mypy/issues/2427
         session.request = partial(session.request, timeout=self.request_timeout) # type: ignore
+        return self._mount_transport(session)
+
+    def _mount_transport(self, session: requests.Session) -> requests.Session:
+        if self.transport is not None:
+            session.mount('https://', self.transport)
+            session.mount('http://', self.transport)
         return session
 
+    @property
+    def media_session(self) -> requests.Session:
+        """Long-lived anonymous session used for downloading media files from the CDN.
+
+        Unlike sessions from :meth:`get_anonymous_session`, it is shared by all downloads, so connections are kept alive
+        and reused across files instead of paying a new TCP and TLS handshake for each one. Its connection pool caches
+        pools for up to ``media_pool_connections`` hosts and keeps up to ``media_pool_maxsize`` connections per host.
+        It is safe to use from multiple threads.
+
+        .. versionadded:: 4.15"""
+        if self._media_session is None:
+            with self._media_session_lock:
+                if self._media_session is None:
+                    session = self.get_anonymous_session()
+                    if self.transport is None:
+                        adapter = _CountingHTTPAdapter(pool_connections=self.media_pool_connections,
+                                                       pool_maxsize=self.media_pool_maxsize)
+                        session.mount('https://', adapter)
+                        session.mount('http://', adapter)
+                    self._media_session = session
+        return self._media_session
+
+    def media_session_stats(self) -> Dict[str, int]:
+        """Number of requests done with :attr:`media_session`, and how many of them opened a new connection rather than
+        reusing a kept-alive one.
+
+        .. versionadded:: 4.15"""
+        adapter = self.media_session.get_adapter('https://')
+        if not isinstance(adapter, _CountingHTTPAdapter):
+            return {'requests': 0, 'connections_opened': 0, 'connections_reused': 0}
+        with adapter._stats_lock:  # pylint:disable=protected-access
+            return {'requests': adapter.requests_sent,
+                    'connections_opened': adapter.connections_opened,
+                    'connections_reused': max(0, adapter.requests_sent - adapter.connections_opened)}
+
     def save_session(self):
         """Not meant to be used directly, use :meth:`Instaloader.save_session`."""
         return requests.utils.dict_from_cookiejar(self._session.cookies)
@@ -228,7 +346,7 @@ class InstaloaderContext:
         # Override default timeout behavior.
         # Need to silence mypy bug for this. See: https://github.com/python/mypy/issues/2427
         session.request = partial(session.request, timeout=self.request_timeout)  # type: ignore
-        self._session = session
+        self._session = self._mount_transport(session)
         self.username = username
 
     def save_session_to_file(self, sessionfile):
@@ -273,6 +391,7 @@ class InstaloaderContext:
         # Override default timeout behavior.
         # Need to silence mypy bug for this. See: https://github.com/python/mypy/issues/2427
         session.request = partial(session.request, timeout=self.request_timeout) # type: ignore
+        self._mount_transport(session)
 
         # Make a request to Instagram's root URL, which will set the session's csrftoken cookie
         # Not using self.get_json() here, because we need to access the cookie
@@ -295,7 +414,7 @@ class InstaloaderContext:
                 "Login error: JSON decode fail, {} - {}.".format(login.status_code, login.reason)
             ) from err
         if resp_json.get('two_factor_required'):
-            two_factor_session = copy_session(session, self.request_timeout)
+            two_factor_session = self._mount_transport(copy_session(session, self.request_timeout))
             two_factor_session.headers.update({'X-CSRFToken': csrf_token})
             two_factor_session.cookies.update({'csrftoken': csrf_token})
             self.two_factor_auth_pending = (two_factor_session,
@@ -401,7 +520,21 @@ class InstaloaderContext:
 
         .. versionchanged:: 4.13
            Added `use_post` parameter.
+
+        .. versionchanged:: 4.15
+           Responses are taken from and stored to :attr:`response_cache`, if set. :attr:`bypass_response_cache`
+           skips the lookup but still stores the fresh response.
         """
+        cache = self.response_cache
+        if cache is not None:
+            cache_endpoint = cache.endpoint(path, params)
+            cache_key = cache.key(host, path, params, self.username, use_post)
+            if not self.bypass_response_cache:
+                cached_json = cache.get(cache_endpoint, cache_key)
+                if cached_json is not None:
+                    if response_headers is not None:
+                        response_headers.clear()
+                    return cached_json
         is_graphql_query = 'query_hash' in params and 'graphql/query' in path
         is_doc_id_query = 'doc_id' in params and 'graphql/query' in path
         is_iphone_query = host == 'i.instagram.com'
@@ -458,6 +591,8 @@ class InstaloaderContext:
                 resp_json = resp.json()
             if 'status' in resp_json and resp_json['status'] != "ok":
                 raise ConnectionException(self._response_error(resp))
+            if cache is not None:
+                cache.put(cache_endpoint, cache_key, resp_json)
             return resp_json
         except (ConnectionException, json.decoder.JSONDecodeError, requests.exceptions.RequestException) as err:
             error_string = "JSON Query to {}: {}".format(path, err)
@@ -496,7 +631,7 @@ class InstaloaderContext:
         .. versionchanged:: 4.13.1
            Removed the `rhx_gis` parameter.
         """
-        with copy_session(self._session, self.request_timeout) as tmpsession:
+        with self._mount_transport(copy_session(self._session, self.request_timeout)) as tmpsession:
             tmpsession.headers.update(self._default_http_header(empty_session_only=True))
             del tmpsession.headers['Connection']
             del tmpsession.headers['Content-Length']
@@ -528,7 +663,7 @@ class InstaloaderContext:
         :param referer: HTTP Referer, or None.
         :return: The server's response dictionary.
         """
-        with copy_session(self._session, self.request_timeout) as tmpsession:
+        with self._mount_transport(copy_session(self._session, self.request_timeout)) as tmpsession:
             tmpsession.headers.update(self._default_http_header(empty_session_only=True))
             del tmpsession.headers['Connection']
             del tmpsession.headers['Content-Length']
@@ -597,7 +732,7 @@ class InstaloaderContext:
         :raises ConnectionException: When query repeatedly failed.
 
         .. versionadded:: 4.2.1"""
-        with copy_session(self._session, self.request_timeout) as tempsession:
+        with self._mount_transport(copy_session(self._session, self.request_timeout)) as tempsession:
             # Set headers to simulate an API request from iPad
             tempsession.headers['ig-intended-user-id'] = str(self.user_id)
             tempsession.headers['x-pigeon-rawclienttime'] = '{:.6f}'.format(time.time())
@@ -650,17 +785,133 @@ class InstaloaderContext:
 
             return response
 
-    def write_raw(self, resp: Union[bytes, requests.Response], filename: str) -> None:
+    def write_raw(self, resp: Union[bytes, requests.Response], filename: str) -> DownloadStats:
         """Write raw response data into a file.
 
-        .. versionadded:: 4.2.1"""
+        Data is written to ``filename.temp`` first, which is renamed once it is complete. The ``ETag`` or
+        ``Last-Modified`` header of the response is saved to ``filename.temp.validator`` meanwhile. If a ``.temp`` file
+        is left over from an interrupted download and the server supports ranges, only the missing part is requested,
+        provided that the file has not changed on the server since.
+        Files of at least :attr:`segment_threshold` bytes are downloaded in :attr:`download_segments` parallel ranges.
+        Data is copied in blocks of :attr:`io_buffer_size` bytes.
+
+        .. versionadded:: 4.2.1
+
+        .. versionchanged:: 4.15
+           Resumes interrupted downloads, optionally downloads large files in parallel segments and returns
+           :class:`DownloadStats`. The throughput is logged for files of 1 MiB and more."""
         self.log(filename, end=' ', flush=True)
-        with open(filename + '.temp', 'wb') as file:
-            if isinstance(resp, requests.Response):
-                shutil.copyfileobj(resp.raw, file)
-            else:
+        temp_filename = filename + '.temp'
+        start = time.perf_counter()
+        resumed_from, segments = 0, 1
+        if isinstance(resp, requests.Response):
+            try:
+                resumed_from, segments = self._write_response(resp, temp_filename)
+            finally:
+                # Hand the connection back to the media session's pool
+                resp.close()
+        else:
+            with open(temp_filename, 'wb') as file:
                 file.write(resp)
-        os.replace(filename + '.temp', filename)
+        size = os.path.getsize(temp_filename)
+        os.replace(temp_filename, filename)
+        with suppress(FileNotFoundError):
+            os.remove(temp_filename + '.validator')
+        stats = DownloadStats(size, time.perf_counter() - start, resumed_from, segments)
+        if size >= 1024 * 1024:
+            self.log("[{:.1f} MiB, {:.1f} MiB/s]".format(size / 1024 ** 2, stats.throughput / 1024 ** 2),
+                     end=' ', flush=True)
+        return stats
+
+    def _write_response(self, resp: requests.Response, temp_filename: str) -> Tuple[int, int]:
+        """Write the body of resp to temp_filename, resuming or splitting it into ranges if possible.
+
+        :return: Number of bytes that were already there and number of segments."""
+        length = int(resp.headers.get('Content-Length') or -1)
+        supports_ranges = (resp.status_code == 200 and length > 0 and resp.headers.get('Accept-Ranges') == 'bytes'
+                           and 'Content-Encoding' not in resp.headers)
+        partial_size = os.path.getsize(temp_filename) if os.path.isfile(temp_filename) else 0
+        validator_filename = temp_filename + '.validator'
+        # The validator of the response the interrupted download started with, without which it cannot be resumed
+        saved_validator = None
+        if supports_ranges and 0 < partial_size < length:
+            with suppress(FileNotFoundError):
+                with open(validator_filename) as validator_file:
+                    saved_validator = validator_file.read().strip() or None
+        if saved_validator is not None:
+            resp.close()
+            resp = self._get_range(resp.url, {'Range': 'bytes={}-'.format(partial_size), 'If-Range': saved_validator})
+            try:
+                if (resp.status_code == 206 and
+                        resp.headers.get('Content-Range', '').endswith('{}-{}/{}'.format(partial_size, length - 1,
+                                                                                         length))):
+                    with open(temp_filename, 'ab') as file:
+                        self._copy_raw(resp.raw, file)
+                    return partial_size, 1
+                if resp.status_code != 200:
+                    raise ConnectionException(self._response_error(resp))
+                # The file changed since the interrupted download, start over with the full response
+                self._write_full(resp, temp_filename)
+                return 0, 1
+            finally:
+                resp.close()
+        if supports_ranges and self.download_segments > 1 and length >= self.segment_threshold:
+            resp.close()
+            self._write_segments(resp.url, temp_filename, length)
+            return 0, self.download_segments
+        self._write_full(resp, temp_filename)
+        return 0, 1
+
+    def _write_full(self, resp: requests.Response, temp_filename: str) -> None:
+        validator = resp.headers.get('ETag') or resp.headers.get('Last-Modified')
+        validator_filename = temp_filename + '.validator'
+        if validator:
+            with open(validator_filename, 'w') as validator_file:
+                validator_file.write(validator)
+        else:
+            with suppress(FileNotFoundError):
+                os.remove(validator_filename)
+        with open(temp_filename, 'wb') as file:
+            self._copy_raw(resp.raw, file)
+
+    def _get_range(self, url: str, headers: Dict[str, str]) -> requests.Response:
+        resp = self.media_session.get(url, stream=True, headers=headers)
+        resp.raw.decode_content = True
+        return resp
+
+    def _copy_raw(self, raw: Any, file: IO[bytes]) -> int:
+        buffer = bytearray(self.io_buffer_size)
+        view = memoryview(buffer)
+        copied = 0
+        while True:
+            count = raw.readinto(buffer)
+            if not count:
+                return copied
+            file.write(view[:count])
+            copied += count
+
+    def _write_segments(self, url: str, temp_filename: str, length: int) -> None:
+        with open(temp_filename, 'wb') as file:
+            file.truncate(length)
+        segment_length = -(-length // self.download_segments)
+
+        def write_segment(offset: int) -> None:
+            end = min(offset + segment_length, length) - 1
+            resp = self._get_range(url, {'Range': 'bytes={}-{}'.format(offset, end)})
+            try:
+                if resp.status_code != 206 or not resp.headers.get('Content-Range', '').startswith(
+                        'bytes {}-{}/'.format(offset, end)):
+                    raise ConnectionException(self._response_error(resp))
+                with open(temp_filename, 'r+b') as file:
+                    file.seek(offset)
+                    if self._copy_raw(resp.raw, file) != end - offset + 1:
+                        raise ConnectionException("Incomplete segment {}-{} of {}".format(offset, end, url))
+            finally:
+                resp.close()
+
+        with ThreadPoolExecutor(max_workers=self.download_segments) as executor:
+            for future in [executor.submit(write_segment, offset) for offset in range(0, length, segment_length)]:
+                future.result()
 
     def get_raw(self, url: str, _attempt=1) -> requests.Response:
         """Downloads a file anonymously.
@@ -669,9 +920,11 @@ class InstaloaderContext:
         :raises QueryReturnedForbiddenException: When the server responds with a 403.
         :raises ConnectionException: When download failed.
 
-        .. versionadded:: 4.2.1"""
-        with self.get_anonymous_session() as anonymous_session:
-            resp = anonymous_session.get(url, stream=True)
+        .. versionadded:: 4.2.1
+
+        .. versionchanged:: 4.15
+           Uses the pooled :attr:`media_session`."""
+        resp = self.media_session.get(url, stream=True)
         if resp.status_code == 200:
             resp.raw.decode_content = True
             return resp
@@ -700,9 +953,11 @@ class InstaloaderContext:
         :raises ConnectionException: When request failed.
 
         .. versionadded:: 4.7.6
+
+        .. versionchanged:: 4.15
+           Uses the pooled :attr:`media_session`.
         """
-        with self.get_anonymous_session() as anonymous_session:
-            resp = anonymous_session.head(url, allow_redirects=allow_redirects)
+        resp = self.media_session.head(url, allow_redirects=allow_redirects)
         if resp.status_code == 200:
             return resp
         else:
@@ -715,6 +970,44 @@ class InstaloaderContext:
             raise ConnectionException(self._response_error(resp))
 
 
+class _SlidingWindow:
+    """Timestamps within the last ``length`` seconds, oldest first.
+
+    Timestamps must be added and the window must be queried with non-decreasing times, so that expired timestamps
+    can be evicted from the left in amortized constant time. Adding a timestamp evicts the expired ones too, so a
+    window that is only added to does not grow beyond the timestamps of the last ``length`` seconds."""
+
+    def __init__(self, length: float):
+        self.length = length
+        self._timestamps: Deque[float] = deque()
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def add(self, timestamp: float) -> None:
+        self._timestamps.append(timestamp)
+        self._evict(timestamp)
+
+    def _evict(self, current_time: float) -> None:
+        timestamps = self._timestamps
+        while timestamps and timestamps[0] <= current_time - self.length:
+            timestamps.popleft()
+
+    def count(self, current_time: float) -> int:
+        """Number of timestamps within the window ending at current_time."""
+        self._evict(current_time)
+        return len(self._timestamps)
+
+    def oldest(self, current_time: float) -> float:
+        """Oldest timestamp within the window ending at current_time."""
+        self._evict(current_time)
+        return self._timestamps[0]
+
+    def count_since(self, since: float) -> int:
+        """Number of timestamps later than since, which may lie within the window."""
+        return len(self._timestamps) - bisect.bisect_right(self._timestamps, since)  # type: ignore
+
+
 class RateController:
     """
     Class providing request tracking and rate controlling to stay within rate limits.
@@ -729,13 +1022,28 @@ class RateController:
                raise MyCustomException()
 
        L = instaloader.Instaloader(rate_controller=lambda ctx: MyRateController(ctx))
+
+    .. versionchanged:: 4.15
+       Queries are tracked in sliding windows that cost amortized constant time per query. The `current_time`
+       passed to :meth:`query_waittime` must therefore not decrease between calls.
     """
 
+    _per_type_sliding_window = 660
+    _iphone_sliding_window = 1800
+    _gql_accumulated_sliding_window = 600
+    _history_length = 60 * 60
+
     def __init__(self, context: InstaloaderContext):
         self._context = context
-        self._query_timestamps: Dict[str, List[float]] = dict()
+        # Per query type, the query times within each of the windows that are checked for that type
+        self._query_timestamps: Dict[str, Dict[float, _SlidingWindow]] = dict()
+        # All GraphQL queries, i.e. not 'iphone' or 'other'
+        self._graphql_timestamps = _SlidingWindow(self._gql_accumulated_sliding_window)
         self._earliest_next_request_time = 0.0
         self._iphone_earliest_next_request_time = 0.0
+        # Held from the wait time calculation until the query is recorded, so that queries from several threads,
+        # such as a prefetching NodeIterator, cannot together exceed the limits
+        self._lock = threading.Lock()
 
     def sleep(self, secs: float):
         """Wait given number of seconds."""
@@ -743,13 +1051,27 @@ class RateController:
         # whether we are logged in.
         time.sleep(secs)
 
+    def _windows(self, query_type: str) -> Dict[float, _SlidingWindow]:
+        if query_type not in self._query_timestamps:
+            self._query_timestamps[query_type] = {length: _SlidingWindow(length) for length in
+                                                  (self._per_type_sliding_window, self._iphone_sliding_window,
+                                                   self._history_length)}
+        return self._query_timestamps[query_type]
+
+    def _record_query(self, query_type: str, timestamp: float) -> None:
+        for window in self._windows(query_type).values():
+            window.add(timestamp)
+        if query_type not in ['iphone', 'other']:
+            self._graphql_timestamps.add(timestamp)
+
     def _dump_query_timestamps(self, current_time: float, failed_query_type: str):
         windows = [10, 11, 20, 22, 30, 60]
         self._context.error("Number of requests within last {} minutes grouped by type:"
                             .format('/'.join(str(w) for w in windows)),
                             repeat_at_end=False)
-        for query_type, times in self._query_timestamps.items():
-            reqs_in_sliding_window = [sum(t > current_time - w * 60 for t in times) for w in windows]
+        for query_type, windows_of_type in self._query_timestamps.items():
+            history = windows_of_type[self._history_length]
+            reqs_in_sliding_window = [history.count_since(current_time - w * 60) for w in windows]
             self._context.error(" {} {:>32}: {}".format(
                 "*" if query_type == failed_query_type else " ",
                 query_type,
@@ -766,61 +1088,43 @@ class RateController:
         # whether we are logged in.
         return 75 if query_type == 'other' else 200
 
-    def _reqs_in_sliding_window(self, query_type: Optional[str], current_time: float, window: float) -> List[float]:
-        if query_type is not None:
-            # timestamps of type query_type
-            relevant_timestamps = self._query_timestamps[query_type]
-        else:
-            # all GraphQL queries, i.e. not 'iphone' or 'other'
-            graphql_query_timestamps = filter(lambda tp: tp[0] not in ['iphone', 'other'],
-                                              self._query_timestamps.items())
-            relevant_timestamps = [t for times in (tp[1] for tp in graphql_query_timestamps) for t in times]
-        return list(filter(lambda t: t > current_time - window, relevant_timestamps))
-
     def query_waittime(self, query_type: str, current_time: float, untracked_queries: bool = False) -> float:
         """Calculate time needed to wait before query can be executed."""
-        per_type_sliding_window = 660
-        iphone_sliding_window = 1800
-        if query_type not in self._query_timestamps:
-            self._query_timestamps[query_type] = []
-        self._query_timestamps[query_type] = list(filter(lambda t: t > current_time - 60 * 60,
-                                                         self._query_timestamps[query_type]))
+        per_type_sliding_window = self._per_type_sliding_window
+        iphone_sliding_window = self._iphone_sliding_window
+        windows = self._windows(query_type)
+        per_type_window = windows[per_type_sliding_window]
+        iphone_window = windows[iphone_sliding_window]
 
         def per_type_next_request_time():
-            reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time, per_type_sliding_window)
-            if len(reqs_in_sliding_window) < self.count_per_sliding_window(query_type):
+            if per_type_window.count(current_time) < self.count_per_sliding_window(query_type):
                 return 0.0
             else:
-                return min(reqs_in_sliding_window) + per_type_sliding_window + 6
+                return per_type_window.oldest(current_time) + per_type_sliding_window + 6
 
         def gql_accumulated_next_request_time():
             if query_type in ['iphone', 'other']:
                 return 0.0
-            gql_accumulated_sliding_window = 600
             gql_accumulated_max_count = 275
-            reqs_in_sliding_window = self._reqs_in_sliding_window(None, current_time, gql_accumulated_sliding_window)
-            if len(reqs_in_sliding_window) < gql_accumulated_max_count:
+            if self._graphql_timestamps.count(current_time) < gql_accumulated_max_count:
                 return 0.0
             else:
-                return min(reqs_in_sliding_window) + gql_accumulated_sliding_window
+                return self._graphql_timestamps.oldest(current_time) + self._gql_accumulated_sliding_window
 
         def untracked_next_request_time():
             if untracked_queries:
                 if query_type == "iphone":
-                    reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time,
-                                                                          iphone_sliding_window)
-                    self._iphone_earliest_next_request_time = min(reqs_in_sliding_window) + iphone_sliding_window + 18
+                    self._iphone_earliest_next_request_time = (iphone_window.oldest(current_time) +
+                                                               iphone_sliding_window + 18)
                 else:
-                    reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time,
-                                                                          per_type_sliding_window)
-                    self._earliest_next_request_time = min(reqs_in_sliding_window) + per_type_sliding_window + 6
+                    self._earliest_next_request_time = (per_type_window.oldest(current_time) +
+                                                        per_type_sliding_window + 6)
             return max(self._iphone_earliest_next_request_time, self._earliest_next_request_time)
 
         def iphone_next_request():
             if query_type == "iphone":
-                reqs_in_sliding_window = self._reqs_in_sliding_window(query_type, current_time, iphone_sliding_window)
-                if len(reqs_in_sliding_window) >= 199:
-                    return min(reqs_in_sliding_window) + iphone_sliding_window + 18
+                if iphone_window.count(current_time) >= 199:
+                    return iphone_window.oldest(current_time) + iphone_sliding_window + 18
             return 0.0
 
         return max(0.0,
@@ -836,19 +1140,20 @@ class RateController:
 
         It calls :meth:`RateController.query_waittime` to determine the time needed to wait and then calls
         :meth:`RateController.sleep` to wait until the request can be made."""
-        waittime = self.query_waittime(query_type, time.monotonic(), False)
+        with self._lock:
+            waittime = self.query_waittime(query_type, time.monotonic(), False)
+            self._announce_wait(waittime)
+            if waittime > 0:
+                self.sleep(waittime)
+            self._record_query(query_type, time.monotonic())
+
+    def _announce_wait(self, waittime: float) -> None:
         assert waittime >= 0
         if waittime > 15:
             formatted_waittime = ("{} seconds".format(round(waittime)) if waittime <= 666 else
                                   "{} minutes".format(round(waittime / 60)))
             self._context.log("\nToo many queries in the last time. Need to wait {}, until {:%H:%M}."
                               .format(formatted_waittime, datetime.now() + timedelta(seconds=waittime)))
-        if waittime > 0:
-            self.sleep(waittime)
-        if query_type not in self._query_timestamps:
-            self._query_timestamps[query_type] = [time.monotonic()]
-        else:
-            self._query_timestamps[query_type].append(time.monotonic())
 
     def handle_429(self, query_type: str) -> None:
         """This method is called to handle a 429 Too Many Requests response.
@@ -857,6 +1162,11 @@ class RateController:
         :meth:`RateController.sleep` to wait until we can repeat the same request."""
         current_time = time.monotonic()
         waittime = self.query_waittime(query_type, current_time, True)
+        self._announce_429(query_type, current_time, waittime)
+        if waittime > 0:
+            self.sleep(waittime)
+
+    def _announce_429(self, query_type: str, current_time: float, waittime: float) -> None:
         assert waittime >= 0
         self._dump_query_timestamps(current_time, query_type)
         text_for_429 = ("Instagram responded with HTTP error \"429 - Too Many Requests\". Please do not run multiple "
@@ -869,5 +1179,112 @@ class RateController:
             self._context.error("The request will be retried in {}, at {:%H:%M}."
                                 .format(formatted_waittime, datetime.now() + timedelta(seconds=waittime)),
                                 repeat_at_end=False)
+
+    def close(self) -> None:
+        """Release the resources of the rate controller. Called by :meth:`InstaloaderContext.close`.
+
+        .. versionadded:: 4.15"""
+
+
+class SharedRateController(RateController):
+    """
+    :class:`RateController` that shares its request tracking with all processes using the same ledger file.
+
+    Several Instaloader processes on one host, such as the workers of a web server, otherwise each assume that they
+    have the whole rate limit to themselves. With a shared ledger, every query is recorded in an SQLite database and
+    every process waits until the host as a whole is within the limits. A 429 response received by one process makes
+    all of them back off::
+
+       L = instaloader.Instaloader(rate_controller=lambda ctx: SharedRateController(ctx, "ratelimit.sqlite3"))
+
+    Query times are wall-clock times, as monotonic clocks are not comparable between processes. If the clock is set
+    back, the current time is taken to be the latest query time seen so far until the clock has caught up again, so
+    that the sliding windows never go back in time. If it is set forward, recent queries seem older than they are and
+    are counted for a shorter time.
+
+    :param ledger_path: Path of the SQLite database, created if it does not exist.
+
+    .. versionadded:: 4.15
+    """
+
+    def __init__(self, context: InstaloaderContext, ledger_path: str):
+        super().__init__(context)
+        self.ledger_path = ledger_path
+        self._ledger = sqlite3.connect(ledger_path, timeout=60, isolation_level=None, check_same_thread=False)
+        self._ledger.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            self._ledger.execute("CREATE TABLE IF NOT EXISTS queries "
+                                 "(id INTEGER PRIMARY KEY AUTOINCREMENT, query_type TEXT NOT NULL, time REAL NOT NULL)")
+            self._ledger.execute("CREATE INDEX IF NOT EXISTS queries_time ON queries (time)")
+            self._ledger.execute("CREATE TABLE IF NOT EXISTS earliest_next_request "
+                                 "(name TEXT PRIMARY KEY, time REAL NOT NULL)")
+        # Id of the last ledger entry that has been added to the sliding windows
+        self._last_id = 0
+        # Latest query time seen, which the current time is clamped to
+        self._latest_time = 0.0
+
+    @contextmanager
+    def _transaction(self):
+        # IMMEDIATE takes the write lock right away, so that no other process can record a query between our check
+        # of the limits and our own record
+        self._ledger.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._ledger.execute("ROLLBACK")
+            raise
+        self._ledger.execute("COMMIT")
+
+    def _sync(self) -> float:
+        """Add the queries that have been recorded since the last call to the sliding windows.
+
+        :return: The current time, clamped to be no earlier than any query seen."""
+        current_time = max(time.time(), self._latest_time)
+        for query_id, query_type, query_time in self._ledger.execute(
+                "SELECT id, query_type, time FROM queries WHERE id > ? AND time > ? ORDER BY id",
+                (self._last_id, current_time - self._history_length)):
+            # Another process' clock may be ahead, or may have been set back since it recorded earlier queries
+            query_time = max(query_time, self._latest_time)
+            self._record_query(query_type, query_time)
+            self._latest_time = query_time
+            self._last_id = query_id
+        for name, earliest in self._ledger.execute("SELECT name, time FROM earliest_next_request"):
+            if name == 'iphone':
+                self._iphone_earliest_next_request_time = max(self._iphone_earliest_next_request_time, earliest)
+            else:
+                self._earliest_next_request_time = max(self._earliest_next_request_time, earliest)
+        return max(current_time, self._latest_time)
+
+    def wait_before_query(self, query_type: str) -> None:
+        with self._lock:
+            while True:
+                with self._transaction():
+                    current_time = self._sync()
+                    waittime = self.query_waittime(query_type, current_time, False)
+                    if waittime <= 0:
+                        self._ledger.execute("INSERT INTO queries (query_type, time) VALUES (?, ?)",
+                                             (query_type, current_time))
+                        self._latest_time = current_time
+                        self._ledger.execute("DELETE FROM queries WHERE time <= ?",
+                                             (current_time - self._history_length,))
+                        return
+                # Other processes may have used up the budget while we waited, hence check again
+                self._announce_wait(waittime)
+                self.sleep(waittime)
+
+    def handle_429(self, query_type: str) -> None:
+        with self._lock:
+            with self._transaction():
+                current_time = self._sync()
+                waittime = self.query_waittime(query_type, current_time, True)
+                self._ledger.executemany("INSERT INTO earliest_next_request (name, time) VALUES (?, ?) "
+                                         "ON CONFLICT (name) DO UPDATE SET time = max(time, excluded.time)",
+                                         [('iphone', self._iphone_earliest_next_request_time),
+                                          ('default', self._earliest_next_request_time)])
+        self._announce_429(query_type, current_time, waittime)
         if waittime > 0:
             self.sleep(waittime)
+
+    def close(self) -> None:
+        """Close the connection to the ledger."""
+        self._ledger.close()
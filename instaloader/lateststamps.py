@@ -1,8 +1,11 @@
+import atexit
 import configparser
+import sqlite3
+import threading
 from datetime import datetime, timezone
 from typing import Optional
 from os.path import dirname
-from os import makedirs
+from os import makedirs, replace
 
 
 class LatestStamps:
@@ -10,9 +13,19 @@ class LatestStamps:
 
     Convenience class for retrieving and storing data from the :option:`--latest-stamps` file.
 
+    Updates are written to a temporary file that then replaces the stamps file, so an interrupted write does not
+    corrupt it. With `flush_interval`, updates are buffered and written by a background thread every
+    `flush_interval` seconds, and when :meth:`flush` or :meth:`close` is called, the instance is used as a context
+    manager or the interpreter exits. A process killed by a signal it does not handle loses the buffered updates, the
+    command line therefore turns a SIGTERM into a regular exit.
+
     :param latest_stamps_file: path to file.
+    :param flush_interval: Seconds updates are buffered for, or None to write each update right away.
+
+    .. versionadded:: 4.8
 
-    .. versionadded:: 4.8"""
+    .. versionchanged:: 4.15
+       Writes are atomic. Add `flush_interval`, :meth:`flush` and :meth:`close`."""
     PROFILE_ID = 'profile-id'
     PROFILE_PIC = 'profile-pic'
     POST_TIMESTAMP = 'post-timestamp'
@@ -22,55 +35,110 @@ class LatestStamps:
     STORY_TIMESTAMP = 'story-timestamp'
     ISO_FORMAT = '%Y-%m-%dT%H:%M:%S.%f%z'
 
-    def __init__(self, latest_stamps_file):
+    def __init__(self, latest_stamps_file, flush_interval: Optional[float] = None):
         self.file = latest_stamps_file
+        self.flush_interval = flush_interval
+        self._dirty = False
+        # Held while the data is changed or written, the flush thread writes concurrently to the updates
+        self._lock = threading.RLock()
+        self._closed = threading.Event()
+        self._flush_thread = None
+        self._open()
+        if flush_interval is not None:
+            self._flush_thread = threading.Thread(target=self._flush_periodically, name='latest-stamps-flush',
+                                                  daemon=True)
+            self._flush_thread.start()
+            atexit.register(self.flush)
+
+    def _open(self):
         self.data = configparser.ConfigParser()
-        self.data.read(latest_stamps_file)
+        self.data.read(self.file)
 
     def _save(self):
         if dn := dirname(self.file):
             makedirs(dn, exist_ok=True)
-        with open(self.file, 'w') as f:
+        tmp_file = self.file + '.temp'
+        with open(tmp_file, 'w') as f:
             self.data.write(f)
-
-    def _ensure_section(self, section: str):
-        if not self.data.has_section(section):
-            self.data.add_section(section)
+        replace(tmp_file, self.file)
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def _changed(self):
+        self._dirty = True
+        if self.flush_interval is None:
+            self.flush()
+
+    def flush(self):
+        """Writes buffered updates."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def close(self):
+        """Writes buffered updates and stops writing them periodically and at interpreter exit.
+
+        .. versionadded:: 4.15"""
+        self._closed.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+        self.flush()
+        atexit.unregister(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get(self, section: str, key: str) -> Optional[str]:
+        with self._lock:
+            return self.data.get(section, key, fallback=None)
+
+    def _set(self, section: str, key: str, value: str):
+        with self._lock:
+            if not self.data.has_section(section):
+                self.data.add_section(section)
+            self.data.set(section, key, value)
+            self._changed()
+
+    def _rename(self, old_section: str, new_section: str, keys):
+        with self._lock:
+            if not self.data.has_section(new_section):
+                self.data.add_section(new_section)
+            for key in keys:
+                if self.data.has_option(old_section, key):
+                    self.data.set(new_section, key, self.data.get(old_section, key))
+            self.data.remove_section(old_section)
+            self._changed()
 
     def get_profile_id(self, profile_name: str) -> Optional[int]:
         """Returns stored ID of profile."""
         try:
-            return self.data.getint(profile_name, self.PROFILE_ID)
-        except (configparser.Error, ValueError):
+            return int(self._get(profile_name, self.PROFILE_ID))  # type: ignore
+        except (TypeError, ValueError):
             return None
 
     def save_profile_id(self, profile_name: str, profile_id: int):
         """Stores ID of profile."""
-        self._ensure_section(profile_name)
-        self.data.set(profile_name, self.PROFILE_ID, str(profile_id))
-        self._save()
+        self._set(profile_name, self.PROFILE_ID, str(profile_id))
 
     def rename_profile(self, old_profile: str, new_profile: str):
         """Renames a profile."""
-        self._ensure_section(new_profile)
-        for option in [self.PROFILE_ID, self.PROFILE_PIC, self.POST_TIMESTAMP,
-                       self.TAGGED_TIMESTAMP, self.IGTV_TIMESTAMP, self.STORY_TIMESTAMP]:
-            if self.data.has_option(old_profile, option):
-                value = self.data.get(old_profile, option)
-                self.data.set(new_profile, option, value)
-        self.data.remove_section(old_profile)
-        self._save()
+        self._rename(old_profile, new_profile, [self.PROFILE_ID, self.PROFILE_PIC, self.POST_TIMESTAMP,
+                                                self.TAGGED_TIMESTAMP, self.IGTV_TIMESTAMP, self.STORY_TIMESTAMP])
 
     def _get_timestamp(self, section: str, key: str) -> datetime:
         try:
-            return datetime.strptime(self.data.get(section, key), self.ISO_FORMAT)
-        except (configparser.Error, ValueError):
+            return datetime.strptime(self._get(section, key), self.ISO_FORMAT)  # type: ignore
+        except (TypeError, ValueError):
             return datetime.fromtimestamp(0, timezone.utc)
 
     def _set_timestamp(self, section: str, key: str, timestamp: datetime):
-        self._ensure_section(section)
-        self.data.set(section, key, timestamp.strftime(self.ISO_FORMAT))
-        self._save()
+        self._set(section, key, timestamp.strftime(self.ISO_FORMAT))
 
     def get_last_post_timestamp(self, profile_name: str) -> datetime:
         """Returns timestamp of last download of a profile's posts."""
@@ -114,13 +182,58 @@ class LatestStamps:
 
     def get_profile_pic(self, profile_name: str) -> str:
         """Returns filename of profile's last downloaded profile pic."""
-        try:
-            return self.data.get(profile_name, self.PROFILE_PIC)
-        except configparser.Error:
-            return ""
+        return self._get(profile_name, self.PROFILE_PIC) or ""
 
     def set_profile_pic(self, profile_name: str, profile_pic: str):
         """Sets filename of profile's last downloaded profile pic."""
-        self._ensure_section(profile_name)
-        self.data.set(profile_name, self.PROFILE_PIC, profile_pic)
-        self._save()
+        self._set(profile_name, self.PROFILE_PIC, profile_pic)
+
+
+class SQLiteLatestStamps(LatestStamps):
+    """:class:`LatestStamps` stored in an SQLite database.
+
+    Unlike the INI file of :class:`LatestStamps`, which is rewritten as a whole, an update costs the same regardless
+    of how many profiles are tracked. With `flush_interval`, updates are committed in one transaction every
+    `flush_interval` seconds.
+
+    :param latest_stamps_file: path to the database, created if it does not exist.
+    :param flush_interval: Seconds updates are buffered for, or None to commit each update right away.
+
+    .. versionadded:: 4.15"""
+
+    def _open(self):
+        if dn := dirname(self.file):
+            makedirs(dn, exist_ok=True)
+        # Committed by the flush thread too, always under the lock
+        self._db = sqlite3.connect(self.file, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS stamps (profile TEXT NOT NULL, key TEXT NOT NULL, "
+                             "value TEXT NOT NULL, PRIMARY KEY (profile, key))")
+
+    def _save(self):
+        self._db.commit()
+
+    def close(self):
+        super().close()
+        self._db.close()
+
+    def _get(self, section: str, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM stamps WHERE profile = ? AND key = ?",
+                                   (section, key)).fetchone()
+        return row[0] if row is not None else None
+
+    def _set(self, section: str, key: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO stamps (profile, key, value) VALUES (?, ?, ?)",
+                             (section, key, value))
+            self._changed()
+
+    def _rename(self, old_section: str, new_section: str, keys):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO stamps (profile, key, value) "
+                                 "SELECT ?, key, value FROM stamps WHERE profile = ? AND key = ?",
+                                 [(new_section, old_section, key) for key in keys])
+            self._db.execute("DELETE FROM stamps WHERE profile = ?", (old_section,))
+            self._changed()
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Dict, Set
+
+
+class DownloadManifest:
+    """Index of the pictures and videos in the download directories.
+
+    Pass ``manifest=True`` to :class:`Instaloader` to look up whether a file has already been downloaded in this
+    index rather than asking the file system, which saves one or two ``stat`` calls per picture, video and sidecar
+    node. This matters on network file systems and with large target directories, e.g. with :option:`--fast-update`.
+
+    Each directory gets a manifest file :attr:`FILENAME` listing the names of the downloaded files, one per line. It
+    is read once, when a directory is first looked at, and a line is appended for each file that is written. If it
+    does not exist, it is rebuilt from a single listing of the directory. A last line that lacks its newline, left over
+    from an interrupted write, is dropped. Delete the manifest to rebuild it after removing files from a directory by
+    other means.
+
+    .. versionadded:: 4.15"""
+
+    #: Name of the manifest file in each download directory.
+    FILENAME = '.instaloader-manifest'
+
+    def __init__(self) -> None:
+        self._directories: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, directory: str) -> Set[str]:
+        names = self._directories.get(directory)
+        if names is not None:
+            return names
+        manifest_path = os.path.join(directory or '.', self.FILENAME)
+        try:
+            with open(manifest_path, encoding='utf-8') as manifest:
+                lines = manifest.read().split('\n')
+            torn = lines.pop()
+            names = {line for line in lines if line}
+            if torn:
+                self._write(manifest_path, names)
+        except FileNotFoundError:
+            names = self._scan(directory)
+            if names:
+                self._write(manifest_path, names)
+        self._directories[directory] = names
+        return names
+
+    def _scan(self, directory: str) -> Set[str]:
+        try:
+            with os.scandir(directory or '.') as entries:
+                # Leaves out the manifest and the .temp files of interrupted downloads, see InstaloaderContext.write_raw
+                return {entry.name for entry in entries if entry.name != self.FILENAME and
+                        not entry.name.endswith(('.temp', '.temp.validator')) and entry.is_file()}
+        except FileNotFoundError:
+            return set()
+
+    @staticmethod
+    def _write(manifest_path: str, names: Set[str]) -> None:
+        tmp_path = manifest_path + '.temp'
+        with open(tmp_path, 'w', encoding='utf-8') as manifest:
+            manifest.writelines(name + '\n' for name in sorted(names))
+        os.replace(tmp_path, manifest_path)
+
+    def isfile(self, path: str) -> bool:
+        """Whether the file has been downloaded, like :func:`os.path.isfile`."""
+        directory, name = os.path.split(path)
+        with self._lock:
+            return name in self._load(directory)
+
+    def add(self, path: str) -> None:
+        """Record a file that has just been written."""
+        directory, name = os.path.split(path)
+        with self._lock:
+            names = self._load(directory)
+            if name in names:
+                return
+            names.add(name)
+            with open(os.path.join(directory or '.', self.FILENAME), 'a', encoding='utf-8') as manifest:
+                manifest.write(name + '\n')
+
+    def rebuild(self, directory: str) -> None:
+        """Rebuild the manifest of a directory from the files that are in it."""
+        with self._lock:
+            names = self._scan(directory)
+            if os.path.isdir(directory or '.'):
+                self._write(os.path.join(directory or '.', self.FILENAME), names)
+            self._directories[directory] = names
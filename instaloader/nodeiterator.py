@@ -2,6 +2,8 @@ import base64
 import hashlib
 import json
 import os
+import threading
+from concurrent.futures import Future
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from lzma import LZMAError
@@ -67,8 +69,15 @@ class NodeIterator(Iterator[T]):
 
     See also :func:`resumable_iteration` for a high-level context manager that handles a resumable iteration.
 
+    If :attr:`prefetch` is set, the next page is requested in the background as soon as the first item of the
+    current page has been returned, so that the consumer rarely waits for the network. The background request goes
+    through the same :class:`RateController` as all other queries.
+
     .. versionchanged: 4.13
        Included support for `doc_id`-based queries (using POST method).
+
+    .. versionchanged:: 4.15
+       Added `prefetch` parameter.
     """
 
     _graphql_page_length = 12
@@ -83,7 +92,8 @@ class NodeIterator(Iterator[T]):
                  query_referer: Optional[str] = None,
                  first_data: Optional[Dict[str, Any]] = None,
                  is_first: Optional[Callable[[T, Optional[T]], bool]] = None,
-                 doc_id: Optional[str] = None):
+                 doc_id: Optional[str] = None,
+                 prefetch: bool = False):
         self._context = context
         self._query_hash = query_hash
         self._doc_id = doc_id
@@ -93,6 +103,9 @@ class NodeIterator(Iterator[T]):
         self._query_referer = query_referer
         self._page_index = 0
         self._total_index = 0
+        self.prefetch = prefetch
+        # end_cursor and pending response of the page being prefetched
+        self._prefetched: Optional[Tuple[str, Future]] = None
         if first_data is not None:
             self._data = first_data
             self._best_before = datetime.now() + NodeIterator._shelf_life
@@ -102,12 +115,36 @@ class NodeIterator(Iterator[T]):
         self._is_first = is_first
 
     def _query(self, after: Optional[str] = None) -> Dict:
+        data = self._request_page(after)
+        self._best_before = datetime.now() + NodeIterator._shelf_life
+        return data
+
+    def _request_page(self, after: Optional[str] = None) -> Dict:
         if self._doc_id is not None:
             return self._query_doc_id(self._doc_id, after)
         else:
             assert self._query_hash is not None
             return self._query_query_hash(self._query_hash, after)
 
+    def _start_prefetch(self, after: str) -> None:
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def request():
+            try:
+                future.set_result((self._request_page(after), datetime.now() + NodeIterator._shelf_life))
+            except BaseException as err:  # pylint:disable=broad-except
+                future.set_exception(err)
+
+        self._prefetched = (after, future)
+        threading.Thread(target=request, name='instaloader-prefetch', daemon=True).start()
+
+    def _next_page(self, after: str) -> Tuple[Dict, datetime]:
+        prefetched, self._prefetched = self._prefetched, None
+        if prefetched is not None and prefetched[0] == after:
+            return prefetched[1].result()
+        return self._request_page(after), datetime.now() + NodeIterator._shelf_life
+
     def _query_doc_id(self, doc_id: str, after: Optional[str] = None) -> Dict:
         pagination_variables: Dict[str, Any] = {'__relay_internal__pv__PolarisFeedShareMenurelayprovider': False}
         if after is not None:
@@ -115,25 +152,21 @@ class NodeIterator(Iterator[T]):
             pagination_variables['before'] = None
             pagination_variables['first'] = 12
             pagination_variables['last'] = None
-        data = self._edge_extractor(
+        return self._edge_extractor(
             self._context.doc_id_graphql_query(
                 doc_id, {**self._query_variables, **pagination_variables}, self._query_referer
             )
         )
-        self._best_before = datetime.now() + NodeIterator._shelf_life
-        return data
 
     def _query_query_hash(self, query_hash: str, after: Optional[str] = None) -> Dict:
         pagination_variables: Dict[str, Any] = {'first': NodeIterator._graphql_page_length}
         if after is not None:
             pagination_variables['after'] = after
-        data = self._edge_extractor(
+        return self._edge_extractor(
             self._context.graphql_query(
                 query_hash, {**self._query_variables, **pagination_variables}, self._query_referer
             )
         )
-        self._best_before = datetime.now() + NodeIterator._shelf_life
-        return data
 
     def __iter__(self):
         return self
@@ -148,6 +181,9 @@ class NodeIterator(Iterator[T]):
             except KeyboardInterrupt:
                 self._page_index, self._total_index = page_index, total_index
                 raise
+            page_info = self._data.get('page_info', {})
+            if self.prefetch and self._prefetched is None and page_info.get('has_next_page'):
+                self._start_prefetch(page_info['end_cursor'])
             item = self._node_wrapper(node)
             if self._is_first is not None:
                 if self._is_first(item, self.first_item):
@@ -157,14 +193,15 @@ class NodeIterator(Iterator[T]):
                     self._first_node = node
             return item
         if self._data.get('page_info', {}).get('has_next_page'):
-            query_response = self._query(self._data['page_info']['end_cursor'])
+            query_response, best_before = self._next_page(self._data['page_info']['end_cursor'])
             if self._data['edges'] != query_response['edges'] and len(query_response['edges']) > 0:
-                page_index, data = self._page_index, self._data
+                page_index, data, previous_best_before = self._page_index, self._data, self._best_before
                 try:
                     self._page_index = 0
                     self._data = query_response
+                    self._best_before = best_before
                 except KeyboardInterrupt:
-                    self._page_index, self._data = page_index, data
+                    self._page_index, self._data, self._best_before = page_index, data, previous_best_before
                     raise
                 return self.__next__()
         raise StopIteration()
@@ -0,0 +1,164 @@
+import fnmatch
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from os import makedirs
+from os.path import dirname
+from typing import Any, Dict, Optional
+
+
+class ResponseCache:
+    """On-disk cache of JSON responses from Instagram.
+
+    Set it as :attr:`InstaloaderContext.response_cache` (or pass it to :class:`Instaloader`) to answer repeated
+    queries, e.g. when re-running a download or when looking up the same post twice, without sending a request and
+    thus without using up the rate limit.
+
+    Responses are stored in an SQLite database, keyed on host, path, normalized parameters and the logged-in user.
+    How long a response is reused is configured per endpoint, i.e. per GraphQL ``doc_id`` or ``query_hash``, or per
+    path relative to the host for other requests. Responses describing a single post, which do not change, are reused
+    for `default_ttl`. All other responses, such as profiles and the pages of their posts, gain entries as new posts
+    are published and are only reused for `listing_ttl`, so that :option:`--fast-update` still sees new posts. Once
+    the stored responses exceed `max_bytes`, the least recently used ones are deleted.
+
+    :param path: Path of the SQLite database, created if it does not exist.
+    :param default_ttl: Seconds a response of one of the :attr:`IMMUTABLE_ENDPOINTS` is reused, unless overridden in
+       `ttls`.
+    :param ttls: Seconds a response is reused per endpoint. 0 disables caching for that endpoint.
+    :param max_bytes: Size of the stored, compressed responses above which the least recently used are deleted.
+    :param listing_ttl: Seconds a response of any other endpoint is reused, unless overridden in `ttls`.
+
+    .. versionadded:: 4.15"""
+
+    #: Endpoints that are not cached unless overridden in `ttls`: the own feed, which is also used to check whether a
+    #: session is logged in, and the story trays.
+    DEFAULT_TTLS = {'d6f4427fbe92d846298cf93df0b937d3': 0.0,
+                    'd15efd8c0c5b23f0ef71f18bf363c704': 0.0,
+                    '303a4ae99711322310f25250d988f3b7': 0.0}
+
+    #: Endpoints whose responses describe a single post and are reused for `default_ttl`, as glob patterns: the post
+    #: metadata by shortcode and the iPhone media info.
+    IMMUTABLE_ENDPOINTS = ('8845758582119845', 'api/v1/media/*/info/')
+
+    def __init__(self, path: str, default_ttl: float = 24 * 60 * 60, ttls: Optional[Dict[str, float]] = None,
+                 max_bytes: int = 256 * 1024 * 1024, listing_ttl: float = 10 * 60):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.listing_ttl = listing_ttl
+        self.ttls = {**self.DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if dn := dirname(path):
+            makedirs(dn, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires REAL NOT NULL, "
+                             "accessed REAL NOT NULL, size INTEGER NOT NULL, value BLOB NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            # Total size of the stored responses, kept up to date by triggers so that eviction does not need to sum
+            # over all of them
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses_size (total INTEGER NOT NULL)")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN "
+                             "UPDATE responses_size SET total = total + new.size; END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses BEGIN "
+                             "UPDATE responses_size SET total = total - old.size + new.size; END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN "
+                             "UPDATE responses_size SET total = total - old.size; END")
+            if self._db.execute("SELECT 1 FROM responses_size").fetchone() is None:
+                self._db.execute("INSERT INTO responses_size (total) SELECT COALESCE(SUM(size), 0) FROM responses")
+
+    @staticmethod
+    def endpoint(path: str, params: Dict[str, Any]) -> str:
+        """Name of the endpoint a request goes to, as used in `ttls`."""
+        if 'doc_id' in params:
+            return str(params['doc_id'])
+        if 'query_hash' in params:
+            return str(params['query_hash'])
+        return path.split('?')[0]
+
+    @staticmethod
+    def key(host: str, path: str, params: Dict[str, Any], username: Optional[str], use_post: bool = False) -> str:
+        """Cache key of a request, independent of the order of its parameters."""
+        normalized = {}
+        for name, value in params.items():
+            if name == 'variables' and isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except json.decoder.JSONDecodeError:
+                    pass
+            normalized[name] = value
+        request = json.dumps([host, path, normalized, username, use_post], sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    def ttl(self, endpoint: str) -> float:
+        """Seconds a response from the given endpoint is reused."""
+        if endpoint in self.ttls:
+            return self.ttls[endpoint]
+        if any(fnmatch.fnmatchcase(endpoint, pattern) for pattern in self.IMMUTABLE_ENDPOINTS):
+            return self.default_ttl
+        return self.listing_ttl
+
+    def get(self, endpoint: str, key: str) -> Optional[Dict[str, Any]]:
+        """Return the stored, not yet expired response, or None."""
+        if self.ttl(endpoint) <= 0:
+            return None
+        now = time.time()
+        with self._lock, self._db:
+            row = self._db.execute("SELECT value FROM responses WHERE key = ? AND expires > ?", (key, now)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, endpoint: str, key: str, response: Dict[str, Any]) -> None:
+        """Store a response and delete the least recently used ones if the cache got too large."""
+        ttl = self.ttl(endpoint)
+        if ttl <= 0:
+            return
+        now = time.time()
+        value = zlib.compress(json.dumps(response, separators=(',', ':')).encode())
+        with self._lock, self._db:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete would not fire the size trigger
+            self._db.execute("INSERT INTO responses (key, expires, accessed, size, value) VALUES (?, ?, ?, ?, ?) "
+                             "ON CONFLICT (key) DO UPDATE SET expires = excluded.expires, "
+                             "accessed = excluded.accessed, size = excluded.size, value = excluded.value",
+                             (key, now + ttl, now, len(value), value))
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._db.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        total, = self._db.execute("SELECT total FROM responses_size").fetchone()
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+            if excess <= 0:
+                break
+            evicted.append((key,))
+            excess -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """Delete all stored responses."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of hits and misses since the cache was opened."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
@@ -0,0 +1,317 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    """A single unit of work tracked by the JobQueue"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    def __init__(self, url: str, key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.key = key or url
+        self.status = Job.QUEUED
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        # Process running the job, only it updates the record until it exits
+        self.owner = os.getpid()
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (Job.COMPLETED, Job.FAILED)
+
+    @classmethod
+    def from_row(cls, row) -> 'Job':
+        job_id, key, url, status, result, error, owner, created_at, started_at, finished_at = row
+        job = cls(url, key)
+        job.id = job_id
+        job.status = status
+        job.result = json.loads(result) if result is not None else None
+        job.error = error
+        job.owner = owner
+        job.created_at = datetime.fromisoformat(created_at)
+        job.started_at = datetime.fromisoformat(started_at) if started_at else None
+        job.finished_at = datetime.fromisoformat(finished_at) if finished_at else None
+        return job
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+_SELECT_JOB = ("SELECT id, key, url, status, result, error, owner, created_at, started_at, finished_at "
+               "FROM jobs")
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class JobQueue:
+    """Bounded queue of jobs executed by a fixed pool of worker threads.
+
+    :param handler: Callable run by a worker for each job. It is called as
+       ``handler(url, progress)``, where ``progress(stage, **data)`` records an event on the job,
+       and its return value becomes the job result.
+    :param num_workers: Number of worker threads.
+    :param max_queue_size: Number of jobs that may wait for a worker before :meth:`submit`
+       raises :class:`QueueFullError`.
+    :param max_finished_jobs: Number of finished jobs kept around for status lookups.
+    :param path: SQLite file holding the jobs and their events. Every process opening the same
+       file sees all jobs, whichever process runs them, so status lookups may reach any web
+       worker. Without a path, the jobs are only visible to this process.
+    :param poll_interval: Seconds between looks at the file while waiting for the events of a
+       job run by another process.
+
+    Jobs are coalesced by key: submitting while a job with the same key is still queued or
+    running returns that job instead of starting a second pipeline for the same video.
+
+    Unfinished jobs of a process that has exited are marked as failed when they are looked up.
+    """
+
+    def __init__(self,
+                 handler: Callable[..., Dict[str, Any]],
+                 num_workers: int = 2,
+                 max_queue_size: int = 16,
+                 max_finished_jobs: int = 1000,
+                 path: Optional[str] = None,
+                 poll_interval: float = 0.5):
+        self.handler = handler
+        self.num_workers = num_workers
+        self.max_finished_jobs = max_finished_jobs
+        self.poll_interval = poll_interval
+        self._queue: 'queue.Queue[Job]' = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        # Notified whenever a job of this process records an event
+        self._changed = threading.Condition()
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path or ':memory:', timeout=30, check_same_thread=False)
+        with self._db:
+            if path:
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS jobs "
+                             "(id TEXT PRIMARY KEY, key TEXT NOT NULL, url TEXT NOT NULL, "
+                             "status TEXT NOT NULL, result TEXT, error TEXT, owner INTEGER NOT NULL, "
+                             "created_at TEXT NOT NULL, started_at TEXT, finished_at TEXT)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+            # At most one job per key is in flight
+            self._db.execute("CREATE UNIQUE INDEX IF NOT EXISTS jobs_inflight ON jobs (key) "
+                             "WHERE finished_at IS NULL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS job_events "
+                             "(job_id TEXT NOT NULL, id INTEGER NOT NULL, event TEXT NOT NULL, "
+                             "PRIMARY KEY (job_id, id)) WITHOUT ROWID")
+
+    def start(self):
+        """Start the worker threads"""
+        self._stopping.clear()
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logging.info(f"Started {self.num_workers} job workers")
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker threads once the jobs already queued are done"""
+        self._stopping.set()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._workers = []
+
+    def submit(self, url: str, key: Optional[str] = None) -> Job:
+        """Enqueue a job for the given URL, raising QueueFullError if there is no room.
+
+        If a job with the same key (defaults to the URL) is already in flight in any process,
+        that job is returned and no new work is queued."""
+        job = Job(url, key)
+        with self._lock:
+            with self._db:
+                # Holding the write lock of the file from the lookup on, so that of concurrent
+                # submits for the same key in several processes only one queues a job
+                self._db.execute("BEGIN IMMEDIATE")
+                row = self._db.execute(_SELECT_JOB + " WHERE key = ? AND finished_at IS NULL",
+                                       (job.key,)).fetchone()
+                if row is not None:
+                    inflight = Job.from_row(row)
+                    if inflight.owner == job.owner or _alive(inflight.owner):
+                        logging.info(f"Attaching request for URL {url} to in-flight job {inflight.id}")
+                        return inflight
+                    self._mark_abandoned(inflight)
+                self._db.execute("INSERT INTO jobs (id, key, url, status, owner, created_at) "
+                                 "VALUES (?, ?, ?, ?, ?, ?)",
+                                 (job.id, job.key, job.url, job.status, job.owner,
+                                  job.created_at.isoformat()))
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    # Leaving the with block rolls the insert back
+                    raise QueueFullError(f"Job queue is full ({self._queue.maxsize} jobs waiting)")
+            self._prune()
+        logging.info(f"Queued job {job.id} for URL: {url}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Look up a job by its id, whichever process runs it"""
+        with self._lock:
+            row = self._db.execute(_SELECT_JOB + " WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = Job.from_row(row)
+        if not job.done and job.owner != os.getpid() and not _alive(job.owner):
+            self._abandon(job)
+        return job
+
+    def wait_for_events(self, job_id: str, since: int, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Return the events of a job after the first `since` ones, waiting up to timeout seconds for one
+
+        Returns right away, possibly with no events, once the job has finished or is gone.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            events = self._events(job_id, since)
+            if events:
+                return events
+            job = self.get(job_id)
+            if job is None or job.done:
+                # Its final event was stored along with its status, and may have been since
+                return self._events(job_id, since)
+            remaining = deadline - time.monotonic() if deadline is not None else self.poll_interval
+            if remaining <= 0:
+                return []
+            # A job run by another process does not notify, hence the polling
+            with self._changed:
+                self._changed.wait(min(self.poll_interval, remaining))
+
+    def _events(self, job_id: str, since: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [json.loads(event) for event, in self._db.execute(
+                "SELECT event FROM job_events WHERE job_id = ? AND id >= ? ORDER BY id", (job_id, since))]
+
+    def _emit(self, job_id: str, stage: str, **data):
+        """Record a progress event and wake up anyone waiting for it"""
+        with self._lock, self._db:
+            # The owner and a process marking the job abandoned may emit at the same time, taking
+            # the write lock before numbering the event keeps them from picking the same id
+            self._db.execute("BEGIN IMMEDIATE")
+            self._insert_event(job_id, stage, **data)
+        self._notify()
+
+    def _insert_event(self, job_id: str, stage: str, **data):
+        (event_id,) = self._db.execute("SELECT count(*) FROM job_events WHERE job_id = ?", (job_id,)).fetchone()
+        self._db.execute("INSERT INTO job_events (job_id, id, event) VALUES (?, ?, ?)",
+                         (job_id, event_id, json.dumps({'id': event_id, 'stage': stage, **data}, default=str)))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _update(self, job: Job):
+        self._db.execute("UPDATE jobs SET status = ?, result = ?, error = ?, started_at = ?, finished_at = ? "
+                         "WHERE id = ?",
+                         (job.status,
+                          json.dumps(job.result, default=str) if job.result is not None else None,
+                          job.error,
+                          job.started_at.isoformat() if job.started_at else None,
+                          job.finished_at.isoformat() if job.finished_at else None,
+                          job.id))
+
+    def _abandon(self, job: Job):
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")
+            self._mark_abandoned(job)
+        self._notify()
+
+    def _mark_abandoned(self, job: Job):
+        job.status = Job.FAILED
+        job.error = "The worker running the job exited"
+        job.finished_at = datetime.utcnow()
+        # Another process may have marked the job already
+        abandoned = self._db.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? "
+                                     "WHERE id = ? AND finished_at IS NULL",
+                                     (job.status, job.error, job.finished_at.isoformat(), job.id)).rowcount
+        if abandoned:
+            logging.warning(f"Job {job.id} was left unfinished by process {job.owner}")
+            self._insert_event(job.id, Job.FAILED, error=job.error)
+
+    def _prune(self):
+        with self._db:
+            self._db.execute("DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs "
+                             "WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                             (self.max_finished_jobs,))
+            self._db.execute("DELETE FROM jobs WHERE id IN (SELECT id FROM jobs "
+                             "WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT -1 OFFSET ?)",
+                             (self.max_finished_jobs,))
+
+    def _work(self):
+        while True:
+            try:
+                job = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job: Job):
+        job.status = Job.RUNNING
+        job.started_at = datetime.utcnow()
+        with self._lock, self._db:
+            self._update(job)
+        try:
+            job.result = self.handler(job.url, lambda stage, **data: self._emit(job.id, stage, **data))
+            job.status = Job.COMPLETED
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = Job.FAILED
+        finally:
+            job.finished_at = datetime.utcnow()
+            # The final event is stored along with the status, so that whoever sees the job
+            # finished also finds its last event
+            with self._lock, self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                self._update(job)
+                if job.status == Job.COMPLETED:
+                    self._insert_event(job.id, Job.COMPLETED, result=job.result)
+                else:
+                    self._insert_event(job.id, Job.FAILED, error=job.error)
+            self._notify()
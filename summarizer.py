@@ -0,0 +1,105 @@
+import logging
+import re
+
+import numpy as np
+from scipy import sparse
+from nltk.tokenize import sent_tokenize
+from nltk.corpus import stopwords
+
+WORD_PATTERN = re.compile(r"\w+(?:'\w+)?")
+
+
+class TextRankSummarizer:
+    """Extractive summarizer ranking sentences with TextRank over TF-IDF vectors.
+
+    Each sentence is tokenized once into a row of a sparse TF-IDF matrix X with unit-length
+    rows, so the cosine similarity matrix is S = X Xᵀ with its diagonal removed. PageRank
+    runs as a power iteration in which every multiplication with S is done as X (Xᵀ v), two
+    sparse products linear in the number of words. The n × n matrix is never built, so long
+    transcripts cost O(words) per iteration rather than O(sentences²).
+
+    :param damping: PageRank damping factor.
+    :param max_iter: Maximum number of power iterations.
+    :param tol: Convergence tolerance, per sentence, on the L1 change of the scores.
+    :param stop_words: Words ignored when comparing sentences, NLTK's list for the language
+       by default.
+    :param sentence_splitter: Function splitting text into sentences, NLTK's sent_tokenize
+       by default.
+    """
+
+    def __init__(self, damping=0.85, max_iter=100, tol=1.0e-6, language='english',
+                 stop_words=None, sentence_splitter=None):
+        self.damping = damping
+        self.max_iter = max_iter
+        self.tol = tol
+        self.stop_words = set(stopwords.words(language) if stop_words is None else stop_words)
+        self.sentence_splitter = sentence_splitter or sent_tokenize
+
+    def tokenize(self, sentence):
+        """Lowercased words of a sentence, without stop words and punctuation"""
+        return [word for word in WORD_PATTERN.findall(sentence.lower()) if word not in self.stop_words]
+
+    def term_matrix(self, sentences):
+        """Sparse TF-IDF matrix of the sentences, one L2-normalized row per sentence"""
+        vocabulary = {}
+        rows, cols = [], []
+        for i, sentence in enumerate(sentences):
+            for word in self.tokenize(sentence):
+                rows.append(i)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+        counts = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                   shape=(len(sentences), len(vocabulary)))
+        counts.sum_duplicates()
+        document_frequency = np.bincount(counts.indices, minlength=len(vocabulary))
+        idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+        tfidf = counts @ sparse.diags(idf)
+        norms = np.sqrt(np.asarray(tfidf.multiply(tfidf).sum(axis=1)).ravel())
+        return sparse.diags(np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)) @ tfidf
+
+    def rank(self, sentences):
+        """PageRank score of every sentence in the cosine similarity graph"""
+        n = len(sentences)
+        if n == 0:
+            return np.zeros(0)
+        X = self.term_matrix(sentences).tocsr()
+        Xt = X.T.tocsr()
+        # Rows are unit length, or all zero for sentences without any words
+        self_similarity = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+
+        def similarity_times(v):
+            return X @ (Xt @ v) - self_similarity * v
+
+        out_weight = similarity_times(np.ones(n))
+        dangling = out_weight <= 1e-12
+        inverse_out_weight = np.divide(1.0, out_weight, out=np.zeros(n), where=~dangling)
+
+        scores = np.full(n, 1.0 / n)
+        for _ in range(self.max_iter):
+            previous = scores
+            scores = (self.damping * (similarity_times(previous * inverse_out_weight)
+                                      + previous[dangling].sum() / n)
+                      + (1.0 - self.damping) / n)
+            if np.abs(scores - previous).sum() < n * self.tol:
+                break
+        else:
+            logging.warning(f"TextRank did not converge in {self.max_iter} iterations")
+        return scores
+
+    def summarize(self, text, num_sentences=5):
+        """Generate summary using TextRank algorithm"""
+        sentences = self.sentence_splitter(text)
+
+        if len(sentences) <= num_sentences:
+            return {
+                'brief': text,
+                'keyPoints': sentences
+            }
+
+        scores = self.rank(sentences)
+        ranked_sentences = [sentences[i] for i in
+                            sorted(range(len(sentences)), key=lambda i: (scores[i], sentences[i]), reverse=True)]
+
+        return {
+            'brief': " ".join(ranked_sentences[:3]),
+            'keyPoints': ranked_sentences[:5]
+        }
@@ -0,0 +1,250 @@
+"""Unit Tests for the API"""
+
+import asyncio
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import httpx
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing api opens the job store and the video cache, keep them out of the working tree
+STORE_DIR = tempfile.mkdtemp()
+os.environ['JOB_STORE_PATH'] = os.path.join(STORE_DIR, "jobs.sqlite3")
+os.environ['VIDEO_CACHE_PATH'] = os.path.join(STORE_DIR, "videos.sqlite3")
+
+import api
+from database.supabase_manager import SupabaseManager
+from job_queue import JobQueue
+
+VIDEOS = [{'id': f"00000000-0000-0000-0000-00000000000{i}", 'url': f"https://youtu.be/{i:011d}",
+           'processed_at': f"2024-01-0{i}T00:00:00+00:00"} for i in range(9, 0, -1)]
+
+
+def cursor_of(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+class SearchStandIn:
+    """Answers search_videos from VIDEOS, newest first, like SupabaseManager"""
+
+    def __init__(self, fail_after=None):
+        self.limits = []
+        self.fail_after = fail_after
+
+    async def search_videos(self, keyword=None, source_type=None, start_date=None, end_date=None,
+                            limit=None, after=None):
+        self.limits.append(limit)
+        if self.fail_after is not None and len(self.limits) > self.fail_after:
+            raise Exception("Connection reset")
+        videos = [video for video in VIDEOS if after is None or (video['processed_at'], video['id']) < after]
+        return videos[:limit]
+
+
+class TestCursor(unittest.TestCase):
+
+    def test_round_trip(self):
+        for video in [VIDEOS[0], {'id': 42, 'processed_at': "2024-01-01T00:00:00.123456"}]:
+            with self.subTest(id=video['id']):
+                self.assertEqual(api.decode_cursor(api.encode_cursor(video)), (video['processed_at'], video['id']))
+
+    def test_invalid(self):
+        cursors = ["!!!", cursor_of({'processed_at': "2024-01-01T00:00:00", 'id': 1}),
+                   cursor_of(["2024-01-01T00:00:00", 1, 2]), cursor_of(["2024-01-01T00:00:00"]),
+                   cursor_of(["yesterday", 1]), cursor_of([20240101, 1]),
+                   cursor_of(["2024-01-01T00:00:00", "1),id.gt.0,or(id.eq.1"]),
+                   cursor_of(["2024-01-01T00:00:00\",id.gt.\"", 1]),
+                   cursor_of(["2024-01-01T00:00:00", True]), cursor_of(["2024-01-01T00:00:00", 1.5])]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor), self.assertRaises(HTTPException) as context:
+                api.decode_cursor(cursor)
+            self.assertEqual(context.exception.status_code, 400)
+
+
+class TestSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.client = TestClient(api.app)
+
+    def search(self, **search):
+        return self.client.post("/api/search", json=search)
+
+    def test_pages(self):
+        standin = SearchStandIn()
+        with mock.patch.object(api, 'db', standin):
+            first = self.search(limit=4).json()
+            second = self.search(limit=4, cursor=first['next_cursor']).json()
+            last = self.search(limit=4, cursor=second['next_cursor']).json()
+            exact = self.search(limit=9).json()
+        self.assertEqual(first['videos'], VIDEOS[:4])
+        self.assertEqual(second['videos'], VIDEOS[4:8])
+        self.assertEqual(last, {'videos': VIDEOS[8:], 'next_cursor': None})
+        # One extra row tells whether there is a next page
+        self.assertEqual(standin.limits, [5, 5, 5, 10])
+        self.assertEqual(exact, {'videos': VIDEOS, 'next_cursor': None})
+
+    def test_invalid_cursor(self):
+        with mock.patch.object(api, 'db', SearchStandIn()):
+            response = self.search(cursor=cursor_of(["2024-01-01T00:00:00", "x)"]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_export(self):
+        with mock.patch.object(api, 'db', SearchStandIn()), mock.patch.object(api, 'SEARCH_MAX_PAGE_SIZE', 4):
+            response = self.client.post("/api/search", json={'cursor': api.encode_cursor(VIDEOS[0])},
+                                        headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual([json.loads(line) for line in response.text.splitlines()], VIDEOS[1:])
+
+    def test_supabase_error(self):
+        def unavailable(request):
+            return httpx.Response(503, json={'message': "Service unavailable"})
+
+        def failing_db():
+            return SupabaseManager("http://standin", "key", transport=httpx.MockTransport(unavailable))
+        with mock.patch.object(api, 'db', failing_db()):
+            page = self.search()
+        with mock.patch.object(api, 'db', failing_db()):
+            export = self.client.post("/api/search", json={}, headers={'Accept': 'application/x-ndjson'})
+        # Neither an empty last page nor an export that looks complete
+        self.assertEqual(page.status_code, 500)
+        lines = [json.loads(line) for line in export.text.splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertIn("503", lines[0]['error'])
+
+    def test_export_error(self):
+        with mock.patch.object(api, 'db', SearchStandIn(fail_after=1)), \
+                mock.patch.object(api, 'SEARCH_MAX_PAGE_SIZE', 4):
+            response = self.client.post("/api/search", json={}, headers={'Accept': 'application/x-ndjson'})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines[:-1], VIDEOS[:4])
+        self.assertEqual(lines[-1], {'error': "Connection reset"})
+
+
+class VideoStandIn:
+    """Knows no video, so that every request is handed to the job queue"""
+
+    async def get_video_data(self, url):
+        return None
+
+
+def summarize(url, progress):
+    progress('download', source_type='youtube')
+    return {'summary': f"Summary of {url}"}
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "jobs.sqlite3")
+        self.client = TestClient(api.app)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def process(self, url):
+        with mock.patch.object(api, 'db', VideoStandIn()):
+            return self.client.post("/api/process", json={'url': url})
+
+    def test_status_and_events_from_another_worker(self):
+        worker = JobQueue(summarize, path=self.path)
+        with mock.patch.object(api, 'jobs', worker):
+            response = self.process("https://youtu.be/abcdefghijk")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        self.assertEqual(response.json()['status'], 'queued')
+        worker.start()
+        worker.shutdown()
+        # Requests for the job may reach any worker
+        with mock.patch.object(api, 'jobs', JobQueue(summarize, path=self.path)):
+            status = self.client.get(f"/api/jobs/{job_id}").json()
+            events = self.client.get(f"/api/jobs/{job_id}/events").text
+            missing = self.client.get(f"/api/jobs/{'0' * 32}")
+        self.assertEqual(status['status'], 'completed')
+        self.assertEqual(status['result'], {'summary': "Summary of https://youtu.be/abcdefghijk"})
+        self.assertEqual([line for line in events.splitlines() if line.startswith("event: ")],
+                         ["event: download", "event: completed"])
+        self.assertEqual(missing.status_code, 404)
+
+    def test_resume_after_final_event(self):
+        worker = JobQueue(summarize, path=self.path)
+        with mock.patch.object(api, 'jobs', worker):
+            job_id = self.process("https://youtu.be/abcdefghijk").json()['job_id']
+            worker.start()
+            worker.shutdown()
+            resumed = self.client.get(f"/api/jobs/{job_id}/events", headers={'Last-Event-ID': "1"})
+            partly = self.client.get(f"/api/jobs/{job_id}/events", headers={'Last-Event-ID': "0"})
+        self.assertEqual(resumed.status_code, 200)
+        self.assertEqual(resumed.text, "")
+        self.assertEqual([line for line in partly.text.splitlines() if line.startswith("event: ")],
+                         ["event: completed"])
+
+    def test_job_pruned_while_streaming(self):
+        worker = JobQueue(summarize, path=self.path)
+        with mock.patch.object(api, 'jobs', worker):
+            job_id = self.process("https://youtu.be/abcdefghijk").json()['job_id']
+            # Gone after the stream has started
+            with mock.patch.object(worker, 'get', side_effect=[worker.get(job_id), None, None]):
+                response = self.client.get(f"/api/jobs/{job_id}/events")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.text, "")
+
+    def test_same_video(self):
+        with mock.patch.object(api, 'jobs', JobQueue(summarize, path=self.path)):
+            first = self.process("https://youtu.be/abcdefghijk").json()
+        with mock.patch.object(api, 'jobs', JobQueue(summarize, path=self.path)):
+            second = self.process("https://www.youtube.com/watch?v=abcdefghijk&t=10s").json()
+        self.assertEqual(second['job_id'], first['job_id'])
+
+    def test_queue_full(self):
+        with mock.patch.object(api, 'jobs', JobQueue(summarize, max_queue_size=1, path=self.path)):
+            self.assertEqual(self.process("https://youtu.be/aaaaaaaaaaa").status_code, 202)
+            response = self.process("https://youtu.be/bbbbbbbbbbb")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], "30")
+
+
+class TestRunOnServerLoop(unittest.TestCase):
+
+    def test_without_loop(self):
+        async def call():
+            return 1
+        with mock.patch.object(api, 'server_loop', None):
+            self.assertRaises(RuntimeError, api.run_on_server_loop, call())
+
+    def test_timeout(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        cancelled = threading.Event()
+
+        async def hang():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        try:
+            with mock.patch.object(api, 'server_loop', loop), mock.patch.object(api, 'DB_CALL_TIMEOUT_SECONDS', 0.1):
+                self.assertRaises(RuntimeError, api.run_on_server_loop, hang())
+            self.assertTrue(cancelled.wait(5))
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+
+def tearDownModule():
+    shutil.rmtree(STORE_DIR, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,356 @@
+"""Unit Tests for DatabaseManager"""
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import unittest
+from contextlib import contextmanager
+from datetime import datetime
+from unittest import mock
+
+import httpx
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager, Summary, Transcript, Video, VideoCache
+from database.supabase_manager import SupabaseManager
+
+TRANSCRIPT = "The quick brown fox jumps over the lazy dog. " * 20
+
+
+class TestDatabaseManagerQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = DatabaseManager("sqlite:///" + os.path.join(self.dir, "videos.db"))
+        self.db.store_video_data("https://www.youtube.com/watch?v=abcdefghijk", "youtube", TRANSCRIPT,
+                                 {'brief': "A fox", 'keyPoints': ["jumps"]},
+                                 {'author': "someone", 'publish_date': datetime(2024, 1, 1), 'likes': 3})
+        self.db.store_video_data("https://youtu.be/bbcdefghijk", "youtube", "Cats and dogs.",
+                                 {'brief': "Pets", 'keyPoints': []})
+        self.statements = []
+        event.listen(self.db.engine, "before_cursor_execute", self._record)
+
+    def tearDown(self):
+        event.remove(self.db.engine, "before_cursor_execute", self._record)
+        self.db.engine.dispose()
+        shutil.rmtree(self.dir)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # pylint:disable=too-many-arguments
+        self.statements.append(statement)
+
+    @contextmanager
+    def assertQueryCount(self, count):
+        self.statements = []
+        yield
+        selects = [statement for statement in self.statements if statement.lstrip().upper().startswith("SELECT")]
+        self.assertEqual(len(selects), count, "\n\n".join(selects))
+
+    def test_get_video_data(self):
+        # A URL that is not an alias yet is found by its media key, after the alias lookup
+        with self.assertQueryCount(2):
+            data = self.db.get_video_data("https://youtu.be/abcdefghijk")
+        self.assertEqual(data['transcript'], TRANSCRIPT)
+        self.assertEqual(data['summary']['brief'], "A fox")
+        self.assertEqual(data['metadata']['author'], "someone")
+        self.assertEqual(data['metadata']['publish_date'], "2024-01-01T00:00:00")
+
+    def test_get_video_data_by_alias(self):
+        with self.assertQueryCount(1):
+            data = self.db.get_video_data("https://www.youtube.com/watch?v=abcdefghijk")
+        self.assertEqual(data['summary']['key_points'], ["jumps"])
+
+    def test_store_video_data_legacy_url(self):
+        # Stored before media ids were recorded
+        with self.db.session_scope() as session:
+            session.add(Video(url="https://youtu.be/cbcdefghijk", source_type="youtube",
+                              processed_at=datetime(2023, 1, 1)))
+        with self.db.session_scope() as session:
+            legacy_id = session.query(Video.id).filter_by(url="https://youtu.be/cbcdefghijk").scalar()
+        self.assertEqual(self.db.store_video_data("https://youtu.be/cbcdefghijk", "youtube", "Again.", {'brief': ""}),
+                         legacy_id)
+        # Now an alias, found with a single query
+        with self.assertQueryCount(1):
+            self.assertEqual(self.db.get_video_data("https://youtu.be/cbcdefghijk")['id'], legacy_id)
+
+    def test_search_videos_without_index(self):
+        self.db.has_search_index = False
+        for keyword in ["fox", None]:
+            with self.subTest(keyword=keyword), self.assertQueryCount(1):
+                results = self.db.search_videos(keyword=keyword)
+            self.assertEqual(results[-1]['transcript_preview'], TRANSCRIPT[:200] + "...")
+            self.assertNotIn("transcripts.content AS", self.statements[-1])
+        self.assertEqual(len(self.db.search_videos()), 2)
+
+    def test_search_videos_with_index(self):
+        with self.assertQueryCount(1):
+            results = self.db.search_videos(keyword="dogs")
+        self.assertEqual([result['url'] for result in results], ["https://youtu.be/bbcdefghijk"])
+        self.assertEqual(results[0]['snippet'], "Cats and <mark>dogs</mark>.")
+
+    def search_urls(self, keyword):
+        return sorted(result['url'] for result in self.db.search_videos(keyword=keyword))
+
+    def test_search_videos_prefix(self):
+        self.assertEqual(self.search_urls("qui"), ["https://www.youtube.com/watch?v=abcdefghijk"])
+        self.assertEqual(self.search_urls("do"), ["https://www.youtube.com/watch?v=abcdefghijk",
+                                                  "https://youtu.be/bbcdefghijk"])
+        self.assertEqual(self.search_urls("pet"), ["https://youtu.be/bbcdefghijk"])
+
+    def test_search_index_follows_changes(self):
+        with self.db.session_scope() as session:
+            session.query(Transcript).filter(Transcript.content == "Cats and dogs.").update({'content': "Birds sing."})
+        self.assertEqual(self.search_urls("cats"), [])
+        self.assertEqual(self.search_urls("birds"), ["https://youtu.be/bbcdefghijk"])
+        with self.db.session_scope() as session:
+            session.query(Summary).filter(Summary.brief == "Pets").delete()
+            session.query(Transcript).filter(Transcript.content == TRANSCRIPT).delete()
+        self.assertEqual(self.search_urls("pets"), [])
+        self.assertEqual(self.search_urls("quick"), [])
+        self.assertEqual(self.search_urls("fox"), ["https://www.youtube.com/watch?v=abcdefghijk"])
+        self.assertEqual(self.search_urls("birds"), ["https://youtu.be/bbcdefghijk"])
+
+    def test_search_without_fts5(self):
+        with mock.patch('database.db_manager._SEARCH_INDEX_DDL',
+                        ["CREATE VIRTUAL TABLE video_search USING missing_fts5(transcript, summary)"]):
+            db = DatabaseManager("sqlite:///" + os.path.join(self.dir, "plain.db"))
+        self.assertFalse(db.has_search_index)
+        db.store_video_data("https://youtu.be/bbcdefghijk", "youtube", "Cats and dogs.", {'brief': "Pets"})
+        self.assertEqual([result['url'] for result in db.search_videos(keyword="dogs")],
+                         ["https://youtu.be/bbcdefghijk"])
+        db.engine.dispose()
+
+    def test_search_videos_after(self):
+        for indexed in [True, False]:
+            self.db.has_search_index = indexed
+            with self.subTest(indexed=indexed):
+                first, = self.db.search_videos(keyword="the", limit=1, newest_first=True)
+                self.assertEqual(first['url'], "https://www.youtube.com/watch?v=abcdefghijk")
+                self.assertEqual(self.db.search_videos(keyword="the", after=(first['processed_at'], first['id'])), [])
+                newest, oldest = self.db.search_videos()
+                self.assertEqual(self.db.search_videos(limit=1, after=(newest['processed_at'], newest['id'])),
+                                 [oldest])
+
+
+class PostgRESTStandIn:
+    """Answers the PostgREST requests of SupabaseManager from memory"""
+
+    def __init__(self):
+        self.videos = []
+        self.aliases = {}
+        self.requests = []
+
+    def find_video(self, url, source_type, media_id):
+        """Like the find_video function in schema.sql"""
+        for video in self.videos:
+            if video['id'] == self.aliases.get(url):
+                return video
+        for video in self.videos:
+            if (video['source_type'], video['media_id']) == (source_type, media_id):
+                return video
+        for video in self.videos:
+            if video['url'] == url:
+                return video
+        return None
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        path = request.url.path
+        if path == "/rest/v1/rpc/store_video":
+            args = json.loads(request.content)
+            video = self.find_video(args['p_url'], args['p_source_type'], args['p_media_id'])
+            if video is None:
+                video = {'id': f"id-{len(self.videos)}", 'url': args['p_url'], 'source_type': args['p_source_type'],
+                         'media_id': args['p_media_id'],
+                         'processed_at': f"2024-01-0{len(self.videos) + 1}T00:00:00",
+                         'transcripts': [{'content': args['p_transcript']}] if args['p_transcript'] else [],
+                         'summaries': [{'brief': args['p_summary']['brief'], 'key_points': []}], 'metadata': []}
+                self.videos.append(video)
+            self.aliases.setdefault(args['p_url'], video['id'])
+            return httpx.Response(200, json=video['id'])
+        if path == "/rest/v1/rpc/find_video":
+            params = request.url.params
+            video = self.find_video(params['p_url'], params['p_source_type'], params['p_media_id'])
+            return httpx.Response(200, json=[video] if video else [])
+        if path == "/rest/v1/videos":
+            rows = self.videos
+            for name, value in request.url.params.multi_items():
+                if value.startswith("eq."):
+                    rows = [row for row in rows if str(row.get(name)) == value[3:]]
+            if "transcript_preview" in request.url.params.get('select', ""):
+                # Like the transcript_preview function in schema.sql
+                rows = [{**row, 'transcript_preview': row['transcripts'][0]['content'][:200] + "..."
+                         if row['transcripts'] else None} for row in rows]
+            return httpx.Response(200, json=sorted(rows, key=lambda row: row['processed_at'], reverse=True))
+        return httpx.Response(404, json={'message': "Not found"})
+
+
+class TestSupabaseManager(unittest.TestCase):
+
+    def setUp(self):
+        self.standin = PostgRESTStandIn()
+        self.db = SupabaseManager("http://standin", "key", transport=httpx.MockTransport(self.standin))
+
+    def tearDown(self):
+        asyncio.run(self.db.close())
+
+    def run_requests(self, coroutine):
+        self.standin.requests = []
+        return asyncio.run(coroutine)
+
+    def test_store_video_data(self):
+        async def store():
+            first = await self.db.store_video_data("https://youtu.be/abcdefghijk", "youtube", TRANSCRIPT,
+                                                   {'brief': "A fox", 'keyPoints': []})
+            again = await self.db.store_video_data("https://www.youtube.com/watch?v=abcdefghijk", "youtube",
+                                                   TRANSCRIPT, {'brief': "A fox", 'keyPoints': []})
+            return first, again
+        first, again = self.run_requests(store())
+        self.assertEqual(first, again)
+        self.assertEqual([request.url.path for request in self.standin.requests], ["/rest/v1/rpc/store_video"] * 2)
+        self.assertEqual(self.standin.requests[0].headers['apikey'], "key")
+        self.assertEqual(self.db.stats()['store_video']['calls'], 2)
+
+    def test_get_video_data(self):
+        async def store_and_get():
+            await self.db.store_video_data("https://youtu.be/abcdefghijk", "youtube", TRANSCRIPT,
+                                           {'brief': "A fox", 'keyPoints': []})
+            self.standin.requests = []
+            return await self.db.get_video_data("https://www.youtube.com/watch?v=abcdefghijk")
+        data = self.run_requests(store_and_get())
+        self.assertEqual(data['transcript'], TRANSCRIPT)
+        self.assertEqual([request.url.path for request in self.standin.requests], ["/rest/v1/rpc/find_video"])
+        self.assertEqual(self.standin.requests[0].url.params['p_media_id'], "abcdefghijk")
+
+    def test_store_video_data_legacy_url(self):
+        self.standin.videos.append({'id': "id-0", 'url': "https://youtu.be/cbcdefghijk", 'source_type': "youtube",
+                                    'media_id': None, 'processed_at': "2024-01-01T00:00:00",
+                                    'transcripts': [], 'summaries': [], 'metadata': []})
+        video_id = self.run_requests(self.db.store_video_data("https://youtu.be/cbcdefghijk", "youtube", "Again.",
+                                                              {'brief': ""}))
+        self.assertEqual(video_id, "id-0")
+        self.assertEqual(len(self.standin.videos), 1)
+        self.assertEqual(self.standin.aliases, {"https://youtu.be/cbcdefghijk": "id-0"})
+
+    def test_get_video_data_by_legacy_url(self):
+        # Stored before media ids were recorded
+        self.standin.videos.append({'id': "id-0", 'url': "https://example.com/talk.mp4", 'source_type': "other",
+                                    'media_id': None, 'processed_at': "2024-01-01T00:00:00",
+                                    'transcripts': [], 'summaries': [], 'metadata': []})
+        data = self.run_requests(self.db.get_video_data("https://example.com/talk.mp4"))
+        self.assertEqual(data['id'], "id-0")
+        self.assertEqual(len(self.standin.requests), 1)
+
+    def test_search_videos_preview(self):
+        async def store_and_search():
+            await self.db.store_video_data("https://youtu.be/abcdefghijk", "youtube", TRANSCRIPT,
+                                           {'brief': "A fox", 'keyPoints': []})
+            self.standin.requests = []
+            return await self.db.search_videos()
+        result, = self.run_requests(store_and_search())
+        self.assertEqual(result['transcript_preview'], TRANSCRIPT[:200] + "...")
+        # The transcripts themselves are not requested
+        self.assertEqual(self.standin.requests[0].url.params['select'],
+                         "id,url,source_type,processed_at,transcript_preview")
+
+    def test_search_videos_error(self):
+        db = SupabaseManager("http://standin", "key",
+                             transport=httpx.MockTransport(lambda request: httpx.Response(503, json={})))
+        with self.assertRaises(httpx.HTTPStatusError):
+            asyncio.run(db.search_videos(keyword="fox"))
+
+    def test_search_videos_after(self):
+        self.run_requests(self.db.search_videos(keyword="fox", limit=2, after=("2024-01-02T00:00:00", "id-1")))
+        params = dict(self.standin.requests[0].url.params.multi_items())
+        self.assertEqual(params['transcripts.content'], "fts.fox")
+        self.assertEqual(params['select'], "id,url,source_type,processed_at,transcript_preview,transcripts!inner()")
+        self.assertEqual(params['order'], "processed_at.desc,id.desc")
+        self.assertEqual(params['limit'], "2")
+        self.assertEqual(params['or'], '(processed_at.lt."2024-01-02T00:00:00",'
+                                       'and(processed_at.eq."2024-01-02T00:00:00",id.lt.id-1))')
+
+
+class TestVideoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.standin = PostgRESTStandIn()
+        self.path = os.path.join(self.dir, "videos.sqlite3")
+        self.cache = VideoCache(max_entries=2, path=self.path)
+        self.db = SupabaseManager("http://standin", "key", transport=httpx.MockTransport(self.standin),
+                                  cache=self.cache)
+
+    def tearDown(self):
+        asyncio.run(self.db.close())
+        shutil.rmtree(self.dir)
+
+    def test_read_through(self):
+        async def lookups():
+            missing = await self.db.get_video_data("https://youtu.be/abcdefghijk")
+            missing_again = await self.db.get_video_data("https://youtu.be/abcdefghijk")
+            requests = len(self.standin.requests)
+            await self.db.store_video_data("https://youtu.be/abcdefghijk", "youtube", TRANSCRIPT,
+                                           {'brief': "A fox", 'keyPoints': []})
+            stored = await self.db.get_video_data("https://www.youtube.com/watch?v=abcdefghijk")
+            stored_again = await self.db.get_video_data("https://youtu.be/abcdefghijk")
+            return missing, missing_again, requests, stored, stored_again
+        missing, missing_again, requests, stored, stored_again = asyncio.run(lookups())
+        self.assertIsNone(missing)
+        self.assertIsNone(missing_again)
+        # For the first lookup only
+        self.assertEqual(requests, 1)
+        self.assertEqual(stored['transcript'], TRANSCRIPT)
+        self.assertEqual(stored_again, stored)
+        self.assertEqual(len(self.standin.requests), 3)
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['negative_hits'], stats['misses']), (1, 1, 2))
+
+    def test_shared_file(self):
+        self.cache.put(VideoCache.key("youtube", "abcdefghijk"), {'id': "id-0"})
+        other = VideoCache(path=self.path)
+        self.assertEqual(other.get(VideoCache.key("youtube", "abcdefghijk")), (True, {'id': "id-0"}))
+        self.assertEqual(other.stats()['disk_hits'], 1)
+        self.cache.invalidate(VideoCache.key("youtube", "abcdefghijk"))
+        self.assertEqual(VideoCache(path=self.path).get(VideoCache.key("youtube", "abcdefghijk")), (False, None))
+
+    def test_invalidate_other_worker(self):
+        other = VideoCache(path=self.path)
+        other.put(VideoCache.key("youtube", "abcdefghijk"), None)
+        self.cache.put(VideoCache.key("youtube", "abcdefghijk"), None)
+        # Stored by this worker, the other one must not keep answering that the video is missing
+        self.cache.invalidate(VideoCache.key("youtube", "abcdefghijk"))
+        self.assertEqual(other.get(VideoCache.key("youtube", "abcdefghijk")), (False, None))
+
+    def test_get_returns_copy(self):
+        self.cache.put("youtube:abcdefghijk", {'summary': {'key_points': ["jumps"]}})
+        _, data = self.cache.get("youtube:abcdefghijk")
+        data['summary']['key_points'].append("changed")
+        self.assertEqual(self.cache.get("youtube:abcdefghijk"), (True, {'summary': {'key_points': ["jumps"]}}))
+
+    def test_max_rows(self):
+        cache = VideoCache(path=self.path, negative_ttl=0, max_rows=3, cleanup_interval=2)
+        cache.put("youtube:missing", None)
+        for media_id in "abcde":
+            cache.put(VideoCache.key("youtube", media_id), {'id': media_id})
+        keys = [key for key, in sqlite3.connect(self.path).execute("SELECT key FROM videos ORDER BY rowid")]
+        self.assertEqual(keys, ["youtube:c", "youtube:d", "youtube:e"])
+
+    def test_negative_ttl(self):
+        cache = VideoCache(negative_ttl=0)
+        cache.put("youtube:abcdefghijk", None)
+        self.assertEqual(cache.get("youtube:abcdefghijk"), (False, None))
+
+    def test_lru(self):
+        for media_id in "abc":
+            self.cache.put(VideoCache.key("youtube", media_id), {'id': media_id})
+        self.assertEqual(self.cache.stats()['entries'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,386 @@
+"""Unit Tests for Instaloader that do not need network access"""
+
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instaloader
+
+
+class MediaServer(ThreadingHTTPServer):
+    """Serves files from memory over keep-alive HTTP/1.1 connections, with support for ranges"""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        super().__init__(('127.0.0.1', 0), MediaRequestHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server_address[1], path)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):  # pylint:disable=redefined-builtin
+        pass
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body, etag = self.server.files[self.path]
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and self.headers.get('If-Range', etag) == etag:
+            start = int(range_header[len('bytes='):].split('-')[0])
+        self.send_response(206 if start else 200)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        if start:
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(body) - 1, len(body)))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+
+class TestMediaSession(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = MediaServer()
+        self.server.files['/a.jpg'] = (b'a' * 1000, '"a"')
+        self.server.files['/b.jpg'] = (b'b' * 1000, '"b"')
+        self.context = instaloader.InstaloaderContext(quiet=True)
+
+    def tearDown(self):
+        self.context.close()
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def test_connection_reuse(self):
+        for name in ['a.jpg', 'b.jpg']:
+            self.context.get_and_write_raw(self.server.url('/' + name), os.path.join(self.dir, name))
+        with open(os.path.join(self.dir, 'b.jpg'), 'rb') as file:
+            self.assertEqual(file.read(), b'b' * 1000)
+        self.assertEqual(self.context.media_session_stats(),
+                         {'requests': 2, 'connections_opened': 1, 'connections_reused': 1})
+
+    def interrupted_download(self, etag):
+        filename = os.path.join(self.dir, 'a.jpg')
+        with open(filename + '.temp', 'wb') as file:
+            file.write(b'a' * 400)
+        with open(filename + '.temp.validator', 'w') as file:
+            file.write(etag)
+        return filename
+
+    def test_resume(self):
+        filename = self.interrupted_download('"a"')
+        stats = self.context.write_raw(self.context.get_raw(self.server.url('/a.jpg')), filename)
+        self.assertEqual(stats.resumed_from, 400)
+        self.assertEqual(self.server.requests[-1][1]['Range'], 'bytes=400-')
+        self.assertEqual(self.server.requests[-1][1]['If-Range'], '"a"')
+        with open(filename, 'rb') as file:
+            self.assertEqual(file.read(), b'a' * 1000)
+        self.assertFalse(os.path.exists(filename + '.temp.validator'))
+
+    def test_resume_changed(self):
+        filename = self.interrupted_download('"a"')
+        # The file changed on the server since the interrupted download
+        self.server.files['/a.jpg'] = (b'c' * 1000, '"c"')
+        stats = self.context.write_raw(self.context.get_raw(self.server.url('/a.jpg')), filename)
+        self.assertEqual(stats.resumed_from, 0)
+        self.assertEqual(self.server.requests[-1][1]['If-Range'], '"a"')
+        with open(filename, 'rb') as file:
+            self.assertEqual(file.read(), b'c' * 1000)
+
+    def test_resume_without_validator(self):
+        filename = self.interrupted_download('"a"')
+        os.remove(filename + '.temp.validator')
+        stats = self.context.write_raw(self.context.get_raw(self.server.url('/a.jpg')), filename)
+        self.assertEqual(stats.resumed_from, 0)
+        self.assertEqual(len(self.server.requests), 1)
+        with open(filename, 'rb') as file:
+            self.assertEqual(file.read(), b'a' * 1000)
+
+
+class TestDownloadManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.server = MediaServer()
+        self.server.files['/a.jpg'] = (b'a' * 1000, '"a"')
+        self.L = instaloader.Instaloader(quiet=True, manifest=True)
+
+    def tearDown(self):
+        self.L.close()
+        self.server.stop()
+        shutil.rmtree(self.dir)
+
+    def manifest(self):
+        with open(os.path.join(self.dir, instaloader.DownloadManifest.FILENAME), encoding='utf-8') as file:
+            return file.read()
+
+    def test_skip(self):
+        with open(os.path.join(self.dir, 'a.jpg'), 'wb') as file:
+            file.write(b'a' * 1000)
+        self.assertFalse(self.L.download_pic(os.path.join(self.dir, 'a'), self.server.url('/a.jpg'), datetime.now()))
+        self.assertEqual(self.server.requests, [])
+        # The manifest has been built from the directory when it was first looked at
+        self.assertEqual(self.manifest(), 'a.jpg\n')
+
+    def test_resume(self):
+        with open(os.path.join(self.dir, 'a.jpg.temp'), 'wb') as file:
+            file.write(b'a' * 400)
+        with open(os.path.join(self.dir, 'a.jpg.temp.validator'), 'w') as file:
+            file.write('"a"')
+        self.assertTrue(self.L.download_pic(os.path.join(self.dir, 'a'), self.server.url('/a.jpg'), datetime.now()))
+        self.assertEqual(self.server.requests[-1][1]['Range'], 'bytes=400-')
+        self.assertEqual(self.manifest(), 'a.jpg\n')
+        # A later run finds the file in the manifest
+        self.assertTrue(instaloader.DownloadManifest().isfile(os.path.join(self.dir, 'a.jpg')))
+
+    def test_corrupt_entry(self):
+        with open(os.path.join(self.dir, instaloader.DownloadManifest.FILENAME), 'w', encoding='utf-8') as file:
+            file.write('b.jpg\na.j')
+        manifest = instaloader.DownloadManifest()
+        self.assertTrue(manifest.isfile(os.path.join(self.dir, 'b.jpg')))
+        self.assertFalse(manifest.isfile(os.path.join(self.dir, 'a.j')))
+        manifest.add(os.path.join(self.dir, 'a.jpg'))
+        self.assertEqual(self.manifest(), 'b.jpg\na.jpg\n')
+
+
+class TestLatestStamps(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.timestamp = datetime(2024, 1, 1).astimezone()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_interrupted_write(self):
+        path = os.path.join(self.dir, 'latest-stamps.ini')
+        stamps = instaloader.LatestStamps(path)
+        stamps.save_profile_id('profile', 1)
+
+        def interrupted_write(file):
+            file.write('[profile')
+            raise KeyboardInterrupt()
+
+        with mock.patch.object(stamps.data, 'write', side_effect=interrupted_write):
+            with self.assertRaises(KeyboardInterrupt):
+                stamps.set_last_post_timestamp('profile', self.timestamp)
+        stamps = instaloader.LatestStamps(path)
+        self.assertEqual(stamps.get_profile_id('profile'), 1)
+        self.assertEqual(stamps.get_last_post_timestamp('profile'), datetime.fromtimestamp(0).astimezone())
+
+    def test_flush_on_close(self):
+        for name, stamps_class in [('latest-stamps.ini', instaloader.LatestStamps),
+                                   ('latest-stamps.sqlite3', instaloader.SQLiteLatestStamps)]:
+            with self.subTest(stamps_class=stamps_class.__name__):
+                path = os.path.join(self.dir, name)
+                stamps = stamps_class(path, flush_interval=3600)
+                stamps.save_profile_id('profile', 1)
+                stamps.set_last_post_timestamp('profile', self.timestamp)
+                self.assertIsNone(stamps_class(path).get_profile_id('profile'))
+                stamps.close()
+                stamps = stamps_class(path)
+                self.assertEqual(stamps.get_profile_id('profile'), 1)
+                self.assertEqual(stamps.get_last_post_timestamp('profile'), self.timestamp)
+                stamps.close()
+
+    def test_flush_on_timer(self):
+        for name, stamps_class in [('latest-stamps.ini', instaloader.LatestStamps),
+                                   ('latest-stamps.sqlite3', instaloader.SQLiteLatestStamps)]:
+            with self.subTest(stamps_class=stamps_class.__name__):
+                path = os.path.join(self.dir, name)
+                stamps = stamps_class(path, flush_interval=0.05)
+                stamps.save_profile_id('profile', 1)
+                deadline = time.monotonic() + 5
+                while stamps_class(path).get_profile_id('profile') is None and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                self.assertEqual(stamps_class(path).get_profile_id('profile'), 1)
+                stamps.close()
+
+    @unittest.skipIf(sys.platform == 'win32', "SIGTERM cannot be handled on Windows")
+    def test_flush_on_sigterm(self):
+        path = os.path.join(self.dir, 'latest-stamps.ini')
+        script = textwrap.dedent("""
+            import signal, sys, time
+            import instaloader
+            from instaloader.__main__ import _terminate
+            signal.signal(signal.SIGTERM, _terminate)
+            stamps = instaloader.LatestStamps(sys.argv[1], flush_interval=3600)
+            try:
+                stamps.save_profile_id('profile', 1)
+                print('ready', flush=True)
+                time.sleep(60)
+            except KeyboardInterrupt:
+                pass
+            finally:
+                stamps.close()
+            """)
+        process = subprocess.Popen([sys.executable, '-c', script, path], stdout=subprocess.PIPE, text=True,
+                                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertEqual(process.stdout.readline().strip(), 'ready')
+        process.terminate()
+        process.communicate(timeout=30)
+        self.assertEqual(instaloader.LatestStamps(path).get_profile_id('profile'), 1)
+
+
+class ListRateController:
+    """Query tracking of RateController before 4.15, which filtered lists of all query timestamps on every query"""
+
+    def __init__(self):
+        self.query_timestamps = {}
+        self.earliest_next_request_time = 0.0
+        self.iphone_earliest_next_request_time = 0.0
+
+    def record(self, query_type, timestamp):
+        self.query_timestamps[query_type].append(timestamp)
+
+    def reqs_in_sliding_window(self, query_type, current_time, window):
+        if query_type is not None:
+            relevant_timestamps = self.query_timestamps[query_type]
+        else:
+            relevant_timestamps = [t for other_type, times in self.query_timestamps.items()
+                                   if other_type not in ['iphone', 'other'] for t in times]
+        return [t for t in relevant_timestamps if t > current_time - window]
+
+    def query_waittime(self, query_type, current_time, untracked_queries=False):
+        count_per_sliding_window = 75 if query_type == 'other' else 200
+        self.query_timestamps[query_type] = [t for t in self.query_timestamps.get(query_type, [])
+                                             if t > current_time - 60 * 60]
+        per_type = self.reqs_in_sliding_window(query_type, current_time, 660)
+        next_request_times = [0.0]
+        if len(per_type) >= count_per_sliding_window:
+            next_request_times.append(min(per_type) + 660 + 6)
+        if query_type not in ['iphone', 'other']:
+            gql_accumulated = self.reqs_in_sliding_window(None, current_time, 600)
+            if len(gql_accumulated) >= 275:
+                next_request_times.append(min(gql_accumulated) + 600)
+        iphone = self.reqs_in_sliding_window(query_type, current_time, 1800)
+        if untracked_queries:
+            if query_type == 'iphone':
+                self.iphone_earliest_next_request_time = min(iphone) + 1800 + 18
+            else:
+                self.earliest_next_request_time = min(per_type) + 660 + 6
+        next_request_times.append(max(self.iphone_earliest_next_request_time, self.earliest_next_request_time))
+        if query_type == 'iphone' and len(iphone) >= 199:
+            next_request_times.append(min(iphone) + 1800 + 18)
+        return max(0.0, max(next_request_times) - current_time)
+
+
+class TestRateController(unittest.TestCase):
+
+    def setUp(self):
+        self.context = instaloader.InstaloaderContext(quiet=True)
+
+    def tearDown(self):
+        self.context.close()
+
+    def test_query_waittime_matches_list_based_controller(self):
+        # pylint:disable=protected-access
+        rng = random.Random(0)
+        controller = instaloader.RateController(self.context)
+        reference = ListRateController()
+        current_time = 1000.0
+        for step in range(6000):
+            # Bursts of queries with pauses in between, over about five hours
+            current_time += rng.choice([0.1, 0.5, 1.0, 2.0, 300.0]) if step % 50 == 0 else rng.uniform(0.0, 2.0)
+            query_type = rng.choice(['iphone', 'other', 'query_hash_a', 'query_hash_b'])
+            untracked = step % 97 == 0 and query_type in reference.query_timestamps and bool(
+                reference.reqs_in_sliding_window(query_type, current_time, 660))
+            with self.subTest(step=step):
+                self.assertAlmostEqual(controller.query_waittime(query_type, current_time, untracked),
+                                       reference.query_waittime(query_type, current_time, untracked))
+            controller._record_query(query_type, current_time)
+            reference.record(query_type, current_time)
+        for windows in controller._query_timestamps.values():
+            for length, window in windows.items():
+                self.assertLessEqual(len(window), sum(t > current_time - length
+                                                      for times in reference.query_timestamps.values() for t in times))
+
+
+class TestSharedRateController(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.ledger = os.path.join(self.dir, 'ratelimit.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_clock_set_back(self):
+        # pylint:disable=protected-access
+        context = instaloader.InstaloaderContext(
+            quiet=True, rate_controller=lambda ctx: instaloader.SharedRateController(ctx, self.ledger))
+        controller = context._rate_controller
+        with mock.patch('time.time', side_effect=[1000.0, 1010.0, 400.0]):
+            for _ in range(3):
+                controller.wait_before_query('other')
+        context.close()
+        with sqlite3.connect(self.ledger) as ledger:
+            self.assertEqual([time for time, in ledger.execute("SELECT time FROM queries ORDER BY id")],
+                             [1000.0, 1010.0, 1010.0])
+        # The ledger has been closed with the context
+        self.assertRaises(sqlite3.ProgrammingError, controller._ledger.execute, "SELECT 1")
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'responses.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_ttl(self):
+        cache = instaloader.ResponseCache(self.path, ttls={'api/v1/users/web_profile_info/': 60.0})
+        self.assertEqual(cache.ttl('8845758582119845'), 24 * 60 * 60)
+        self.assertEqual(cache.ttl('api/v1/media/123/info/'), 24 * 60 * 60)
+        self.assertEqual(cache.ttl('7898261790222653'), 10 * 60)
+        self.assertEqual(cache.ttl('api/v1/users/web_profile_info/'), 60.0)
+        self.assertEqual(cache.ttl('d6f4427fbe92d846298cf93df0b937d3'), 0.0)
+        cache.close()
+
+    def test_evict(self):
+        rng = random.Random(0)
+        response = {'data': [rng.random() for _ in range(100)]}
+        cache = instaloader.ResponseCache(self.path, max_bytes=3000)
+        for key in ['a', 'b', 'a', 'c', 'd']:
+            cache.put('8845758582119845', key, response)
+        # pylint:disable=protected-access
+        total, = cache._db.execute("SELECT total FROM responses_size").fetchone()
+        self.assertEqual(total, cache._db.execute("SELECT SUM(size) FROM responses").fetchone()[0])
+        self.assertLessEqual(total, 3000)
+        self.assertIsNone(cache.get('8845758582119845', 'b'))
+        self.assertEqual(cache.get('8845758582119845', 'd'), response)
+        cache.close()
+        # The running total is picked up again when the cache is reopened
+        cache = instaloader.ResponseCache(self.path, max_bytes=3000)
+        self.assertEqual(cache._db.execute("SELECT total FROM responses_size").fetchone()[0], total)
+        cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
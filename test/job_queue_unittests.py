@@ -0,0 +1,165 @@
+"""Unit Tests for the JobQueue"""
+
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import Job, JobQueue, QueueFullError
+
+
+def summarize(url, progress):
+    progress('download', url=url)
+    progress('summarize')
+    return {'summary': f"Summary of {url}"}
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "jobs.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_shared_between_workers(self):
+        worker = JobQueue(summarize, path=self.path)
+        other_worker = JobQueue(summarize, path=self.path, poll_interval=0.05)
+        job = worker.submit("https://youtu.be/abcdefghijk")
+        self.assertEqual(other_worker.get(job.id).status, Job.QUEUED)
+        worker.start()
+        try:
+            events = []
+            while not events or events[-1]['stage'] not in (Job.COMPLETED, Job.FAILED):
+                events += other_worker.wait_for_events(job.id, len(events), timeout=5)
+        finally:
+            worker.shutdown()
+        self.assertEqual([event['stage'] for event in events], ['download', 'summarize', Job.COMPLETED])
+        self.assertEqual([event['id'] for event in events], [0, 1, 2])
+        self.assertEqual(events[-1]['result'], {'summary': "Summary of https://youtu.be/abcdefghijk"})
+        finished = other_worker.get(job.id)
+        self.assertEqual(finished.status, Job.COMPLETED)
+        self.assertEqual(finished.to_dict()['result'], events[-1]['result'])
+        self.assertIsNone(other_worker.get("0" * 32))
+
+    def test_queue_full(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def block(url, progress):
+            started.set()
+            release.wait()
+            return {}
+        jobs = JobQueue(block, num_workers=1, max_queue_size=1, path=self.path, poll_interval=0.05)
+        jobs.start()
+        try:
+            running = jobs.submit("https://youtu.be/aaaaaaaaaaa")
+            self.assertTrue(started.wait(5))
+            jobs.submit("https://youtu.be/bbbbbbbbbbb")
+            self.assertRaises(QueueFullError, jobs.submit, "https://youtu.be/ccccccccccc")
+            # Shutting down must not wait for room in the queue
+            jobs.shutdown(wait=False)
+        finally:
+            release.set()
+        self.assertEqual([event['stage'] for event in jobs.wait_for_events(running.id, 0, timeout=5)],
+                         [Job.COMPLETED])
+        with sqlite3.connect(self.path) as db:
+            self.assertEqual(db.execute("SELECT count(*) FROM jobs").fetchone(), (2,))
+
+    def test_shutdown_runs_queued_jobs(self):
+        jobs = JobQueue(summarize, num_workers=1, path=self.path, poll_interval=0.05)
+        submitted = [jobs.submit(f"https://youtu.be/{i:011d}") for i in range(3)]
+        jobs.start()
+        jobs.shutdown()
+        self.assertEqual([jobs.get(job.id).status for job in submitted], [Job.COMPLETED] * 3)
+
+    def test_worker_exited(self):
+        jobs = JobQueue(summarize, path=self.path, poll_interval=0.05)
+        job = jobs.submit("https://youtu.be/abcdefghijk")
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        with sqlite3.connect(self.path) as db:
+            db.execute("UPDATE jobs SET owner = ? WHERE id = ?", (exited.pid, job.id))
+        other_worker = JobQueue(summarize, path=self.path, poll_interval=0.05)
+        events = other_worker.wait_for_events(job.id, 0, timeout=5)
+        self.assertEqual([event['stage'] for event in events], [Job.FAILED])
+        self.assertEqual(other_worker.get(job.id).status, Job.FAILED)
+
+    def test_emit_from_several_processes(self):
+        job = JobQueue(summarize, path=self.path).submit("https://youtu.be/abcdefghijk")
+        workers = [JobQueue(summarize, path=self.path) for _ in range(4)]
+        barrier = threading.Barrier(len(workers))
+
+        def emit(worker):
+            barrier.wait()
+            for _ in range(20):
+                worker._emit(job.id, 'segment')  # pylint:disable=protected-access
+        threads = [threading.Thread(target=emit, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        events = workers[0].wait_for_events(job.id, 0, timeout=0)
+        self.assertEqual([event['id'] for event in events], list(range(80)))
+
+    def test_same_key(self):
+        worker = JobQueue(summarize, path=self.path)
+        other_worker = JobQueue(summarize, path=self.path)
+        job = worker.submit("https://youtu.be/abcdefghijk", key="youtube:abcdefghijk")
+        attached = other_worker.submit("https://www.youtube.com/watch?v=abcdefghijk", key="youtube:abcdefghijk")
+        self.assertEqual(attached.id, job.id)
+        self.assertNotEqual(other_worker.submit("https://youtu.be/bbcdefghijk").id, job.id)
+        worker.start()
+        worker.shutdown()
+        # A finished job is not joined
+        again = other_worker.submit("https://youtu.be/abcdefghijk", key="youtube:abcdefghijk")
+        self.assertNotEqual(again.id, job.id)
+
+    def test_same_key_concurrently(self):
+        workers = [JobQueue(summarize, path=self.path) for _ in range(4)]
+        barrier = threading.Barrier(len(workers))
+        ids = []
+
+        def submit(worker):
+            barrier.wait()
+            ids.append(worker.submit("https://youtu.be/abcdefghijk").id)
+        threads = [threading.Thread(target=submit, args=(worker,)) for worker in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 1)
+
+    def test_same_key_of_exited_worker(self):
+        jobs = JobQueue(summarize, path=self.path)
+        job = jobs.submit("https://youtu.be/abcdefghijk")
+        exited = subprocess.Popen([sys.executable, "-c", ""])
+        exited.wait()
+        with sqlite3.connect(self.path) as db:
+            db.execute("UPDATE jobs SET owner = ? WHERE id = ?", (exited.pid, job.id))
+        other_worker = JobQueue(summarize, path=self.path)
+        self.assertNotEqual(other_worker.submit("https://youtu.be/abcdefghijk").id, job.id)
+        self.assertEqual(other_worker.get(job.id).status, Job.FAILED)
+        self.assertEqual([event['stage'] for event in other_worker.wait_for_events(job.id, 0, timeout=0)],
+                         [Job.FAILED])
+
+    def test_prune(self):
+        jobs = JobQueue(summarize, num_workers=1, max_finished_jobs=2, path=self.path)
+        jobs.start()
+        submitted = [jobs.submit(f"https://youtu.be/{i:011d}") for i in range(3)]
+        jobs.shutdown()
+        jobs.submit("https://youtu.be/abcdefghijk")
+        self.assertIsNone(jobs.get(submitted[0].id))
+        self.assertEqual([jobs.get(job.id).status for job in submitted[1:]], [Job.COMPLETED] * 2)
+        self.assertEqual(jobs.wait_for_events(submitted[0].id, 0, timeout=0), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Unit Tests for the TextRank summarizer"""
+
+import os
+import re
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summarizer import TextRankSummarizer
+
+try:
+    import networkx as nx
+except ImportError:
+    nx = None
+
+TRANSCRIPT = (
+    "Welcome back to the channel, today we are baking sourdough bread at home. "
+    "Sourdough bread needs a starter, flour, water and salt. "
+    "The starter is a mix of flour and water that ferments for a few days. "
+    "Feed the starter every day with fresh flour and water. "
+    "Once the starter doubles in size, it is ready for baking bread. "
+    "Mix the flour and water first and let the dough rest for an hour. "
+    "Then add the starter and the salt to the dough. "
+    "Fold the dough every thirty minutes to build strength. "
+    "After folding, let the dough rise overnight in the fridge. "
+    "Preheat the oven with a dutch oven inside. "
+    "Bake the bread covered for twenty minutes, then uncovered until it is dark. "
+    "Let the bread cool before cutting it. "
+    "Thanks for watching, and subscribe for more baking videos. "
+    "Ok."
+)
+
+STOP_WORDS = ["the", "a", "and", "for", "it", "is", "to", "of", "with", "we", "are", "at", "in", "then", "an",
+              "that", "every", "first", "after", "until", "before", "once", "back", "more"]
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in re.findall(r"[^.!?]+[.!?]", text)]
+
+
+class TestTextRankSummarizer(unittest.TestCase):
+
+    def setUp(self):
+        self.summarizer = TextRankSummarizer(stop_words=STOP_WORDS, sentence_splitter=split_sentences)
+        self.sentences = split_sentences(TRANSCRIPT)
+
+    @unittest.skipIf(nx is None, "networkx is not installed")
+    def test_matches_networkx_pagerank(self):
+        X = self.summarizer.term_matrix(self.sentences).toarray()
+        similarity = X @ X.T
+        np.fill_diagonal(similarity, 0.0)
+        reference = nx.pagerank(nx.from_numpy_array(similarity))
+        scores = self.summarizer.rank(self.sentences)
+        np.testing.assert_allclose(scores, [reference[i] for i in range(len(self.sentences))], atol=1e-8)
+
+        def ranked(score):
+            return [self.sentences[i] for i in sorted(range(len(self.sentences)),
+                                                       key=lambda i: (score[i], self.sentences[i]), reverse=True)]
+        summary = self.summarizer.summarize(TRANSCRIPT)
+        self.assertEqual(summary['keyPoints'], ranked(reference)[:5])
+        self.assertEqual(summary['brief'], " ".join(ranked(reference)[:3]))
+
+    def test_short_text(self):
+        text = "One sentence. Two sentences."
+        self.assertEqual(self.summarizer.summarize(text), {'brief': text, 'keyPoints': split_sentences(text)})
+
+    def test_sentence_without_words(self):
+        scores = self.summarizer.rank(["The and a.", "Bread and flour.", "Flour and water."])
+        self.assertAlmostEqual(scores.sum(), 1.0)
+        self.assertLess(scores[0], scores[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
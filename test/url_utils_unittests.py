@@ -0,0 +1,56 @@
+"""Unit Tests for url_utils"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from url_utils import media_key
+
+MEDIA_KEYS = [
+    ("https://www.youtube.com/watch?v=abcdefghijk", ('youtube', 'abcdefghijk')),
+    ("https://youtube.com/watch?v=abcdefghijk&t=10s", ('youtube', 'abcdefghijk')),
+    ("https://m.youtube.com/watch?v=abcdefghijk", ('youtube', 'abcdefghijk')),
+    ("https://youtu.be/abcdefghijk", ('youtube', 'abcdefghijk')),
+    ("https://youtu.be/abcdefghijk?si=tracking123", ('youtube', 'abcdefghijk')),
+    ("https://www.youtube.com/shorts/abcdefghijk", ('youtube', 'abcdefghijk')),
+    ("https://youtube.com/shorts/abcdefghijk?feature=share", ('youtube', 'abcdefghijk')),
+    ("https://www.youtube.com/embed/abcdefghijk", ('youtube', 'abcdefghijk')),
+    ("https://www.youtube-nocookie.com/embed/abcdefghijk", ('youtube', 'abcdefghijk')),
+    (" https://www.youtube.com/live/abcdefghijk ", ('youtube', 'abcdefghijk')),
+    ("https://www.instagram.com/reel/C1a2b3c4d5e/", ('instagram', 'C1a2b3c4d5e')),
+    ("https://www.instagram.com/reels/C1a2b3c4d5e/", ('instagram', 'C1a2b3c4d5e')),
+    ("https://www.instagram.com/p/C1a2b3c4d5e/?igsh=MWQ1ZGUxMzBkMA==", ('instagram', 'C1a2b3c4d5e')),
+    ("https://instagram.com/tv/C1a2b3c4d5e", ('instagram', 'C1a2b3c4d5e')),
+    ("https://www.instagram.com/someone/reel/C1a2b3c4d5e/?utm_source=ig_web_copy_link", ('instagram', 'C1a2b3c4d5e')),
+    ("https://m.instagram.com/p/C1a2b3c4d5e", ('instagram', 'C1a2b3c4d5e')),
+    ("https://www.tiktok.com/@someone/video/7234567890123456789?is_from_webapp=1", ('tiktok', '7234567890123456789')),
+    ("https://www.facebook.com/watch/?v=1234567890", ('facebook', '1234567890')),
+    ("https://www.facebook.com/someone/videos/1234567890/", ('facebook', '1234567890')),
+]
+
+# Without an id in the URL, the canonicalized URL is the key
+FALLBACK_KEYS = [
+    ("https://vm.tiktok.com/ZMabcdef/", ('tiktok', 'https://vm.tiktok.com/ZMabcdef')),
+    ("https://Example.com/talk.mp4?utm_source=feed&b=2&a=1", ('generic', 'https://example.com/talk.mp4?a=1&b=2')),
+    ("https://www.youtube.com/watch?v=tooshort", ('youtube', 'https://youtube.com/watch?v=tooshort')),
+    # Lookalikes of the sources' domains are not those sources
+    ("https://notyoutube.com/watch?v=abcdefghijk", ('generic', 'https://notyoutube.com/watch?v=abcdefghijk')),
+    ("https://evilfb.com/videos/1234567890", ('generic', 'https://evilfb.com/videos/1234567890')),
+    ("https://www.faketiktok.com/@someone/video/7234567890123456789",
+     ('generic', 'https://faketiktok.com/@someone/video/7234567890123456789')),
+    ("https://vm.tiktok.com.example.org/ZMabcdef/", ('generic', 'https://vm.tiktok.com.example.org/ZMabcdef')),
+]
+
+
+class TestMediaKey(unittest.TestCase):
+
+    def test_media_key(self):
+        for url, key in MEDIA_KEYS + FALLBACK_KEYS:
+            with self.subTest(url=url):
+                self.assertEqual(media_key(url), key)
+
+
+if __name__ == '__main__':
+    unittest.main()
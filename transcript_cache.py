@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Bump when the fingerprint changes, so that old entries are no longer looked up
+FINGERPRINT_VERSION = 1
+
+
+def audio_fingerprint(audio: np.ndarray, sample_rate: int = 16000, seconds: float = 60.0,
+                      frame_seconds: float = 0.1) -> str:
+    """Fingerprint decoded audio so that re-encoded copies of the same clip match
+
+    Leading silence is skipped and the loudness envelope of the following `seconds` is
+    normalized to its loudest frame and quantized in 6 dB steps, which survives the
+    bitrate, container and gain changes of a repost. The duration in whole seconds is part of
+    the key, so that clips that merely share an intro do not collide.
+    """
+    peak = np.abs(audio).max() if len(audio) else 0.0
+    loud = np.flatnonzero(np.abs(audio) > 0.05 * peak)
+    start = loud[0] if len(loud) else 0
+    duration = int((len(audio) - start) / sample_rate)
+    prefix = audio[start:start + int(seconds * sample_rate)]
+    frame = int(frame_seconds * sample_rate)
+    num_frames = len(prefix) // frame
+    if num_frames:
+        rms = np.sqrt(np.square(prefix[:num_frames * frame].reshape(num_frames, frame)).mean(axis=1))
+        levels = 20 * np.log10(rms / max(rms.max(), 1e-10) + 1e-10)
+        envelope = np.clip(np.round(levels / 6), -10, 0).astype(np.int8)
+    else:
+        envelope = np.zeros(0, np.int8)
+    digest = hashlib.sha256(f"{FINGERPRINT_VERSION}:{duration}:".encode() + envelope.tobytes())
+    return digest.hexdigest()
+
+
+class TranscriptCache:
+    """On-disk cache of pipeline results keyed by audio fingerprint.
+
+    Each entry is one JSON file. Its modification time is bumped on every hit, and the least
+    recently used entries are deleted once the directory grows beyond max_bytes. Writes go
+    through a temporary file and os.replace, so several processes can share the directory.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        logging.info(f"Transcript cache hit for {key}")
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store an entry and evict the least recently used ones if over budget"""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            logging.error(f"Error writing transcript cache entry: {str(e)}")
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
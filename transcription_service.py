@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""Whisper inference in a fixed pool of processes, each holding one preloaded model.
+
+Web workers either run a :class:`TranscriptionExecutor` of their own or, if
+``TRANSCRIBE_SERVICE_ADDRESS`` is set, submit audio to a single shared service started with
+``python transcription_service.py``. With the shared service, one host holds exactly
+``TRANSCRIBE_WORKERS`` models no matter how many web workers are running. The service and its
+clients authenticate each other with ``TRANSCRIBE_SERVICE_AUTHKEY``, which has no default.
+"""
+
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, Optional, Tuple, Union
+
+from config import (WHISPER_MODEL, TRANSCRIBE_WORKERS, TRANSCRIBE_THREADS,
+                    TRANSCRIBE_SERVICE_ADDRESS, TRANSCRIBE_SERVICE_AUTHKEY)
+
+# The model loaded by the initializer of each inference process
+_model = None
+
+
+def _init_worker(model_name: str, num_threads: int):
+    """Pin the inference process to num_threads threads and load its model"""
+    global _model
+    # Must be set before torch is imported to size the OpenMP pool
+    os.environ['OMP_NUM_THREADS'] = str(num_threads)
+    os.environ['MKL_NUM_THREADS'] = str(num_threads)
+    import torch
+    import whisper
+    torch.set_num_threads(num_threads)
+    _model = whisper.load_model(model_name)
+    logging.info(f"Inference process {os.getpid()} loaded Whisper model {model_name} "
+                 f"with {num_threads} threads")
+
+
+def _transcribe(audio, options: Dict[str, Any]) -> Dict[str, Any]:
+    result = _model.transcribe(audio, **options)
+    return {
+        'text': result['text'],
+        'language': result.get('language'),
+        'segments': [{
+            'start': segment['start'],
+            'end': segment['end'],
+            'text': segment['text']
+        } for segment in result['segments']]
+    }
+
+
+class TranscriptionExecutor:
+    """Pool of inference processes, each holding one Whisper model.
+
+    :param model_name: Whisper model loaded by every process.
+    :param num_workers: Number of inference processes, i.e. the number of models in memory.
+    :param threads_per_worker: Torch threads per process. Defaults to an even split of the
+       CPU cores, so that the processes do not oversubscribe the machine.
+    """
+
+    def __init__(self, model_name: str = 'base', num_workers: int = 1,
+                 threads_per_worker: Optional[int] = None):
+        self.model_name = model_name
+        self.num_workers = num_workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // num_workers)
+        # Spawn rather than fork, torch does not survive forking a process that used it
+        self._pool = ProcessPoolExecutor(max_workers=num_workers,
+                                         mp_context=multiprocessing.get_context('spawn'),
+                                         initializer=_init_worker,
+                                         initargs=(model_name, self.threads_per_worker))
+
+    def submit(self, audio, **options) -> Future:
+        """Queue audio (a file path or 16 kHz mono float32 array) for transcription"""
+        return self._pool.submit(_transcribe, audio, options)
+
+    def transcribe(self, audio, **options) -> Dict[str, Any]:
+        """Transcribe audio and wait for the result"""
+        return self.submit(audio, **options).result()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+
+class TranscriptionManager(BaseManager):
+    """Manager exposing a TranscriptionExecutor to other processes on the host"""
+
+
+def _parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """Turn 'host:port' into a TCP address, anything else is a Unix socket path"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _check_authkey(authkey: str):
+    if not authkey:
+        raise ValueError("Set TRANSCRIBE_SERVICE_AUTHKEY to a secret shared by the service and its clients")
+
+
+def serve(address: str = TRANSCRIBE_SERVICE_ADDRESS,
+          authkey: str = TRANSCRIBE_SERVICE_AUTHKEY,
+          model_name: str = WHISPER_MODEL,
+          num_workers: int = TRANSCRIBE_WORKERS,
+          threads_per_worker: Optional[int] = TRANSCRIBE_THREADS or None):
+    """Run the shared transcription service until the process is terminated
+
+    A Unix socket is created in a directory only the user running the service may enter.
+    """
+    _check_authkey(authkey)
+    address = _parse_address(address)
+    if isinstance(address, str):
+        directory = os.path.dirname(os.path.abspath(address))
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        if os.stat(directory).st_mode & 0o077:
+            raise PermissionError(f"Socket directory {directory} is accessible to other users, "
+                                  "use a directory with mode 0700")
+        if os.path.exists(address):
+            # Left behind by a service that did not shut down cleanly
+            os.remove(address)
+    executor = TranscriptionExecutor(model_name, num_workers, threads_per_worker)
+    TranscriptionManager.register('Transcriber', callable=lambda: executor, exposed=('transcribe',))
+    manager = TranscriptionManager(address=address, authkey=authkey.encode())
+    server = manager.get_server()
+    logging.info(f"Transcription service listening on {address} with {num_workers} "
+                 f"inference processes")
+    try:
+        server.serve_forever()
+    finally:
+        executor.shutdown()
+
+
+def connect(address: str = TRANSCRIBE_SERVICE_ADDRESS,
+            authkey: str = TRANSCRIBE_SERVICE_AUTHKEY,
+            timeout: float = 30.0):
+    """Connect to a running transcription service, waiting up to timeout seconds for it
+
+    The returned proxy has the same transcribe() method as TranscriptionExecutor and can be
+    shared between threads.
+    """
+    _check_authkey(authkey)
+    TranscriptionManager.register('Transcriber')
+    manager = TranscriptionManager(address=_parse_address(address), authkey=authkey.encode())
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            manager.connect()
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.5)
+    return manager.Transcriber()
+
+
+def get_transcriber():
+    """Return the shared service if one is configured, otherwise a process-local pool"""
+    if TRANSCRIBE_SERVICE_ADDRESS:
+        logging.info(f"Using transcription service at {TRANSCRIBE_SERVICE_ADDRESS}")
+        return connect()
+    return TranscriptionExecutor(WHISPER_MODEL, TRANSCRIBE_WORKERS, TRANSCRIBE_THREADS or None)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if not TRANSCRIBE_SERVICE_ADDRESS:
+        raise SystemExit("Set TRANSCRIBE_SERVICE_ADDRESS to host:port or a Unix socket path")
+    if not TRANSCRIBE_SERVICE_AUTHKEY:
+        raise SystemExit("Set TRANSCRIBE_SERVICE_AUTHKEY to a secret shared by the service and its clients")
+    serve()
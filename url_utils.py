@@ -0,0 +1,90 @@
+import re
+from collections import namedtuple
+from urllib.parse import urlparse, urlunparse, parse_qs, parse_qsl, urlencode
+
+# Identifies a video independently of the URL it was shared under
+MediaKey = namedtuple('MediaKey', ['source_type', 'media_id'])
+
+# Query parameters that only track where a link was shared from
+TRACKING_PARAMS = {'igsh', 'igshid', 'si', 'feature', 'fbclid', 'gclid', 'ref', 'ref_src', 'is_from_webapp', 'sender_device'}
+
+YOUTUBE_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_PATH = re.compile(r'^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})')
+INSTAGRAM_PATH = re.compile(r'^/(?:[A-Za-z0-9._]+/)?(?:p|reel|reels|tv)/([A-Za-z0-9_-]+)')
+TIKTOK_PATH = re.compile(r'/video/(\d+)')
+FACEBOOK_PATH = re.compile(r'/(?:videos|reel|watch/live)/(?:[^/]+/)?(\d+)')
+
+
+def _host(url):
+    netloc = urlparse(url.strip()).netloc.lower().split(':')[0]
+    for prefix in ('www.', 'm.', 'mobile.'):
+        if netloc.startswith(prefix):
+            return netloc[len(prefix):]
+    return netloc
+
+
+SOURCE_DOMAINS = [
+    ('youtube', ('youtube.com', 'youtu.be', 'youtube-nocookie.com')),
+    ('instagram', ('instagram.com',)),
+    ('facebook', ('facebook.com', 'fb.com', 'fb.watch')),
+    ('tiktok', ('tiktok.com',)),
+]
+
+
+def get_source_type(url):
+    """Determine the source type from URL"""
+    domain = _host(url)
+    for source_type, domains in SOURCE_DOMAINS:
+        # The domain itself or a subdomain of it, not a lookalike such as notyoutube.com
+        if any(domain == d or domain.endswith('.' + d) for d in domains):
+            return source_type
+    return 'generic'
+
+
+def canonicalize_url(url):
+    """Normalize a URL so that links to the same page compare equal"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower() or 'https'
+    netloc = _host(url)
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query)
+                   if k.lower() not in TRACKING_PARAMS and not k.lower().startswith('utm_'))
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse((scheme, netloc, path, '', urlencode(query), ''))
+
+
+def _media_id(source_type, url):
+    parsed = urlparse(url.strip())
+    path = parsed.path
+    if source_type == 'youtube':
+        if _host(url) == 'youtu.be':
+            candidate = path.strip('/').split('/')[0]
+            return candidate if YOUTUBE_ID.match(candidate) else None
+        candidate = parse_qs(parsed.query).get('v', [''])[0]
+        if YOUTUBE_ID.match(candidate):
+            return candidate
+        match = YOUTUBE_PATH.match(path)
+        return match.group(1) if match else None
+    if source_type == 'instagram':
+        match = INSTAGRAM_PATH.match(path)
+        return match.group(1) if match else None
+    if source_type == 'tiktok':
+        match = TIKTOK_PATH.search(path)
+        return match.group(1) if match else None
+    if source_type == 'facebook':
+        candidate = parse_qs(parsed.query).get('v', [''])[0]
+        if candidate.isdigit():
+            return candidate
+        match = FACEBOOK_PATH.search(path)
+        return match.group(1) if match else None
+    return None
+
+
+def media_key(url):
+    """Return the (source_type, media_id) key identifying the video behind a URL
+
+    Known platforms yield their own video id, e.g. youtu.be/X, youtube.com/watch?v=X&t=10 and
+    youtube.com/shorts/X all give ('youtube', 'X'). URLs whose id cannot be extracted, such as
+    short links that need a redirect to be resolved, fall back to their canonicalized form.
+    """
+    source_type = get_source_type(url)
+    return MediaKey(source_type, _media_id(source_type, url) or canonicalize_url(url))
@@ -2,43 +2,100 @@ import os
 import subprocess
 from pathlib import Path
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import yt_dlp
-import whisper
 import nltk
-from nltk.tokenize import sent_tokenize
-from nltk.corpus import stopwords
 import numpy as np
-import networkx as nx
-from urllib.parse import urlparse
 import json
 from instagram_handler import InstagramHandler
+from url_utils import get_source_type
+from summarizer import TextRankSummarizer
+from transcription_service import get_transcriber
+from transcript_cache import TranscriptCache, audio_fingerprint
+from config import (TRANSCRIBE_CHUNK_SECONDS, TRANSCRIBE_PARALLEL_CHUNKS, AUDIO_ONLY,
+                    TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_BYTES)
 
 # Download required NLTK data
 nltk.download('punkt', quiet=True)
 nltk.download('stopwords', quiet=True)
 
+# Whisper works on 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+def load_audio(path, sample_rate=SAMPLE_RATE):
+    """Decode a media file to mono float32 PCM with ffmpeg"""
+    cmd = ['ffmpeg', '-nostdin', '-threads', '0', '-i', str(path),
+           '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-']
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode(errors='replace')}") from e
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+def split_on_silence(audio, chunk_samples, search_samples=5 * SAMPLE_RATE, frame_samples=SAMPLE_RATE // 50):
+    """Split audio into (start, end) sample ranges of at most chunk_samples each
+
+    Every cut is placed in the quietest frame of the search_samples before the chunk limit,
+    so that chunk boundaries fall between words rather than in the middle of one.
+    """
+    bounds = [0]
+    while len(audio) - bounds[-1] > chunk_samples:
+        limit = bounds[-1] + chunk_samples
+        lo = max(bounds[-1] + chunk_samples // 2, limit - search_samples)
+        num_frames = (limit - lo) // frame_samples
+        if num_frames == 0:
+            bounds.append(limit)
+            continue
+        frames = audio[lo:lo + num_frames * frame_samples].reshape(num_frames, frame_samples)
+        quietest = int(np.argmin(np.square(frames).mean(axis=1)))
+        bounds.append(lo + quietest * frame_samples + frame_samples // 2)
+    bounds.append(len(audio))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _ignore_progress(stage, **data):
+    pass
+
+class _DownloadProgressHook:
+    """yt-dlp progress hook forwarding download progress, at most once per percent"""
+
+    def __init__(self, progress):
+        self.progress = progress
+        self.last_reported = None
+
+    def __call__(self, d):
+        if d.get('status') != 'downloading':
+            return
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        # Report every percent if the size is known, every MiB otherwise
+        step = (downloaded * 100 // total) if total else (downloaded >> 20)
+        if step != self.last_reported:
+            self.last_reported = step
+            self.progress('download', downloaded_bytes=downloaded, total_bytes=total)
+
 class VideoProcessor:
-    def __init__(self, output_dir='downloads'):
+    def __init__(self, output_dir='downloads', transcriber=None,
+                 chunk_seconds=TRANSCRIBE_CHUNK_SECONDS, parallelism=TRANSCRIBE_PARALLEL_CHUNKS,
+                 audio_only=AUDIO_ONLY, cache_dir=TRANSCRIPT_CACHE_DIR):
         self.output_dir = output_dir
+        self.audio_only = audio_only
+        # Reposts of the same clip under other URLs are served from here
+        self.cache = TranscriptCache(cache_dir, TRANSCRIPT_CACHE_MAX_BYTES) if cache_dir else None
         Path(output_dir).mkdir(parents=True, exist_ok=True)
-        self.model = whisper.load_model("base")
+        # Whisper runs in dedicated inference processes, see transcription_service
+        self.transcriber = transcriber or get_transcriber()
+        self.chunk_seconds = chunk_seconds
+        self.parallelism = parallelism
+        self.summarizer = TextRankSummarizer()
         self.instagram = InstagramHandler()
         
     def get_source_type(self, url):
         """Determine the source type from URL"""
-        domain = urlparse(url).netloc.lower()
-        if 'youtube.com' in domain or 'youtu.be' in domain:
-            return 'youtube'
-        elif 'instagram.com' in domain:
-            return 'instagram'
-        elif 'facebook.com' in domain or 'fb.com' in domain:
-            return 'facebook'
-        elif 'tiktok.com' in domain:
-            return 'tiktok'
-        return 'generic'
-
-    def download_video(self, url):
+        return get_source_type(url)
+
+    def download_video(self, url, progress=None):
         """Download video from various platforms"""
+        progress = progress or _ignore_progress
         source_type = self.get_source_type(url)
         logging.info(f"Downloading video from {source_type}")
         
@@ -51,12 +108,15 @@ class VideoProcessor:
         
         # For other platforms, use yt-dlp
         ydl_opts = {
-            'format': 'best',
+            'format': 'bestaudio/best' if self.audio_only else 'best',
+            # Only the audio is transcribed, so prefer the smallest stream that has it
+            'format_sort': ['+size', '+br'] if self.audio_only else [],
             'outtmpl': f'{self.output_dir}/%(title)s.%(ext)s',
             'quiet': False,
             'no_warnings': False,
             'extract_flat': False,
-            'verbose': True
+            'verbose': True,
+            'progress_hooks': [_DownloadProgressHook(progress)]
         }
         
         try:
@@ -69,71 +129,79 @@ class VideoProcessor:
             logging.error(f"Error downloading video: {str(e)}")
             raise
 
-    def transcribe_video(self, video_path):
-        """Transcribe video using OpenAI's Whisper"""
+    def transcribe_video(self, video_path, on_segment=None, chunk_seconds=None, parallelism=None):
+        """Transcribe video using OpenAI's Whisper
+
+        video_path may also be audio already decoded with load_audio. The audio is cut at its
+        quietest points into chunks of at most chunk_seconds, which are transcribed on up to
+        parallelism inference processes at once and stitched back together in order. With a
+        parallelism of 1, each chunk is instead prompted with the end of the text before it.
+        A chunk_seconds of 0 transcribes the whole file in a single pass.
+
+        If on_segment is given, it is called with each segment (with timestamps relative to
+        the whole video) as soon as the chunks up to it are done, so callers can show partial
+        transcripts.
+        """
+        chunk_seconds = self.chunk_seconds if chunk_seconds is None else chunk_seconds
+        parallelism = parallelism or self.parallelism
         try:
-            logging.info(f"Transcribing video: {video_path}")
-            result = self.model.transcribe(video_path)
-            return result["text"]
+            if isinstance(video_path, np.ndarray):
+                audio = video_path
+                logging.info(f"Transcribing {len(audio) / SAMPLE_RATE:.0f}s of audio")
+            else:
+                logging.info(f"Transcribing video: {video_path}")
+                audio = load_audio(video_path)
+            
+            if not chunk_seconds:
+                result = self.transcriber.transcribe(audio)
+                for segment in result["segments"]:
+                    if on_segment:
+                        on_segment(segment)
+                return result["text"]
+            
+            chunks = split_on_silence(audio, int(chunk_seconds * SAMPLE_RATE))
+            logging.info(f"Transcribing {len(chunks)} chunks, {parallelism} at a time")
+            texts = []
+            for start, result in self._transcribe_chunks(audio, chunks, parallelism, texts):
+                offset = start / SAMPLE_RATE
+                for segment in result["segments"]:
+                    if on_segment:
+                        on_segment({
+                            'start': offset + segment['start'],
+                            'end': offset + segment['end'],
+                            'text': segment['text']
+                        })
+                texts.append(result["text"].strip())
+            return " ".join(text for text in texts if text)
         except Exception as e:
             logging.error(f"Error transcribing video: {str(e)}")
             raise
 
+    def _transcribe_chunks(self, audio, chunks, parallelism, texts):
+        """Yield (start, result) for each chunk, in order"""
+        if parallelism <= 1:
+            for start, end in chunks:
+                # Carry the end of the previous chunk over so wording stays consistent
+                prompt = " ".join(texts)[-200:] or None
+                yield start, self.transcriber.transcribe(audio[start:end], initial_prompt=prompt)
+            return
+        
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            results = pool.map(lambda chunk: self.transcriber.transcribe(audio[chunk[0]:chunk[1]]),
+                               chunks)
+            yield from zip((start for start, _ in chunks), results)
+
     def summarize_text(self, text, num_sentences=5):
         """Generate summary using TextRank algorithm"""
         logging.info("Generating summary...")
-        sentences = sent_tokenize(text)
-        
-        if len(sentences) <= num_sentences:
-            return {
-                'brief': text,
-                'keyPoints': sentences
-            }
-            
-        # Create similarity matrix
-        stop_words = set(stopwords.words('english'))
-        
-        def sentence_similarity(sent1, sent2):
-            words1 = [word.lower() for word in nltk.word_tokenize(sent1) 
-                     if word.lower() not in stop_words]
-            words2 = [word.lower() for word in nltk.word_tokenize(sent2) 
-                     if word.lower() not in stop_words]
-            
-            all_words = list(set(words1 + words2))
-            vector1 = [1 if word in words1 else 0 for word in all_words]
-            vector2 = [1 if word in words2 else 0 for word in all_words]
-            
-            if not any(vector1) or not any(vector2):
-                return 0.0
-            
-            return np.dot(vector1, vector2) / (np.linalg.norm(vector1) * np.linalg.norm(vector2))
-        
-        # Create similarity matrix
-        similarity_matrix = np.zeros((len(sentences), len(sentences)))
-        for i in range(len(sentences)):
-            for j in range(len(sentences)):
-                if i != j:
-                    similarity_matrix[i][j] = sentence_similarity(sentences[i], sentences[j])
-        
-        # Use NetworkX to rank sentences
-        nx_graph = nx.from_numpy_array(similarity_matrix)
-        scores = nx.pagerank(nx_graph)
-        
-        # Get ranked sentences
-        ranked_sentences = sorted(((scores[i], s) for i, s in enumerate(sentences)), 
-                                reverse=True)
-        
-        # Generate different length summaries
-        brief_summary = " ".join([s[1] for s in ranked_sentences[:3]])
-        key_points = [s[1] for s in ranked_sentences[:5]]
-        
-        return {
-            'brief': brief_summary,
-            'keyPoints': key_points
-        }
+        return self.summarizer.summarize(text, num_sentences)
+
+    def process_video(self, url, cleanup=True, progress=None):
+        """Main pipeline to process video
 
-    def process_video(self, url, cleanup=True):
-        """Main pipeline to process video"""
+        progress, if given, is called as progress(stage, **data) while the pipeline runs.
+        """
+        progress = progress or _ignore_progress
         video_path = None
         results = {
             'source_type': None,
@@ -147,21 +215,40 @@ class VideoProcessor:
             logging.info(f"Processing {results['source_type']} video: {url}")
             
             # Download video
-            video_path = self.download_video(url)
+            progress('download', source_type=results['source_type'])
+            video_path = self.download_video(url, progress=progress)
             if not video_path:
                 raise Exception("Failed to download video")
             
             logging.info(f"Successfully downloaded video to: {video_path}")
             
+            # Decode the audio track once, Whisper gets the PCM samples directly
+            audio = load_audio(video_path)
+            
+            fingerprint = audio_fingerprint(audio, SAMPLE_RATE)
+            cached = self.cache.get(fingerprint) if self.cache else None
+            if cached:
+                results['transcript'] = cached['transcript']
+                results['summary'] = cached['summary']
+                progress('summary', summary=cached['summary'])
+                return results
+            
             # Transcribe video
-            transcript = self.transcribe_video(video_path)
+            progress('transcribe')
+            transcript = self.transcribe_video(
+                audio, on_segment=lambda segment: progress('segment', **segment))
             if not transcript:
                 raise Exception("Failed to transcribe video")
             results['transcript'] = transcript
             
             # Generate summary
+            progress('summarize')
             summary = self.summarize_text(transcript)
             results['summary'] = summary
+            progress('summary', summary=summary)
+            
+            if self.cache:
+                self.cache.put(fingerprint, {'transcript': transcript, 'summary': summary})
             
             return results
             